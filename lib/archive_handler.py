@@ -1,13 +1,22 @@
+import hashlib
+import json
 import logging
 import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from datetime import datetime
 
+from lib.audio_file_handler import save_call_data
 from lib.remote_storage_handler import get_archive_class
 
 module_logger = logging.getLogger('rtl_watcher.archive')
 
 
-def archive_files(archive_config, source_path, mp3_file_name, call_data, system_short_name):
+def archive_files(archive_config, mp3_file_path, m4a_file_path, json_file_path, call_data, system_short_name,
+                  artifacts=None):
     mp3_url_path = None
     m4a_url_path = None
     json_url_path = None
@@ -34,37 +43,296 @@ def archive_files(archive_config, source_path, mp3_file_name, call_data, system_
     # Create folder structure using current date
     folder_path = os.path.join(archive_config.get("archive_path"), generated_folder_path)
 
-    m4a_filename = mp3_file_name.replace(".mp3", ".m4a")
-    json_filename = mp3_file_name.replace(".mp3", ".json")
+    # Working files may be staged outside the watch directory, so every source path is passed in explicitly.
+    source_wav_path = mp3_file_path
+    destination_wav_path = os.path.join(folder_path, os.path.basename(mp3_file_path))
 
-    source_wav_path = os.path.join(source_path, mp3_file_name)
-    destination_wav_path = os.path.join(folder_path, mp3_file_name)
+    source_m4a_path = m4a_file_path
+    destination_m4a_path = os.path.join(folder_path, os.path.basename(m4a_file_path))
 
-    source_m4a_path = os.path.join(source_path, m4a_filename)
-    destination_m4a_path = os.path.join(folder_path, m4a_filename)
-
-    source_json_path = os.path.join(source_path, json_filename)
-    destination_json_path = os.path.join(folder_path, json_filename)
+    source_json_path = json_file_path
+    destination_json_path = os.path.join(folder_path, os.path.basename(json_file_path))
 
     module_logger.info(f"Archiving {' '.join(archive_config.get('archive_extensions', []))} files via {archive_config.get('archive_type', '')} to: {folder_path}")
 
-    for extension in archive_config.get('archive_extensions', []):
-        if extension == ".mp3":
-            upload_response = archive_class.upload_file(source_wav_path, destination_wav_path, generated_folder_path)
-            if upload_response:
-                mp3_url_path = upload_response
-        elif extension == ".m4a":
-            upload_response = archive_class.upload_file(source_m4a_path, destination_m4a_path, generated_folder_path)
-            if upload_response:
-                m4a_url_path = upload_response
-        elif extension == ".json":
-            upload_response = archive_class.upload_file(source_json_path, destination_json_path, generated_folder_path)
+    # Queue every file at once so they upload concurrently, batched with other calls where the backend allows.
+    with archive_uploader(archive_config, archive_class) as uploader:
+        upload_futures = {}
+        content_addressed = archive_class.blob_root is not None and archive_class.retention_index is not None
+        if content_addressed:
+            # Audio is stored once by hash and the archived call JSON carries the blob URLs.
+            archived_call_data = dict(call_data)
+            for extension, source_path in ((".mp3", source_wav_path), (".m4a", source_m4a_path)):
+                if extension in archive_config.get('archive_extensions', []) and os.path.isfile(source_path):
+                    blob_url, upload_futures[extension] = archive_blob(uploader, archive_class, source_path,
+                                                                       destination_json_path)
+                    archived_call_data[f"audio_{extension[1:]}_url"] = blob_url
+            save_call_data(source_json_path, archived_call_data)
+
+        for extension in archive_config.get('archive_extensions', []):
+            if content_addressed and extension in (".mp3", ".m4a"):
+                continue
+            if extension == ".mp3":
+                upload_futures[extension] = uploader.submit(source_wav_path, destination_wav_path,
+                                                            generated_folder_path)
+            elif extension == ".m4a":
+                upload_futures[extension] = uploader.submit(source_m4a_path, destination_m4a_path,
+                                                            generated_folder_path)
+            elif extension == ".json":
+                upload_futures[extension] = uploader.submit(source_json_path, destination_json_path,
+                                                            generated_folder_path)
+            else:
+                module_logger.warning("<<Archive>> <<error>> Unknown Archive Extension")
+
+        if content_addressed:
+            release_blobs_on_failure(archive_class, destination_json_path, upload_futures)
+
+        # Uploads still retrying after wait_seconds keep a reference to the call files until they finish.
+        if artifacts is not None:
+            for upload_future in upload_futures.values():
+                artifacts.acquire()
+                upload_future.add_done_callback(lambda f: artifacts.release())
+
+        wait(upload_futures.values(), timeout=archive_config.get("wait_seconds", 30))
+        for extension, upload_future in upload_futures.items():
+            if not upload_future.done():
+                module_logger.warning(
+                    f"<<Archive>> {extension} upload still in progress, continuing without its URL")
+                continue
+            upload_response = upload_future.result()
             if upload_response:
-                json_url_path = upload_response
-        else:
-            module_logger.warning("<<Archive>> <<error>> Unknown Archive Extension")
+                if extension == ".mp3":
+                    mp3_url_path = upload_response
+                elif extension == ".m4a":
+                    m4a_url_path = upload_response
+                elif extension == ".json":
+                    json_url_path = upload_response
 
-    if archive_config.get("archive_days", 0) >= 1:
-        archive_class.clean_files(os.path.join(archive_config.get("archive_path"), system_short_name), archive_config.get("archive_days", 1))
+        if archive_config.get("archive_days", 0) >= 1:
+            uploader.run(archive_class.clean_files,
+                         os.path.join(archive_config.get("archive_path"), system_short_name),
+                         archive_config.get("archive_days", 1))
 
     return mp3_url_path, m4a_url_path, json_url_path
+
+
+def archive_blob(uploader, archive_class, source_file_path, owner_key):
+    """
+    Stores a file under its SHA-256 and references it from owner_key, uploading only if the blob is new.
+
+    Returns the blob URL along with a Future for the upload, which is already resolved when nothing was sent.
+    """
+    digest = hashlib.sha256()
+    with open(source_file_path, 'rb') as source_file:
+        for chunk in iter(lambda: source_file.read(1024 * 1024), b""):
+            digest.update(chunk)
+    file_hash = digest.hexdigest()
+
+    generated_folder_path = os.path.join("blobs", file_hash[:2], file_hash[2:4])
+    blob_key = os.path.join(archive_class.blob_root, file_hash[:2], file_hash[2:4],
+                            file_hash + os.path.splitext(source_file_path)[1])
+    blob_url = archive_class.get_file_url(blob_key, generated_folder_path)
+
+    if archive_class.retention_index.acquire_blob(archive_class.backend_name, archive_class.location, owner_key,
+                                                  blob_key):
+        module_logger.debug(f"<<Archive>> {os.path.basename(source_file_path)} already stored as {blob_key}")
+        upload_future = Future()
+        upload_future.set_result(blob_url)
+        return blob_url, upload_future
+
+    return blob_url, uploader.submit(source_file_path, blob_key, generated_folder_path)
+
+
+def release_blobs_on_failure(archive_class, owner_key, upload_futures):
+    """
+    Drops the blob references held by owner_key if its JSON upload fails, deleting blobs nothing else uses.
+
+    The JSON is the only record of a call in the archive, so without it the references would never expire. The
+    check runs once every upload of the call is done, so a blob still uploading is not deleted first.
+    """
+    remaining = [len(upload_futures)]
+    lock = threading.Lock()
+
+    def upload_done(_):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0] or upload_futures[".json"].result():
+                return
+        module_logger.warning(f"<<Archive>> {owner_key} was not archived, releasing its audio blobs")
+        try:
+            orphaned_keys = archive_class.retention_index.release_blobs(archive_class.backend_name,
+                                                                        archive_class.location, [owner_key])
+            if orphaned_keys:
+                archive_class.delete_objects(orphaned_keys, archive_class.blob_root)
+        except Exception as e:
+            module_logger.error(f"<<Archive>> <<error>> releasing audio blobs of {owner_key}: {e}")
+
+    for upload_future in upload_futures.values():
+        upload_future.add_done_callback(upload_done)
+
+
+class UploadJob:
+    __slots__ = ("source_file_path", "destination_file_path", "destination_generated_path", "future", "attempt")
+
+    def __init__(self, source_file_path, destination_file_path, destination_generated_path):
+        self.source_file_path = source_file_path
+        self.destination_file_path = destination_file_path
+        self.destination_generated_path = destination_generated_path
+        self.future = Future()
+        self.attempt = 1
+
+
+class ArchiveUploader:
+    """
+    Uploads archive files for every call sharing a storage backend.
+
+    Jobs arriving within batch_window_ms of each other are handed to the backend as one batch, so backends with
+    per-session setup such as SCP only pay for it once. Batches run concurrently on upload_workers threads and
+    failed uploads are retried with exponential backoff on a timer rather than sleeping in a worker.
+
+    A retired uploader stops its threads once no call holds it and its last upload, retries included, is done.
+    """
+
+    def __init__(self, archive_class, archive_config):
+        self.archive_class = archive_class
+        self.batch_window = archive_config.get("batch_window_ms", 50) / 1000
+        self.batch_max_size = archive_config.get("batch_max_size", 50)
+        self.retry_attempts = archive_config.get("retry_attempts", 3)
+        self.retry_backoff = archive_config.get("retry_backoff", 2)
+        self.retry_backoff_max = archive_config.get("retry_backoff_max", 60)
+        self.executor = ThreadPoolExecutor(max_workers=archive_config.get("upload_workers", 4),
+                                           thread_name_prefix="archive")
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        # Calls holding the uploader plus uploads and cleanups not yet finished.
+        self.outstanding = 0
+        self.retired = False
+        self.thread = threading.Thread(target=self._dispatch, name="archive-dispatch", daemon=True)
+        self.thread.start()
+
+    def hold(self):
+        with self.lock:
+            self.outstanding += 1
+
+    def release(self):
+        with self.lock:
+            self.outstanding -= 1
+            stop = self.retired and self.outstanding == 0
+        if stop:
+            self.queue.put(None)
+
+    def retire(self):
+        with self.lock:
+            self.retired = True
+            stop = self.outstanding == 0
+        if stop:
+            self.queue.put(None)
+
+    def submit(self, source_file_path, destination_file_path, destination_generated_path):
+        """
+        Queues an upload and returns a Future resolving to the file URL, or None if every attempt failed.
+        """
+        job = UploadJob(source_file_path, destination_file_path, destination_generated_path)
+        self.hold()
+        job.future.add_done_callback(lambda f: self.release())
+        self.queue.put(job)
+        return job.future
+
+    def run(self, function, *args):
+        """
+        Runs function on an upload thread, such as retention cleanup that should not delay the call.
+        """
+        self.hold()
+        future = self.executor.submit(function, *args)
+        future.add_done_callback(lambda f: self.release())
+        return future
+
+    def _dispatch(self):
+        stopping = False
+        while not stopping:
+            job = self.queue.get()
+            if job is None:
+                break
+            batch = [job]
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.batch_max_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    job = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is None:
+                    stopping = True
+                    break
+                batch.append(job)
+            self.executor.submit(self._upload_batch, batch)
+        self.executor.shutdown(wait=False)
+
+    def _upload_batch(self, batch):
+        try:
+            results = self.archive_class.upload_files(
+                [(job.source_file_path, job.destination_file_path, job.destination_generated_path) for job in batch])
+        except Exception as e:
+            module_logger.warning(f"<<Archive>> batch of {len(batch)} uploads failed: {e}")
+            results = [None] * len(batch)
+
+        for job, result in zip(batch, results):
+            if result:
+                job.future.set_result(result)
+            elif job.attempt < self.retry_attempts and os.path.isfile(job.source_file_path):
+                self._retry(job)
+            else:
+                module_logger.error(
+                    f"<<Archive>> <<error>> upload of {job.source_file_path} failed after {job.attempt} attempts")
+                job.future.set_result(None)
+
+    def _retry(self, job):
+        delay = min(self.retry_backoff * 2 ** (job.attempt - 1), self.retry_backoff_max)
+        module_logger.warning(f"<<Archive>> upload attempt {job.attempt} of {job.source_file_path} failed, "
+                              f"retrying in {delay} seconds")
+        job.attempt += 1
+        timer = threading.Timer(delay, self.queue.put, args=(job,))
+        timer.daemon = True
+        timer.start()
+
+
+_archive_uploaders = {}
+_active_archive_keys = None
+_archive_uploaders_lock = threading.Lock()
+
+
+@contextmanager
+def archive_uploader(archive_config, archive_class):
+    """
+    Holds the shared uploader for an archive configuration while a call queues its uploads, creating it on first
+    use.
+
+    A call still running on a configuration replaced by a reload gets an uploader that retires as soon as that call
+    is done with it.
+    """
+    archive_key = json.dumps(archive_config, sort_keys=True)
+    with _archive_uploaders_lock:
+        uploader = _archive_uploaders.get(archive_key)
+        if uploader is None:
+            uploader = _archive_uploaders[archive_key] = ArchiveUploader(archive_class, archive_config)
+        uploader.hold()
+        if _active_archive_keys is not None and archive_key not in _active_archive_keys:
+            _archive_uploaders.pop(archive_key).retire()
+    try:
+        yield uploader
+    finally:
+        uploader.release()
+
+
+def retire_archive_uploaders(archive_configs):
+    """
+    Retires the uploaders of archive configurations no longer in use after a reload. They stop once their uploads
+    finish.
+    """
+    global _active_archive_keys
+    with _archive_uploaders_lock:
+        _active_archive_keys = {json.dumps(archive_config, sort_keys=True) for archive_config in archive_configs}
+        for archive_key in list(_archive_uploaders):
+            if archive_key not in _active_archive_keys:
+                module_logger.info("<<Archive>> retiring the uploader of a replaced archive configuration")
+                _archive_uploaders.pop(archive_key).retire()
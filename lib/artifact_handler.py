@@ -0,0 +1,85 @@
+import logging
+import os
+import threading
+
+from lib.audio_file_handler import audio_file_cleanup
+from lib.staging_handler import release_staged_files
+
+module_logger = logging.getLogger('rtl_watcher.artifacts')
+
+
+class CallArtifacts:
+    """
+    Reference counted set of files belonging to one call.
+
+    The processing worker holds the first reference and every consumer that outlives it (upload threads) acquires
+    its own. The files are finalized exactly once, when the last reference is released: deleted, or moved next to
+    the MP3 when keep_files is set or the call never completed, so failed calls are left for inspection.
+    """
+
+    def __init__(self, mp3_file_path, m4a_file_path, json_file_path, keep_files, on_finalized=None):
+        self.mp3_file_path = mp3_file_path
+        self.m4a_file_path = m4a_file_path
+        self.json_file_path = json_file_path
+        self.keep_files = keep_files
+        self.on_finalized = on_finalized
+        self.lock = threading.Lock()
+        self.references = 1
+        self.completed = False
+        self.finalized = False
+
+    def acquire(self):
+        with self.lock:
+            if self.finalized:
+                raise RuntimeError(f"Call artifacts for {self.mp3_file_path} were already finalized.")
+            self.references += 1
+
+    def release(self):
+        with self.lock:
+            self.references -= 1
+            if self.references > 0 or self.finalized:
+                return
+            self.finalized = True
+
+        self._finalize()
+
+    def run(self, target, *args):
+        """
+        Runs target and releases a reference acquired for it beforehand, whatever the outcome.
+        """
+        try:
+            return target(*args)
+        finally:
+            self.release()
+
+    def start_thread(self, target, *args):
+        """
+        Acquires a reference and starts target in a thread that releases it when done.
+        """
+        self.acquire()
+        thread = threading.Thread(target=self.run, args=(target, *args))
+        try:
+            thread.start()
+        except Exception:
+            self.release()
+            raise
+        return thread
+
+    def _finalize(self):
+        mp3_directory = os.path.dirname(self.mp3_file_path)
+        try:
+            if self.keep_files or not self.completed:
+                staged_file_paths = [file_path for file_path in (self.m4a_file_path, self.json_file_path)
+                                     if os.path.dirname(file_path) != mp3_directory]
+                release_staged_files(staged_file_paths, mp3_directory, os.path.exists(self.mp3_file_path))
+            else:
+                audio_file_cleanup(self.mp3_file_path, self.m4a_file_path, self.json_file_path)
+            module_logger.debug(f"Finalized call artifacts for {self.mp3_file_path}")
+        except Exception as e:
+            module_logger.error(f"<<Unexpected>> <<error>> finalizing call artifacts for {self.mp3_file_path}: {e}")
+
+        if self.on_finalized:
+            try:
+                self.on_finalized(self.mp3_file_path)
+            except Exception as e:
+                module_logger.error(f"<<Unexpected>> <<error>> after finalizing {self.mp3_file_path}: {e}")
@@ -1,6 +1,8 @@
+import calendar
 import json
 import logging
 import os
+import re
 import shutil
 import subprocess
 from datetime import datetime, timezone
@@ -8,9 +10,13 @@ from datetime import datetime, timezone
 from mutagen.mp3 import MP3
 
 from lib.config_handler import load_csv_channels
+from lib.mp3_info_handler import read_mp3_duration
 
 module_logger = logging.getLogger('rtl_watcher.audio_file_handler')
 
+# Recorder file names: short_YYYYMMDD_HHMMSS_frequency.mp3
+CALL_FILE_NAME = re.compile(r"([^_]*)_(\d{4})(\d{2})(\d{2})_(\d{2})(\d{2})(\d{2})_([^_]*)")
+
 
 def save_temporary_json_file(tmp_path, json_file_path):
     try:
@@ -32,7 +38,7 @@ def save_call_data(json_file_path, call_data):
     try:
         # Writing call data to JSON file
         with open(json_file_path, "w") as json_file:
-            json.dump(call_data, json_file, indent=4)
+            json.dump(call_data, json_file, separators=(",", ":"))
         module_logger.debug(f"<<JSON>> file saved <<successfully>> at {json_file_path}")
         return True
     except Exception as e:
@@ -104,6 +110,53 @@ def clean_temp_files(mp3_file_path, m4a_file_path, json_file_path):
         os.remove(json_file_path)
 
 
+def parse_call_file_name_strptime(mp3_file_name):
+    parts = mp3_file_name.split("_")
+    short_name = parts[0]
+
+    # Attempt to parse the date and time
+    date_time_str = parts[1] + parts[2]
+    date_time_format = "%Y%m%d%H%M%S"
+    parsed_date_time = datetime.strptime(date_time_str, date_time_format)
+    epoch_timestamp = int(parsed_date_time.replace(tzinfo=timezone.utc).timestamp())
+
+    # Extract the frequency part correctly
+    frequency = parts[3].replace(".mp3", "")
+    return short_name, epoch_timestamp, frequency
+
+
+def parse_call_file_name(mp3_file_name):
+    """
+    Returns (short_name, epoch_timestamp, frequency) from a recorder file name.
+
+    Well formed names are read with a precompiled pattern and calendar.timegm; anything unusual goes through
+    strptime, which raises ValueError for an invalid date.
+    """
+    match = CALL_FILE_NAME.match(mp3_file_name)
+    if match is None:
+        return parse_call_file_name_strptime(mp3_file_name)
+    year, month, day, hour, minute, second = (int(value) for value in match.group(2, 3, 4, 5, 6, 7))
+    if year < 1 or not 1 <= month <= 12 or not 1 <= day <= calendar.monthrange(year, month)[1] or hour > 23 or \
+            minute > 59 or second > 61:
+        return parse_call_file_name_strptime(mp3_file_name)
+    return match.group(1), calendar.timegm((year, month, day, hour, minute, second)), \
+        match.group(8).replace(".mp3", "")
+
+
+def get_mp3_duration(mp3_file_path):
+    """
+    Returns the duration of an MP3 in seconds from its frame headers, using mutagen for files they do not cover.
+    """
+    try:
+        duration_sec = read_mp3_duration(mp3_file_path)
+    except Exception as e:
+        module_logger.debug(f"<<MP3>> header parse failed for {mp3_file_path}: {e}")
+        duration_sec = None
+    if duration_sec is None:
+        duration_sec = MP3(mp3_file_path).info.length
+    return duration_sec
+
+
 def get_audio_file_info(mp3_file_path):
     TIMEZONE = os.getenv('TIMEZONE', 'UTC')
 
@@ -113,25 +166,14 @@ def get_audio_file_info(mp3_file_path):
 
     try:
         mp3_file_name = os.path.basename(mp3_file_path)
-        parts = mp3_file_name.split("_")
-        if len(parts) < 3:
+        if mp3_file_name.count("_") < 2:
             module_logger.error("Filename format error.")
             return None, None, None, None
 
-        short_name = parts[0]
+        short_name, epoch_timestamp, frequency = parse_call_file_name(mp3_file_name)
 
-        # Attempt to parse the date and time
-        date_time_str = parts[1] + parts[2]
-        date_time_format = "%Y%m%d%H%M%S"
-        parsed_date_time = datetime.strptime(date_time_str, date_time_format)
-        epoch_timestamp = int(parsed_date_time.replace(tzinfo=timezone.utc).timestamp())
-
-        # Extract the frequency part correctly
-        frequency = parts[3].replace(".mp3", "")
-
-        # Attempt to load the MP3 file and get its duration
-        audio = MP3(mp3_file_path)
-        duration_sec = audio.info.length
+        # Read the duration from the MP3 headers
+        duration_sec = get_mp3_duration(mp3_file_path)
 
         return short_name, epoch_timestamp, frequency, duration_sec
     except ValueError as e:
@@ -166,7 +208,7 @@ def get_talkgroup_data(talkgroup_csv_path, frequency):
         return None
 
 
-def create_json(short_name, epoch_timestamp, frequency, duration_sec, talkgroup_data, json_file_path):
+def create_json(short_name, epoch_timestamp, frequency, duration_sec, talkgroup_data):
     # Initialize with default values
     call_data = {
         "freq": 0,
@@ -217,11 +259,6 @@ def create_json(short_name, epoch_timestamp, frequency, duration_sec, talkgroup_
             "signal_system": "",
             "tag": ""
         })
-
-        save_result = save_call_data(json_file_path, call_data)
-        if not save_result:
-            module_logger.error(f"Unexpected error saving <<Call>> <<Metadata>> to {json_file_path}")
-            return None
     except ValueError as ve:
         module_logger.error(f"Value error: {ve}")
         return None
@@ -235,7 +272,7 @@ def create_json(short_name, epoch_timestamp, frequency, duration_sec, talkgroup_
     return call_data
 
 
-def compress_audio(compression_config, input_audio_file_path):
+def compress_audio(compression_config, input_audio_file_path, m4a_file_path=None):
     # Check if the audio input file exists
     if not os.path.isfile(input_audio_file_path):
         module_logger.error(f"Input Audio file does not exist: {input_audio_file_path}")
@@ -247,7 +284,8 @@ def compress_audio(compression_config, input_audio_file_path):
         f'Converting {file_extension} to M4A at {compression_config.get("sample_rate")}@{compression_config.get("bitrate", 96)}')
 
     # Construct the ffmpeg command
-    m4a_file_path = input_audio_file_path.replace('.mp3', '.m4a')
+    if m4a_file_path is None:
+        m4a_file_path = input_audio_file_path.replace('.mp3', '.m4a')
     command = ["ffmpeg", "-y", "-i", input_audio_file_path, "-af", "aresample=resampler=soxr", "-ar",
                f"{compression_config.get('sample_rate', 16000)}", "-c:a", "aac",
                "-ac", "1", "-b:a", f"{compression_config.get('bitrate', 96)}k", m4a_file_path]
@@ -268,10 +306,11 @@ def compress_audio(compression_config, input_audio_file_path):
         return False
 
 
-def audio_file_cleanup(mp3_file_path):
-    # Remove the MP3 and M4A file if they exist
-    for ext in ['.mp3', '.m4a', '.json']:
-        file_path = mp3_file_path if ext == '.mp3' else mp3_file_path.replace('.mp3', ext)
+def audio_file_cleanup(mp3_file_path, m4a_file_path=None, json_file_path=None):
+    # Remove the MP3, M4A and JSON files if they exist. M4A and JSON default to the files next to the MP3.
+    m4a_file_path = m4a_file_path or mp3_file_path.replace('.mp3', '.m4a')
+    json_file_path = json_file_path or mp3_file_path.replace('.mp3', '.json')
+    for file_path in [mp3_file_path, m4a_file_path, json_file_path]:
         if os.path.exists(file_path):
             module_logger.debug(f"Removing file {file_path}")
             os.remove(file_path)
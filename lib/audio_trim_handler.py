@@ -0,0 +1,125 @@
+import logging
+import subprocess
+
+from lib.duplicate_detect_handler import decode_pcm
+
+module_logger = logging.getLogger('rtl_watcher.audio_trim')
+
+# Whisper works on 16 kHz mono, so the trimmed buffer is produced at that rate.
+TRIM_SAMPLE_RATE = 16000
+
+# Silence placed between kept segments so words either side of a cut are not run together.
+SEGMENT_GAP_SECONDS = 0.1
+
+# The trimmed audio is sent as MP3 at the bitrate recorders use for calls, so trimming never grows an upload.
+TRIM_BITRATE = "32k"
+
+
+def tone_regions(tones, cut_pre_tone=0.5, cut_post_tone=0.5):
+    """
+    Returns (start, end) seconds covering every detected tone, widened by cut_pre_tone and cut_post_tone.
+    """
+    regions = []
+    for tone_type in ("two_tone", "long_tone", "hi_low_tone"):
+        for tone in (tones or {}).get(tone_type, []) or []:
+            if not isinstance(tone, dict) or tone.get("start") is None or tone.get("end") is None:
+                continue
+            regions.append((max(0.0, float(tone["start"]) - cut_pre_tone), float(tone["end"]) + cut_post_tone))
+    return regions
+
+
+def speech_mask(samples, sample_rate, vad_parameters):
+    """
+    Marks the samples that belong to speech using frame energy against the call's own noise floor.
+
+    Frames louder than the 10th percentile frame by 20 * threshold dB (and above -50 dBFS) count as speech. Runs
+    of speech shorter than min_speech_duration_ms are dropped, gaps shorter than min_silence_duration_ms are
+    bridged and every run is padded by speech_pad_ms, mirroring the whisper VAD options of the same names.
+    """
+    import numpy as np
+
+    frame_size = max(1, int(vad_parameters.get("window_size_samples", 1024) * sample_rate / 16000))
+    frame_count = len(samples) // frame_size
+    mask = np.zeros(len(samples), dtype=bool)
+    if frame_count == 0:
+        return mask
+
+    frames = samples[:frame_count * frame_size].astype(np.float32).reshape(frame_count, frame_size) / 32768.0
+    frame_db = 10 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+    noise_floor_db = np.percentile(frame_db, 10)
+    speech = (frame_db > noise_floor_db + 20 * vad_parameters.get("threshold", 0.3)) & (frame_db > -50)
+
+    frame_seconds = frame_size / sample_rate
+    min_speech_frames = vad_parameters.get("min_speech_duration_ms", 250) / 1000 / frame_seconds
+    min_silence_frames = vad_parameters.get("min_silence_duration_ms", 400) / 1000 / frame_seconds
+    pad_samples = int(vad_parameters.get("speech_pad_ms", 400) / 1000 * sample_rate)
+
+    # Frame indexes where speech starts and stops, as [start, stop) runs.
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], speech.astype(np.int8), [0]))))
+    runs = []
+    for start, stop in zip(edges[::2], edges[1::2]):
+        if runs and start - runs[-1][1] < min_silence_frames:
+            runs[-1][1] = stop
+        else:
+            runs.append([start, stop])
+
+    for start, stop in runs:
+        if stop - start < min_speech_frames:
+            continue
+        mask[max(0, start * frame_size - pad_samples):min(len(samples), stop * frame_size + pad_samples)] = True
+    return mask
+
+
+def encode_mp3(samples, sample_rate=TRIM_SAMPLE_RATE, bitrate=TRIM_BITRATE):
+    """
+    Encodes mono 16 bit PCM as MP3 using ffmpeg.
+    """
+    command = ["ffmpeg", "-v", "error", "-f", "s16le", "-ar", str(sample_rate), "-ac", "1", "-i", "-",
+               "-c:a", "libmp3lame", "-b:a", bitrate, "-f", "mp3", "-"]
+    result = subprocess.run(command, input=samples.astype("<i2").tobytes(), capture_output=True, check=True)
+    return result.stdout
+
+
+def trim_audio(mp3_file_path, whisper_config, tones=None):
+    """
+    Decodes a call and returns a 16 kHz mono MP3 of just the audio worth transcribing.
+
+    Detected tones are cut when cut_tones is set and silence is removed when vad_filter is set. Returns None when
+    neither is enabled or nothing was cut, so the original file is sent, and an empty bytes object when nothing is
+    left to transcribe.
+    """
+    import numpy as np
+
+    cut_tones = whisper_config.get("cut_tones", False) and tones
+    vad_filter = whisper_config.get("vad_filter", False)
+    if not cut_tones and not vad_filter:
+        return None
+
+    samples = decode_pcm(mp3_file_path, TRIM_SAMPLE_RATE)
+    keep = np.ones(len(samples), dtype=bool)
+
+    if cut_tones:
+        for start, end in tone_regions(tones, whisper_config.get("cut_pre_tone", 0.5),
+                                       whisper_config.get("cut_post_tone", 0.5)):
+            keep[int(start * TRIM_SAMPLE_RATE):int(end * TRIM_SAMPLE_RATE)] = False
+
+    if vad_filter:
+        keep &= speech_mask(samples, TRIM_SAMPLE_RATE, whisper_config.get("vad_parameters", {}) or {})
+
+    if not keep.any():
+        return b""
+    if keep.all():
+        return None
+
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], keep.astype(np.int8), [0]))))
+    gap = np.zeros(int(SEGMENT_GAP_SECONDS * TRIM_SAMPLE_RATE), dtype=np.int16)
+    pieces = []
+    for start, stop in zip(edges[::2], edges[1::2]):
+        if pieces:
+            pieces.append(gap)
+        pieces.append(samples[start:stop])
+    trimmed = np.concatenate(pieces)
+
+    module_logger.debug(f"Trimmed {mp3_file_path} from {len(samples) / TRIM_SAMPLE_RATE:.1f}s to "
+                        f"{len(trimmed) / TRIM_SAMPLE_RATE:.1f}s for transcription")
+    return encode_mp3(trimmed)
@@ -0,0 +1,212 @@
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from datetime import datetime
+
+from lib.sqlite_handler import connect_database
+
+module_logger = logging.getLogger('rtl_watcher.call_index')
+
+CALL_INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS calls (
+    id INTEGER PRIMARY KEY,
+    system TEXT NOT NULL,
+    file_name TEXT NOT NULL,
+    short_name TEXT,
+    talkgroup INTEGER,
+    talkgroup_tag TEXT,
+    frequency INTEGER,
+    start_time INTEGER,
+    call_length REAL,
+    has_tones INTEGER NOT NULL DEFAULT 0,
+    tones TEXT,
+    transcript TEXT,
+    audio_mp3_url TEXT,
+    audio_m4a_url TEXT,
+    call_data TEXT,
+    UNIQUE (system, file_name)
+);
+CREATE INDEX IF NOT EXISTS idx_calls_start_time ON calls (start_time);
+CREATE INDEX IF NOT EXISTS idx_calls_system_start_time ON calls (system, start_time);
+CREATE INDEX IF NOT EXISTS idx_calls_talkgroup_start_time ON calls (talkgroup, start_time);
+CREATE INDEX IF NOT EXISTS idx_calls_frequency_start_time ON calls (frequency, start_time);
+"""
+
+UPSERT_CALL = """
+INSERT INTO calls (system, file_name, short_name, talkgroup, talkgroup_tag, frequency, start_time, call_length,
+                   has_tones, tones, transcript, audio_mp3_url, audio_m4a_url, call_data)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (system, file_name) DO UPDATE SET
+    short_name = excluded.short_name, talkgroup = excluded.talkgroup, talkgroup_tag = excluded.talkgroup_tag,
+    frequency = excluded.frequency, start_time = excluded.start_time, call_length = excluded.call_length,
+    has_tones = excluded.has_tones, tones = excluded.tones, transcript = excluded.transcript,
+    audio_mp3_url = excluded.audio_mp3_url, audio_m4a_url = excluded.audio_m4a_url, call_data = excluded.call_data
+"""
+
+
+def has_tones(tones):
+    return bool(tones) and any(tones.get(tone_type) for tone_type in ("two_tone", "long_tone", "hi_low_tone"))
+
+
+def call_row(system_name, file_name, call_data):
+    tones = call_data.get("tones") or {}
+    return (
+        system_name,
+        file_name,
+        call_data.get("short_name"),
+        call_data.get("talkgroup"),
+        call_data.get("talkgroup_tag"),
+        call_data.get("freq"),
+        call_data.get("start_time"),
+        call_data.get("call_length"),
+        1 if has_tones(tones) else 0,
+        json.dumps(tones, separators=(",", ":")),
+        json.dumps(call_data.get("transcript"), separators=(",", ":")),
+        call_data.get("audio_mp3_url"),
+        call_data.get("audio_m4a_url"),
+        json.dumps(call_data, separators=(",", ":"))
+    )
+
+
+class CallIndex:
+    """
+    Embedded SQLite index of processed calls.
+
+    Calls are queued by the processing workers and written by a single thread in batched transactions.
+    """
+
+    def __init__(self, database_path, batch_size=50, flush_interval=2.0):
+        self.database_path = database_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue()
+        self.connection = connect_database(database_path, CALL_INDEX_SCHEMA)
+        self.thread = threading.Thread(target=self._run, name="call-index", daemon=True)
+        self.thread.start()
+
+    def add_call(self, system_name, mp3_file_path, call_data):
+        self.queue.put(call_row(system_name, os.path.basename(mp3_file_path), call_data))
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._write(batch)
+            for _ in batch:
+                self.queue.task_done()
+
+    def _write(self, batch):
+        try:
+            with self.connection:
+                self.connection.executemany(UPSERT_CALL, batch)
+            module_logger.debug(f"<<Call>> <<Index>> wrote {len(batch)} calls")
+        except Exception as e:
+            module_logger.error(f"<<Call>> <<Index>> failed writing {len(batch)} calls to {self.database_path}: {e}")
+
+    def flush(self, timeout=10):
+        """Waits for queued calls to be written."""
+        deadline = time.monotonic() + timeout
+        while self.queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+
+_call_indexes = {}
+_call_indexes_lock = threading.Lock()
+
+
+def get_call_index(call_index_config):
+    """
+    Returns the process wide CallIndex for a database path, creating it on first use.
+    """
+    database_path = os.path.abspath(call_index_config.get("database_path", "var/calls.db"))
+    with _call_indexes_lock:
+        if database_path not in _call_indexes:
+            _call_indexes[database_path] = CallIndex(database_path, call_index_config.get("batch_size", 50),
+                                                     call_index_config.get("flush_interval", 2.0))
+        return _call_indexes[database_path]
+
+
+def flush_call_indexes():
+    """Writes out queued calls for every open index, used at shutdown."""
+    with _call_indexes_lock:
+        call_indexes = list(_call_indexes.values())
+    for call_index in call_indexes:
+        call_index.flush()
+
+
+def lookup_call_data(connection, system, file_name):
+    """
+    Returns the call_data stored for a call, or None when the call is not indexed.
+    """
+    row = connection.execute("SELECT call_data FROM calls WHERE system = ? AND file_name = ?",
+                             (system, file_name)).fetchone()
+    return json.loads(row[0]) if row and row[0] else None
+
+
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_time(value):
+    """
+    Accepts a relative duration such as 90s, 30m, 1h or 2d, an epoch timestamp, or an ISO date/time.
+    """
+    match = re.fullmatch(r"(\d+)([smhd])", value)
+    if match:
+        return int(time.time()) - int(match.group(1)) * DURATION_UNITS[match.group(2)]
+    if value.isdigit():
+        return int(value)
+    return int(datetime.fromisoformat(value).timestamp())
+
+
+def query_calls(connection, system=None, talkgroup=None, frequency=None, since=None, until=None, tones=False,
+                transcript=None, limit=100):
+    """
+    Returns matching calls newest first as dicts.
+    """
+    clauses = []
+    parameters = []
+    for column, value in (("system", system), ("talkgroup", talkgroup), ("frequency", frequency)):
+        if value is not None:
+            clauses.append(f"{column} = ?")
+            parameters.append(value)
+    if since is not None:
+        clauses.append("start_time >= ?")
+        parameters.append(int(since))
+    if until is not None:
+        clauses.append("start_time <= ?")
+        parameters.append(int(until))
+    if tones:
+        clauses.append("has_tones = 1")
+    if transcript:
+        clauses.append("transcript LIKE ?")
+        parameters.append(f"%{transcript}%")
+
+    sql = ("SELECT system, file_name, talkgroup, talkgroup_tag, frequency, start_time, call_length, has_tones, tones, "
+           "transcript, audio_mp3_url, audio_m4a_url FROM calls")
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY start_time DESC LIMIT ?"
+    parameters.append(limit)
+
+    cursor = connection.execute(sql, parameters)
+    columns = [description[0] for description in cursor.description]
+    calls = []
+    for row in cursor:
+        call = dict(zip(columns, row))
+        call["tones"] = json.loads(call["tones"]) if call["tones"] else {}
+        call["transcript"] = json.loads(call["transcript"]) if call["transcript"] else None
+        calls.append(call)
+    return calls
+
@@ -1,39 +1,161 @@
+import importlib
 import logging
 import os
-import threading
 import time
 
-from lib.archive_handler import archive_files
-from lib.audio_file_handler import create_json, get_audio_file_info, get_talkgroup_data, \
-    audio_file_cleanup, compress_audio, save_call_data
+from lib.archive_handler import archive_files, retire_archive_uploaders
+from lib.artifact_handler import CallArtifacts
+from lib.audio_file_handler import create_json, get_audio_file_info, compress_audio, save_call_data
 from lib.broadcastify_calls_handler import upload_to_broadcastify_calls
-from lib.config_handler import get_talkgroup_config
+from lib.call_index_handler import get_call_index
+from lib.duplicate_detect_handler import find_duplicate_call, settle_duplicate_call
 from lib.icad_alerting_handler import upload_to_icad_alert
 from lib.icad_player_handler import upload_to_icad_player
 from lib.icad_tone_detect_legacy_handler import upload_to_icad_legacy
+from lib.journal_handler import get_call_journal
+from lib.metrics_handler import metrics
 from lib.openmhz_handler import upload_to_openmhz
 from lib.rdio_handler import upload_to_rdio
+from lib.remote_storage_handler import ARCHIVE_BACKEND_MODULES
+from lib.staging_handler import get_staging_directory
 from lib.tone_detect_handler import get_tones
-from lib.transcribe_handler import upload_to_transcribe
+from lib.transcribe_handler import retire_transcribe_dispatchers, submit_to_transcribe
 
 module_logger = logging.getLogger('rtl_watcher.call_processing')
 
 
-def log_time(action_name, start_time):
+def log_time(action_name, start_time, system_name=None):
     end_time = time.time()
     elapsed_time = end_time - start_time
     module_logger.debug(f"{action_name} took {elapsed_time:.2f} seconds")
+    if system_name:
+        metrics.record_stage(system_name, action_name, elapsed_time)
     return end_time
 
 
-def process_call(system_config, mp3_file_path):
-    threads = []
+def get_stage_dependencies(system_config):
+    """
+    Returns the optional third party modules imported by the stages a system has enabled.
+    """
+    module_names = []
+    if system_config.archive is not None:
+        module_names.extend(ARCHIVE_BACKEND_MODULES.get(system_config.archive.get("archive_type"), ()))
+    if system_config.tone_detection is not None:
+        module_names.append("icad_tone_detection")
+    if system_config.duplicate_detection is not None or (
+            system_config.transcribe is not None and system_config.transcribe.get("trim_audio", 0) == 1):
+        module_names.append("numpy")
+    return module_names
+
+
+def preload_stage_dependencies(system_config):
+    """
+    Imports the libraries a system's enabled stages need so its first call does not pay for them.
+    """
     start_time = time.time()
-    module_logger.info(f"Processing File {mp3_file_path}")
+    for module_name in get_stage_dependencies(system_config):
+        try:
+            importlib.import_module(module_name)
+        except ImportError as e:
+            module_logger.error(f"Unable to import {module_name} for system {system_config.name}: {e}")
+    log_time("Preload Stage Dependencies", start_time)
+
+
+def retire_replaced_clients(system_configs):
+    """
+    Retires the shared archive uploaders and transcribe dispatchers that no system uses after a reload, so their
+    threads stop once the calls still holding them finish.
+    """
+    retire_archive_uploaders(system_config.archive for system_config in system_configs.values()
+                             if system_config.archive is not None)
+    retire_transcribe_dispatchers(system_config.transcribe for system_config in system_configs.values()
+                                  if system_config.transcribe is not None)
+
+
+def run_stage(journal_entry, stage_name, target, *args, succeeded=bool):
+    """
+    Runs a side-effecting stage through the call journal when it is enabled, so it is not repeated on resume.
+    """
+    if journal_entry is None:
+        return target(*args)
+    return journal_entry.run(stage_name, target, *args, succeeded=succeeded)
+
+
+def submit_transcription(system_config, route, artifacts, journal_entry, call_data):
+    """
+    Queues a call on its transcribe dispatcher, holding a reference to the call files until it is sent.
+
+    Returns the transcript Future, or None when the journal already has the transcript.
+    """
+    if journal_entry is not None and journal_entry.has_completed("transcribe"):
+        return None
+    artifacts.acquire()
+    try:
+        # A copy, as the worker keeps adding stage results to call_data while the request is built.
+        transcribe_future = submit_to_transcribe(system_config.transcribe, artifacts.mp3_file_path, dict(call_data),
+                                                 route.talkgroup_config)
+    except Exception:
+        artifacts.release()
+        raise
+    transcribe_future.add_done_callback(lambda future: artifacts.release())
+    return transcribe_future
+
+
+def wait_for_transcription(transcribe_future):
+    return transcribe_future.result() if transcribe_future is not None else None
+
+
+def process_call(system_config, mp3_file_path, on_finalized=None):
+    """
+    Processes a call, returning False when it was skipped, in which case on_finalized is never called.
+    """
+    start_time = time.time()
+    completed = False
+
+    journal_entry = None
+    if system_config.journal is not None:
+        journal_entry = get_call_journal(system_config.journal, system_config.name).begin(mp3_file_path)
+        if journal_entry is None:
+            module_logger.debug(f"{mp3_file_path} is already being processed, skipping")
+            return False
 
-    # create path variables for new files
-    m4a_file_path = mp3_file_path.replace(".mp3", ".m4a")
-    json_file_path = mp3_file_path.replace(".mp3", ".json")
+        def on_call_finalized(finalized_mp3_file_path):
+            # The done record goes last so a crash before the claim is released resumes the call instead.
+            try:
+                if on_finalized:
+                    on_finalized(finalized_mp3_file_path)
+            finally:
+                journal_entry.finish()
+    else:
+        on_call_finalized = on_finalized
+
+    # create path variables for new files, staged in temp_file_path when it has room
+    staging_directory = get_staging_directory(system_config.temp_file_path, system_config.name, mp3_file_path,
+                                              system_config.temp_min_free_mb)
+    mp3_file_name = os.path.basename(mp3_file_path)
+    artifacts = CallArtifacts(mp3_file_path,
+                              os.path.join(staging_directory, mp3_file_name.replace(".mp3", ".m4a")),
+                              os.path.join(staging_directory, mp3_file_name.replace(".mp3", ".json")),
+                              system_config.keep_files, on_call_finalized)
+
+    try:
+        completed = _process_call(system_config, artifacts, start_time, journal_entry)
+        artifacts.completed = bool(completed)
+    finally:
+        # Files are finalized here, or by the last upload thread still using them.
+        artifacts.release()
+        if system_config.duplicate_detection is not None:
+            # Only a call that made it through keeps other recorders' copies from being processed.
+            settle_duplicate_call(mp3_file_path, bool(completed))
+        metrics.record_call(system_config.name, time.time() - start_time, completed)
+    return True
+
+
+def _process_call(system_config, artifacts, start_time, journal_entry=None):
+    mp3_file_path = artifacts.mp3_file_path
+    m4a_file_path = artifacts.m4a_file_path
+    json_file_path = artifacts.json_file_path
+    module_logger.info(f"Processing File {mp3_file_path}")
 
     m4a_exists = False
 
@@ -46,38 +168,48 @@ def process_call(system_config, mp3_file_path):
             "<<Error>> while getting system short name, timestamp, frequency or duration from audio file name..")
         return
 
-    # Validate System Configuration
-    module_logger.debug(system_config)
-    if not system_config or len(system_config) < 1:
-        module_logger.error(f"<<Error>> while getting <<system>> <<configuration>> from config.json. Cannot Process")
-        return
-
-    # Get Talkgroup Data from CSV
-    talkgroup_data = get_talkgroup_data(system_config.get("talkgroup_csv_path", ""), frequency)
+    # Get Talkgroup Data from the channels loaded with the system configuration
+    talkgroup_data = system_config.get_channel(frequency)
     if not talkgroup_data:
         module_logger.error("<<Error>> while getting <<talkgroup>> <<data>> from CSV. Cannot Process")
         return
 
-    # Generate Call Metadata and Save to disk from System/Channel/Call Data
-    call_data = create_json(system_short_name, epoch_timestamp, frequency, duration_sec, talkgroup_data, json_file_path)
+    # Generate Call Metadata from System/Channel/Call Data, it is written to disk once tones and transcript are in
+    call_data = create_json(system_short_name, epoch_timestamp, frequency, duration_sec, talkgroup_data)
     if not call_data:
         module_logger.error("<<Error>> while creating <<Call>> <<Metadata>> Cannot Process")
         return
 
-    talkgroup_decimal = call_data.get("talkgroup", 0)
-
-    # Get talkgroup specific config from system configuration or use wild card * talkgroup config
-    talkgroup_config = get_talkgroup_config(system_config.get("talkgroup_config", {}), call_data)
-    if not talkgroup_config:
+    # Get the precomputed stage plan for this talkgroup
+    route = system_config.get_route(call_data.get("talkgroup", 0))
+    if not route.talkgroup_config:
         module_logger.error("<<Talkgroup>> <<configuration>> not in config data. Cannot Process")
         return
 
-    action_start = log_time("Initial audio processing.", action_start)
+    # Drop copies of a transmission already captured by another recorder, once this copy is known to be processable
+    if system_config.duplicate_detection is not None:
+        duplicate_call = find_duplicate_call(system_config.duplicate_detection, system_config.name, mp3_file_path,
+                                             frequency, epoch_timestamp, duration_sec)
+        action_start = log_time("Duplicate Detection", action_start, system_config.name)
+        if duplicate_call is not None:
+            module_logger.info(
+                f"<<Duplicate>> <<call>> {mp3_file_path} matches {duplicate_call.mp3_file_path} from {duplicate_call.system_name}. Dropping")
+            return True
+
+    action_start = log_time("Initial audio processing.", action_start, system_config.name)
+
+    # Transcription runs on the transcribe dispatcher while the other stages carry on. It waits for tone detection
+    # only when the tones have to be cut out first.
+    transcribe_future = None
+    transcribe_needs_tones = system_config.tone_detection is not None and route.tone_detection and \
+        (route.talkgroup_config.get("whisper") or {}).get("cut_tones", False)
+    if system_config.transcribe is not None and route.transcribe and not transcribe_needs_tones:
+        transcribe_future = submit_transcription(system_config, route, artifacts, journal_entry, call_data)
 
     # Convert audio to M4A
-    if system_config.get("audio_compression", {}).get("enabled", 0) == 1:
-        m4a_exists = compress_audio(system_config.get("audio_compression", {}), mp3_file_path)
-        action_start = log_time("MP3 to M4A Convert", action_start)
+    if system_config.audio_compression is not None:
+        m4a_exists = compress_audio(system_config.audio_compression, mp3_file_path, m4a_file_path)
+        action_start = log_time("MP3 to M4A Convert", action_start, system_config.name)
 
     module_logger.debug(f"Timestamp from file - {epoch_timestamp}")
     module_logger.debug(f"Timestamp now - {time.time()}")
@@ -85,94 +217,90 @@ def process_call(system_config, mp3_file_path):
     module_logger.debug(f"Skew Created to Now - {time.time() - epoch_timestamp}")
     module_logger.debug(f"Skew Created Minus Duration - {time.time() - epoch_timestamp + duration_sec}")
 
-    # OpenMHZ upload task
-    openmhz_thread = threading.Thread(target=upload_to_openmhz_task, args=(system_config, m4a_file_path, call_data))
-    threads.append(openmhz_thread)
+    # OpenMHZ upload task, each upload thread holds a reference to the call files until it finishes
+    if route.openmhz:
+        artifacts.start_thread(run_stage, journal_entry, "openmhz", upload_to_openmhz_task, system_config.openmhz,
+                               m4a_file_path, call_data)
 
     # Broadcastify Calls upload task
-    broadcastify_thread = threading.Thread(target=upload_to_broadcastify_calls_task, args=(
-    system_config, m4a_file_path, call_data, epoch_timestamp, duration_sec))
-    threads.append(broadcastify_thread)
+    if route.broadcastify_calls:
+        artifacts.start_thread(run_stage, journal_entry, "broadcastify_calls", upload_to_broadcastify_calls_task,
+                               system_config.broadcastify_calls, m4a_file_path, call_data, epoch_timestamp,
+                               duration_sec)
 
     # RDIO upload tasks
-    for rdio in system_config.get("rdio_systems", []):
-        rdio_thread = threading.Thread(target=upload_to_rdio_task, args=(rdio, m4a_file_path, call_data))
-        threads.append(rdio_thread)
-
-    # start upload threads
-    for thread in threads:
-        thread.start()
+    for rdio in route.rdio_systems:
+        artifacts.start_thread(run_stage, journal_entry, f"rdio {rdio.get('rdio_url')}", upload_to_rdio_task, rdio,
+                               m4a_file_path, call_data)
 
     # Legacy Tone Detection
-    for icad_detect in system_config.get("icad_tone_detect_legacy", []):
-        if icad_detect.get("enabled", 0) == 1:
-            try:
-                icad_result = upload_to_icad_legacy(icad_detect, mp3_file_path, call_data)
-                action_start = log_time("iCAD Legacy Upload", action_start)
-                if icad_result:
-                    module_logger.info(
-                        f"<<Successfully>> uploaded to <<iCAD>> <<Tone>> <<Detect>> Legacy server: {icad_detect.get('icad_url')}")
-                else:
-                    raise Exception()
-
-            except Exception as e:
-                module_logger.error(
-                    f"<<Failed>> to upload to <<iCAD>> <<Tone>> <<Detect>> Legacy server: {icad_detect.get('icad_url')}. Error: {str(e)}",
-                    exc_info=True)
-                continue
-        else:
-            module_logger.warning(f"<<iCAD>> <<Tone>> <<Detect>> Legacy is disabled: {icad_detect.get('icad_url')}")
+    for icad_detect in route.icad_tone_detect_legacy:
+        try:
+            icad_result = run_stage(journal_entry, f"icad_tone_detect_legacy {icad_detect.get('icad_url')}",
+                                    upload_to_icad_legacy, icad_detect, mp3_file_path, call_data)
+            action_start = log_time("iCAD Legacy Upload", action_start, system_config.name)
+            if icad_result:
+                module_logger.info(
+                    f"<<Successfully>> uploaded to <<iCAD>> <<Tone>> <<Detect>> Legacy server: {icad_detect.get('icad_url')}")
+            else:
+                raise Exception()
+
+        except Exception as e:
+            module_logger.error(
+                f"<<Failed>> to upload to <<iCAD>> <<Tone>> <<Detect>> Legacy server: {icad_detect.get('icad_url')}. Error: {str(e)}",
+                exc_info=True)
             continue
 
     # Tone Detection
-    if system_config.get("tone_detection", {}).get("enabled", 0) == 1:
-        if talkgroup_decimal not in system_config.get("tone_detection", {}).get("allowed_talkgroups",
-                                                                                []) and "*" not in system_config.get(
-            "tone_detection", {}).get("allowed_talkgroups", []):
+    if system_config.tone_detection is not None:
+        if not route.tone_detection:
             module_logger.debug(
                 f"<<Tone>> <<Detection>> Disabled for Talkgroup {call_data.get('talkgroup_tag') or call_data.get('talkgroup')}")
         else:
-            tone_detect_result = get_tones(system_config.get("tone_detection", {}), mp3_file_path)
-            action_start = log_time("Tone Detection", action_start)
-            call_data["tones"] = tone_detect_result
-            module_logger.info(f"<<Tone>> <<Detection>> Complete")
-            module_logger.debug(call_data.get("tones"))
+            tone_detect_result = run_stage(journal_entry, "tone_detection", get_tones, system_config.tone_detection,
+                                           mp3_file_path)
+            action_start = log_time("Tone Detection", action_start, system_config.name)
+            if tone_detect_result is None:
+                module_logger.warning(f"<<Tone>> <<Detection>> Failed, continuing without tones")
+            else:
+                call_data["tones"] = tone_detect_result
+                module_logger.info(f"<<Tone>> <<Detection>> Complete")
+                module_logger.debug(call_data.get("tones"))
 
     # Transcribe Audio
-    if system_config.get("transcribe", {}).get("enabled", 0) == 1:
-        if talkgroup_decimal not in system_config.get("transcribe", {}).get("allowed_talkgroups",
-                                                                            []) and "*" not in system_config.get(
-            "transcribe", {}).get("allowed_talkgroups", []):
+    if system_config.transcribe is not None:
+        if not route.transcribe:
             module_logger.debug(
                 f"<<iCAD>> <<Transcribe>> <<Disabled>> for Talkgroup {call_data.get('talkgroup_tag') or call_data.get('talkgroup')}")
         else:
-            transcribe_result = upload_to_transcribe(system_config.get("transcribe", {}), mp3_file_path, call_data,
-                                                     talkgroup_config=None)
-            action_start = log_time("Transcribe", action_start)
+            if transcribe_needs_tones:
+                transcribe_future = submit_transcription(system_config, route, artifacts, journal_entry, call_data)
+            transcribe_result = run_stage(journal_entry, "transcribe", wait_for_transcription, transcribe_future)
+            action_start = log_time("Transcribe", action_start, system_config.name)
 
             call_data["transcript"] = transcribe_result
             module_logger.debug(call_data.get("transcript"))
 
-    # Resave JSON with new Transcript and Tone Data.
-    try:
-        save_call_data(json_file_path, call_data)
-    except Exception as e:
-        module_logger.warning(
-            f"<<Unexpected>> <<error>> occurred saving new call data to <<temporary>> <<file>> {json_file_path}. {e}")
+    # Save JSON with Transcript and Tone Data when it is wanted on disk or in the archive.
+    if system_config.write_call_json or (
+            route.archive and ".json" in system_config.archive.get("archive_extensions", [])):
+        try:
+            save_call_data(json_file_path, call_data)
+        except Exception as e:
+            module_logger.warning(
+                f"<<Unexpected>> <<error>> occurred saving call data to <<temporary>> <<file>> {json_file_path}. {e}")
 
     # Archive Files
-    if system_config.get("archive", {}).get("enabled", 0) == 1 and system_config.get("archive", {}).get("archive_days",
-                                                                                                        0) >= 1:
-        mp3_url, m4a_url, json_url = archive_files(system_config.get("archive", {}),
-                                                   os.path.dirname(mp3_file_path), os.path.basename(mp3_file_path),
-                                                   call_data,
-                                                   system_short_name)
+    if route.archive:
+        mp3_url, m4a_url, json_url = run_stage(journal_entry, "archive", archive_files, system_config.archive,
+                                               mp3_file_path, m4a_file_path, json_file_path, call_data,
+                                               system_short_name, artifacts, succeeded=any)
         if mp3_url:
             call_data["audio_mp3_url"] = mp3_url
         if m4a_url:
             call_data["audio_m4a_url"] = m4a_url
 
-        action_start = log_time("Archive Files", action_start)
+        action_start = log_time("Archive Files", action_start, system_config.name)
 
         if mp3_url is None and m4a_url is None and json_url is None:
             module_logger.error("No Files Uploaded to Archive")
@@ -183,84 +311,75 @@ def process_call(system_config, mp3_file_path):
     # Send to Players
 
     # Upload to iCAD Player
-    if call_data.get("audio_m4a_url", "") and system_config.get("icad_player", {}).get("enabled", 0) == 1:
+    if call_data.get("audio_m4a_url", "") and system_config.icad_player is not None:
 
-        if talkgroup_decimal not in system_config.get("icad_player", {}).get("allowed_talkgroups",
-                                                                             []) and "*" not in system_config.get(
-            "icad_player", {}).get("allowed_talkgroups", []):
+        if not route.icad_player:
             module_logger.warning(
                 f"iCAD Player Disabled for Talkgroup {call_data.get('talkgroup_tag') or call_data.get('talkgroup_decimal')}")
         else:
-            icad_player_result = upload_to_icad_player(system_config.get("icad_player", {}), call_data)
-            action_start = log_time("iCAD Player", action_start)
+            icad_player_result = run_stage(journal_entry, "icad_player", upload_to_icad_player,
+                                           system_config.icad_player, call_data)
+            action_start = log_time("iCAD Player", action_start, system_config.name)
             if icad_player_result:
                 module_logger.info(f"Upload to iCAD Player Complete")
 
     # Upload to Alerting
-    if system_config.get("icad_alerting", {}).get("enabled", 0) == 1:
-        if talkgroup_decimal not in system_config.get("icad_alerting", {}).get("allowed_talkgroups",
-                                                                               []) and "*" not in system_config.get(
-            "icad_alerting", {}).get("allowed_talkgroups", []):
+    if system_config.icad_alerting is not None:
+        if not route.icad_alerting:
             module_logger.warning(
                 f"iCAD Alerting Disabled for Talkgroup {call_data.get('talkgroup_tag') or call_data.get('talkgroup_decimal')}")
         else:
-            upload_to_icad_alert(system_config.get("icad_alerting", {}), call_data)
-            action_start = log_time("iCAD Alerting", action_start)
+            run_stage(journal_entry, "icad_alerting", upload_to_icad_alert, system_config.icad_alerting, call_data)
+            action_start = log_time("iCAD Alerting", action_start, system_config.name)
             module_logger.info(f"Upload to iCAD Alert Complete")
 
-    if not system_config.get("keep_files"):
-        audio_file_cleanup(mp3_file_path)
-
-    # Wait for all threads to complete
-    for thread in threads:
-        thread.join()
+    # Index the final call metadata
+    if system_config.call_index is not None:
+        get_call_index(system_config.call_index).add_call(system_config.name, mp3_file_path, call_data)
 
     total_time = time.time() - start_time
     module_logger.info(f"Processing Complete for {mp3_file_path} - Total time: {total_time:.2f} seconds.")
+    return True
 
 
-def upload_to_openmhz_task(system_config, m4a_file_path, call_data):
+def upload_to_openmhz_task(openmhz_config, m4a_file_path, call_data):
     try:
-        if system_config.get("openmhz", {}).get("enabled", 0) == 1:
-            if m4a_file_path:
-                result = upload_to_openmhz(system_config.get("openmhz", {}), m4a_file_path, call_data)
-                log_time("OpenMHZ Upload", time.time())
-                return result
-            else:
-                module_logger.warning(f"No M4A file can't send to OpenMHZ")
+        if m4a_file_path:
+            result = upload_to_openmhz(openmhz_config, m4a_file_path, call_data)
+            log_time("OpenMHZ Upload", time.time())
+            return result
+        else:
+            module_logger.warning(f"No M4A file can't send to OpenMHZ")
     except Exception as e:
         module_logger.error(f"Error uploading to OpenMHZ: {e}")
 
 
-def upload_to_broadcastify_calls_task(system_config, m4a_file_path, call_data, epoch_timestamp, duration_sec):
+def upload_to_broadcastify_calls_task(broadcastify_config, m4a_file_path, call_data, epoch_timestamp, duration_sec):
     try:
-        if system_config.get("broadcastify_calls", {}).get("enabled", 0) == 1:
-            if m4a_file_path:
-                current_time = time.time()
-                module_logger.debug(f"Timestamp from file - {epoch_timestamp}")
-                module_logger.debug(f"Timestamp now - {current_time}")
-                module_logger.debug(f"File Duration - {duration_sec}")
-                module_logger.debug(f"Skew Created to Now - {current_time - epoch_timestamp}")
-                module_logger.debug(f"Skew Created Minus Duration - {current_time - epoch_timestamp + duration_sec}")
-
-                result = upload_to_broadcastify_calls(system_config.get("broadcastify_calls", {}),
-                                                      m4a_file_path, call_data)
-                log_time("Broadcastify Calls", time.time())
-                return result
-            else:
-                module_logger.warning(f"No M4A file can't send to Broadcastify Calls")
+        if m4a_file_path:
+            current_time = time.time()
+            module_logger.debug(f"Timestamp from file - {epoch_timestamp}")
+            module_logger.debug(f"Timestamp now - {current_time}")
+            module_logger.debug(f"File Duration - {duration_sec}")
+            module_logger.debug(f"Skew Created to Now - {current_time - epoch_timestamp}")
+            module_logger.debug(f"Skew Created Minus Duration - {current_time - epoch_timestamp + duration_sec}")
+
+            result = upload_to_broadcastify_calls(broadcastify_config, m4a_file_path, call_data)
+            log_time("Broadcastify Calls", time.time())
+            return result
+        else:
+            module_logger.warning(f"No M4A file can't send to Broadcastify Calls")
     except Exception as e:
         module_logger.error(f"Broadcastify Calls Upload to Broadcastify Failed: {e}")
 
 
 def upload_to_rdio_task(rdio, m4a_file_path, call_data):
     try:
-        if rdio.get("enabled", 0) == 1:
-            if m4a_file_path:
-                result = upload_to_rdio(rdio, m4a_file_path, call_data)
-                log_time(f"RDIO Upload {rdio.get('rdio_url')}", time.time())
-                return result
-            else:
-                module_logger.warning(f"No M4A file can't send to RDIO")
+        if m4a_file_path:
+            result = upload_to_rdio(rdio, m4a_file_path, call_data)
+            log_time(f"RDIO Upload {rdio.get('rdio_url')}", time.time())
+            return result
+        else:
+            module_logger.warning(f"No M4A file can't send to RDIO")
     except Exception as e:
         module_logger.error(f"Error uploading to RDIO {rdio.get('rdio_url')}: {e}")
@@ -0,0 +1,210 @@
+import json
+import logging
+import os
+import socket
+import threading
+import time
+
+module_logger = logging.getLogger('rtl_watcher.claim')
+
+
+class ClaimManager:
+    """
+    Lets several rtl_watcher nodes share one watch directory without processing a call twice.
+
+    A node claims a call by atomically renaming the MP3 into its own directory under claim_directory, so exactly
+    one rename succeeds. Each node heartbeats a lease file; when a node's lease stops changing for lease_seconds
+    the surviving nodes rename its claimed calls into their own directories and process them. Leftovers of
+    processed calls are kept under completed for completed_hours, or dropped at once when it is 0.
+    """
+
+    completed_directory_name = "completed"
+
+    def __init__(self, claim_config, watch_directory, on_reclaimed=None):
+        self.watch_directory = os.path.abspath(watch_directory)
+        self.node_id = claim_config.get("node_id") or socket.gethostname()
+        self.claim_directory = os.path.abspath(
+            claim_config.get("claim_directory") or os.path.join(self.watch_directory, ".rtl_claims"))
+        self.lease_seconds = claim_config.get("lease_seconds", 60)
+        self.heartbeat_interval = claim_config.get("heartbeat_interval", 15)
+        self.completed_seconds = claim_config.get("completed_hours", 24) * 3600
+        self.on_reclaimed = on_reclaimed
+
+        self.node_directory = os.path.join(self.claim_directory, self.node_id)
+        self.completed_directory = os.path.join(self.claim_directory, self.completed_directory_name)
+        self.lease_path = os.path.join(self.claim_directory, f"{self.node_id}.lease")
+
+        self.heartbeat_count = 0
+        self.observed_leases = {}
+        self.last_pruned = 0
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        os.makedirs(self.node_directory, exist_ok=True)
+        os.makedirs(self.completed_directory, exist_ok=True)
+        self.heartbeat()
+        self.thread = threading.Thread(target=self._run, name=f"claim-{self.node_id}", daemon=True)
+        self.thread.start()
+        module_logger.info(f"<<Claim>> node {self.node_id} using {self.claim_directory}")
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+
+    def _run(self):
+        while not self.stop_event.wait(self.heartbeat_interval):
+            try:
+                self.heartbeat()
+                reclaimed = self.reclaim_expired()
+                if reclaimed and self.on_reclaimed:
+                    self.on_reclaimed(reclaimed)
+                if time.monotonic() - self.last_pruned >= min(3600, max(self.completed_seconds, 60)):
+                    self.last_pruned = time.monotonic()
+                    self.prune_completed()
+            except Exception as e:
+                module_logger.error(f"<<Claim>> <<heartbeat>> <<error>>: {e}", exc_info=True)
+
+    def heartbeat(self):
+        self.heartbeat_count += 1
+        temp_path = f"{self.lease_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as lease_file:
+            json.dump({"node_id": self.node_id, "count": self.heartbeat_count, "time": time.time()}, lease_file)
+        os.replace(temp_path, self.lease_path)
+
+    def is_claim_path(self, path):
+        """Returns True for paths inside the claim directory, which the watcher must ignore."""
+        return os.path.abspath(path).startswith(self.claim_directory + os.sep)
+
+    def _relative_path(self, path):
+        relative_path = os.path.relpath(os.path.abspath(path), self.watch_directory)
+        if relative_path.startswith(os.pardir):
+            relative_path = os.path.basename(path)
+        return relative_path
+
+    def claim(self, path):
+        """
+        Claims a call for this node.
+
+        Returns the claimed path, or None if another node already claimed it.
+        """
+        claimed_path = os.path.join(self.node_directory, self._relative_path(path))
+        try:
+            os.makedirs(os.path.dirname(claimed_path), exist_ok=True)
+            os.rename(path, claimed_path)
+        except FileNotFoundError:
+            module_logger.debug(f"<<Claim>> {path} already claimed by another node.")
+            return None
+        except OSError as e:
+            module_logger.error(f"<<Claim>> <<error>> unable to claim {path}: {e}")
+            return None
+        return claimed_path
+
+    def release(self, claimed_path, extensions=(".mp3", ".m4a", ".json")):
+        """
+        Moves anything left of a processed call out of this node's directory so it is not resumed again.
+        """
+        base_path, _ = os.path.splitext(claimed_path)
+        relative_base = os.path.relpath(base_path, self.node_directory)
+        for extension in extensions:
+            source_path = base_path + extension
+            if not os.path.exists(source_path):
+                continue
+            destination_path = os.path.join(self.completed_directory, relative_base + extension)
+            try:
+                if self.completed_seconds <= 0:
+                    os.remove(source_path)
+                    continue
+                os.makedirs(os.path.dirname(destination_path), exist_ok=True)
+                os.rename(source_path, destination_path)
+            except OSError as e:
+                module_logger.warning(f"<<Claim>> unable to release {source_path}: {e}")
+
+    def prune_completed(self):
+        """
+        Deletes released files older than completed_hours, along with the directories they leave empty. Every node
+        prunes the shared directory, so files another node removed first are skipped.
+        """
+        cutoff = time.time() - self.completed_seconds
+        removed = 0
+        for root, directories, files in os.walk(self.completed_directory, topdown=False):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    if os.stat(path).st_mtime < cutoff:
+                        os.remove(path)
+                        removed += 1
+                except FileNotFoundError:
+                    continue
+                except OSError as e:
+                    module_logger.warning(f"<<Claim>> unable to prune {path}: {e}")
+            if root != self.completed_directory:
+                try:
+                    os.rmdir(root)
+                except OSError:
+                    pass
+        if removed:
+            module_logger.info(f"<<Claim>> pruned {removed} completed files older than "
+                               f"{self.completed_seconds / 3600:g} hours")
+        return removed
+
+    def pending_claims(self):
+        """Returns calls this node claimed but never finished, e.g. before a crash."""
+        return self._list_calls(self.node_directory)
+
+    def _list_calls(self, directory):
+        calls = []
+        for root, _, files in os.walk(directory):
+            calls.extend(os.path.join(root, name) for name in files if name.lower().endswith(".mp3"))
+        return calls
+
+    def _read_lease(self, node_id):
+        try:
+            with open(os.path.join(self.claim_directory, f"{node_id}.lease"), "r") as lease_file:
+                return json.load(lease_file).get("count")
+        except (OSError, ValueError):
+            return None
+
+    def expired_nodes(self):
+        """
+        Returns nodes whose lease has not changed for lease_seconds.
+
+        Expiry is measured with this node's clock from when the lease was last seen to change, so clock skew
+        between nodes does not matter.
+        """
+        now = time.monotonic()
+        expired = []
+        with os.scandir(self.claim_directory) as entries:
+            node_ids = [entry.name for entry in entries if entry.is_dir() and entry.name not in (
+                self.node_id, self.completed_directory_name)]
+
+        for node_id in node_ids:
+            count = self._read_lease(node_id)
+            last_count, last_change = self.observed_leases.get(node_id, (None, None))
+            if last_change is None or count != last_count:
+                self.observed_leases[node_id] = (count, now)
+            elif now - last_change >= self.lease_seconds:
+                expired.append(node_id)
+        return expired
+
+    def reclaim_expired(self):
+        """
+        Takes over the claimed calls of expired nodes. Returns the paths now claimed by this node.
+        """
+        reclaimed = []
+        for node_id in self.expired_nodes():
+            node_directory = os.path.join(self.claim_directory, node_id)
+            node_reclaimed = 0
+            for path in self._list_calls(node_directory):
+                claimed_path = os.path.join(self.node_directory, os.path.relpath(path, node_directory))
+                try:
+                    os.makedirs(os.path.dirname(claimed_path), exist_ok=True)
+                    os.rename(path, claimed_path)
+                except FileNotFoundError:
+                    continue
+                reclaimed.append(claimed_path)
+                node_reclaimed += 1
+            if node_reclaimed:
+                module_logger.warning(f"<<Claim>> reclaimed {node_reclaimed} calls from expired node {node_id}")
+        return reclaimed
@@ -0,0 +1,126 @@
+import logging
+import os
+import threading
+import time
+
+module_logger = logging.getLogger('rtl_watcher.coalescer')
+
+# Floors for the check intervals, so a zero-byte file is never polled in a tight loop.
+MIN_DEBOUNCE_SECONDS = 0.01
+MIN_STABLE_SECONDS = 0.1
+
+
+class EventCoalescer:
+    """
+    Turns a stream of filesystem events into one dispatch per finished file.
+
+    Every event for a path pushes its check back by debounce_seconds, so bursts of created, modified and moved
+    events collapse into a single entry. Once quiet, a file is dispatched when it is non-empty and its size and
+    mtime are unchanged since the previous check, otherwise it is checked again after stable_seconds. The mtime is
+    only compared with itself, never with this host's clock, so preserved mtimes and skewed file servers can't
+    make a file being written look finished. Paths that are gone by then, such as the first name of a
+    file renamed twice, are dropped, as are empty files that have not changed for abandon_seconds.
+    """
+
+    def __init__(self, on_stable, debounce_seconds=0.25, stable_seconds=1.0, name="coalescer", abandon_seconds=60.0):
+        self.on_stable = on_stable
+        self.debounce_seconds = max(debounce_seconds, MIN_DEBOUNCE_SECONDS)
+        self.stable_seconds = max(stable_seconds, MIN_STABLE_SECONDS)
+        self.abandon_seconds = abandon_seconds
+        self.name = name
+        self.condition = threading.Condition()
+        # path -> [due monotonic time, (size, mtime_ns) at the last check, monotonic time that state was first seen]
+        self.pending = {}
+        self.stopping = False
+        self.drain_deadline = None
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self.thread.start()
+
+    def stop(self, drain_seconds=None):
+        """
+        Stops the coalescer, first waiting up to drain_seconds for pending files to settle and be dispatched.
+        """
+        with self.condition:
+            self.stopping = True
+            self.drain_deadline = time.monotonic() + (
+                drain_seconds if drain_seconds is not None else max(5.0, 4 * self.stable_seconds))
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join()
+
+    def add(self, path):
+        with self.condition:
+            entry = self.pending.get(path)
+            due = time.monotonic() + self.debounce_seconds
+            if entry is None:
+                self.pending[path] = [due, None, time.monotonic()]
+            else:
+                entry[0] = due
+            self.condition.notify()
+
+    def discard(self, path):
+        with self.condition:
+            self.pending.pop(path, None)
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while True:
+                    now = time.monotonic()
+                    if self.stopping and (not self.pending or now >= self.drain_deadline):
+                        if self.pending:
+                            module_logger.warning(f"<<Coalescer>> stopped with {len(self.pending)} files still "
+                                                  f"being written: {', '.join(self.pending)}")
+                        return
+                    due_paths = [path for path, entry in self.pending.items() if entry[0] <= now]
+                    if due_paths:
+                        break
+                    next_due = min((entry[0] for entry in self.pending.values()), default=None)
+                    timeout = next_due - now if next_due is not None else None
+                    if self.stopping:
+                        drain_timeout = self.drain_deadline - now
+                        timeout = drain_timeout if timeout is None else min(timeout, drain_timeout)
+                    self.condition.wait(timeout)
+
+            for path in due_paths:
+                self._check(path)
+
+    def _check(self, path):
+        try:
+            stat_result = os.stat(path)
+        except FileNotFoundError:
+            module_logger.debug(f"<<Coalescer>> {path} is gone, dropping it")
+            self.discard(path)
+            return
+
+        state = (stat_result.st_size, stat_result.st_mtime_ns)
+        with self.condition:
+            entry = self.pending.get(path)
+            if entry is None or entry[0] > time.monotonic():
+                # Discarded, or another event arrived while the file was checked.
+                return
+            stable = abandoned = False
+            if stat_result.st_size > 0 and state == entry[1]:
+                del self.pending[path]
+                stable = True
+            elif state == entry[1] and time.monotonic() - entry[2] >= self.abandon_seconds:
+                del self.pending[path]
+                abandoned = True
+            else:
+                if state != entry[1]:
+                    entry[1] = state
+                    entry[2] = time.monotonic()
+                entry[0] = time.monotonic() + self.stable_seconds
+
+        if abandoned:
+            module_logger.warning(f"<<Coalescer>> {path} stayed empty for {self.abandon_seconds:g} seconds, "
+                                  f"dropping it")
+        elif stable:
+            module_logger.debug(f"<<Coalescer>> file is stable: {path}")
+            try:
+                self.on_stable(path)
+            except Exception as e:
+                module_logger.error(f"<<Coalescer>> <<error>> dispatching {path}: {e}", exc_info=True)
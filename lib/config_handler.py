@@ -1,34 +1,103 @@
 import csv
 import json
 import logging
+import os
 
 module_logger = logging.getLogger('rtl_watcher.config')
 
 default_config = {
     "log_level": 1,
     "temp_file_path": "/dev/shm",
+    "temp_min_free_mb": 32,
+    "call_index": {
+        "enabled": 0,
+        "database_path": "var/calls.db",
+        "batch_size": 50,
+        "flush_interval": 2
+    },
+    "journal": {
+        "enabled": 0,
+        "directory": "var/journal",
+        "fsync_interval_ms": 100,
+        "compact_bytes": 4194304
+    },
+    "process_mode": {
+        "enabled": 0,
+        "systems_per_process": 1,
+        "restart_delay": 5,
+        "pin_cpus": 1,
+        "metrics_interval": 300,
+        "stop_timeout": 120
+    },
+    "worker_pool": {
+        "max_total_threads": 0,
+        "shared": 0,
+        "shared_threads": 0
+    },
     "systems": {
         "example-system": {
             "keep_local_files": False,
+            "write_call_json": 1,
             "watch_directory": "/home/example/example_recordings",
+            "watch_mode": "inotify",
+            "scan_interval": 2,
+            "scan_existing": 0,
+            "event_debounce_ms": 250,
+            "event_stable_seconds": 1,
             "max_processing_threads": 5,
+            "autoscale": {
+                "enabled": 0,
+                "min_processing_threads": 1,
+                "idle_seconds": 30,
+                "target_wait_seconds": 2,
+                "max_load_per_cpu": 1.5
+            },
+            "worker_weight": 1,
+            "reserved_threads": 0,
             "talkgroup_csv_path": "/home/example/rtl_config/example_county_channels.csv",
+            "claim": {
+                "enabled": 0,
+                "node_id": "",
+                "claim_directory": "",
+                "lease_seconds": 60,
+                "heartbeat_interval": 15,
+                "completed_hours": 24
+            },
             "archive": {
                 "enabled": 0,
                 "archive_type": "scp",
                 "archive_path": "",
                 "archive_days": 0,
                 "archive_extensions": [".mp3", ".m4a", ".json"],
+                "retention_database_path": "var/archive_retention.db",
+                "content_addressed": 0,
+                "clean_interval_minutes": 10,
+                "reconcile_hours": 24,
+                "upload_workers": 4,
+                "batch_window_ms": 50,
+                "batch_max_size": 50,
+                "retry_attempts": 3,
+                "retry_backoff": 2,
+                "retry_backoff_max": 60,
+                "wait_seconds": 30,
                 "google_cloud": {
                     "project_id": "",
                     "bucket_name": "",
-                    "credentials_file": ""
+                    "credentials_file": "",
+                    "public_access": "acl",
+                    "multipart_threshold_mb": 8,
+                    "multipart_chunk_mb": 8,
+                    "max_concurrency": 4
                 },
                 "aws_s3": {
                     "access_key_id": "",
                     "secret_access_key": "",
                     "bucket_name": "",
-                    "region": ""
+                    "region": "",
+                    "public_access": "acl",
+                    "multipart_threshold_mb": 8,
+                    "multipart_chunk_mb": 8,
+                    "max_concurrency": 4
                 },
                 "scp": {
                     "host": "",
@@ -39,9 +108,18 @@ default_config = {
                     "base_url": "https://example.com/audio"
                 },
                 "local": {
-                    "base_url": "https://example.com/audio"
+                    "base_url": "https://example.com/audio",
+                    "link_mode": "auto"
                 }
             },
+            "duplicate_detection": {
+                "enabled": 0,
+                "window_seconds": 30,
+                "start_tolerance": 2,
+                "duration_tolerance": 1.0,
+                "max_distance": 0.2,
+                "sample_rate": 8000
+            },
             "audio_compression": {
                 "enabled": 0,
                 "sample_rate": 16000,
@@ -70,7 +148,12 @@ default_config = {
                 "enabled": 0,
                 "allowed_talkgroups": ["*"],
                 "api_url": "",
-                "api_key": ""
+                "api_key": "",
+                "trim_audio": 0,
+                "max_concurrency": 4,
+                "context_max_entries": 1000,
+                "context_ttl_seconds": 300,
+                "context_max_chars": 400
             },
             "openmhz": {
                 "enabled": 0,
@@ -105,6 +188,7 @@ default_config = {
             },
             "talkgroup_config": {
                 "*": {
+                    "transcribe_priority": 0,
                     "whisper": {
                         "language": "en",
                         "beam_size": 5,
@@ -222,13 +306,340 @@ def load_csv_channels(talkgroup_csv_path):
         return None
 
 
-def get_talkgroup_config(talkgroup_config, call_data):
-    talkgroup_dec = call_data.get("talkgroup", 0)
-    talkgroup_config_data = {}  # Initialize as an empty dict
+class ConfigError(Exception):
+    """Raised when a system configuration fails validation."""
+
+
+ARCHIVE_TYPES = ("google_cloud", "aws_s3", "scp", "local")
+
+
+def _is_enabled(section):
+    return isinstance(section, dict) and section.get("enabled", 0) == 1
+
+
+def _parse_talkgroups(values, section_name):
+    """
+    Converts a talkgroup allow list into a wildcard flag and a frozenset of talkgroup decimals.
+    """
+    if not isinstance(values, (list, tuple)):
+        raise ConfigError(f"{section_name} talkgroups must be a list.")
+
+    wildcard = False
+    talkgroups = set()
+    for value in values:
+        if value == "*":
+            wildcard = True
+            continue
+        try:
+            talkgroups.add(int(value))
+        except (TypeError, ValueError):
+            raise ConfigError(f"{section_name} has an invalid talkgroup: {value!r}")
+
+    return wildcard, frozenset(talkgroups)
+
+
+def _filesystem_device(path):
+    """
+    Returns the device of path, or of its nearest existing parent when it has not been created yet.
+    """
+    path = os.path.abspath(path)
+    while not os.path.exists(path) and os.path.dirname(path) != path:
+        path = os.path.dirname(path)
+    return os.stat(path).st_dev
+
+
+def _require_keys(section, keys, section_name):
+    missing = [key for key in keys if section.get(key) in (None, "")]
+    if missing:
+        raise ConfigError(f"{section_name} is enabled but missing: {', '.join(missing)}")
+
+
+class TalkgroupRoute:
+    """
+    Precomputed stage plan for a single talkgroup. Every flag already has the ``*`` wildcard resolved.
+    """
+    __slots__ = ("talkgroup", "talkgroup_config", "tone_detection", "transcribe", "icad_player", "icad_alerting",
+                 "icad_tone_detect_legacy", "openmhz", "broadcastify_calls", "rdio_systems", "archive")
+
+    def __init__(self, talkgroup, talkgroup_config, tone_detection, transcribe, icad_player, icad_alerting,
+                 icad_tone_detect_legacy, openmhz, broadcastify_calls, rdio_systems, archive):
+        self.talkgroup = talkgroup
+        self.talkgroup_config = talkgroup_config
+        self.tone_detection = tone_detection
+        self.transcribe = transcribe
+        self.icad_player = icad_player
+        self.icad_alerting = icad_alerting
+        self.icad_tone_detect_legacy = icad_tone_detect_legacy
+        self.openmhz = openmhz
+        self.broadcastify_calls = broadcastify_calls
+        self.rdio_systems = rdio_systems
+        self.archive = archive
+
+
+class SystemConfig:
+    """
+    Validated, read only view of a single system from config.json.
+
+    Stage sections are the original config dicts when the stage is enabled, otherwise None.
+    """
+    __slots__ = ("name", "data", "watch_directory", "watch_mode", "scan_interval", "scan_existing",
+                 "event_debounce_ms", "event_stable_seconds", "max_processing_threads", "autoscale", "worker_pool",
+                 "worker_weight", "reserved_threads",
+                 "keep_files", "talkgroup_csv_path", "channels", "claim",
+                 "duplicate_detection", "archive", "audio_compression", "tone_detection", "transcribe", "openmhz",
+                 "broadcastify_calls", "icad_player", "icad_alerting", "icad_tone_detect_legacy", "rdio_systems",
+                 "talkgroup_config", "temp_file_path", "temp_min_free_mb", "call_index", "journal", "write_call_json",
+                 "routes", "_allow_lists", "_legacy_allow_lists")
+
+    def __init__(self, name, system_config_data, global_config_data=None):
+        if not isinstance(system_config_data, dict) or not system_config_data:
+            raise ConfigError(f"System {name} configuration is empty or not an object.")
+        global_config_data = global_config_data or {}
+
+        self.name = name
+        self.data = system_config_data
+
+        self.watch_directory = system_config_data.get("watch_directory") or None
+        if not self.watch_directory:
+            raise ConfigError(f"System {name} watch_directory is not set.")
+
+        self.watch_mode = system_config_data.get("watch_mode", "inotify")
+        if self.watch_mode not in ("inotify", "polling"):
+            raise ConfigError(f"System {name} watch_mode must be 'inotify' or 'polling'.")
+        self.scan_interval = system_config_data.get("scan_interval", 2)
+        if not isinstance(self.scan_interval, (int, float)) or self.scan_interval <= 0:
+            raise ConfigError(f"System {name} scan_interval must be a positive number.")
+        self.scan_existing = system_config_data.get("scan_existing", 0) == 1
+        self.event_debounce_ms = system_config_data.get("event_debounce_ms", 250)
+        self.event_stable_seconds = system_config_data.get("event_stable_seconds", 1)
+        # Zero intervals would have the coalescer poll zero-byte files in a tight loop.
+        for key, minimum in (("event_debounce_ms", 10), ("event_stable_seconds", 0.1)):
+            value = getattr(self, key)
+            if not isinstance(value, (int, float)) or value < minimum:
+                raise ConfigError(f"System {name} {key} must be a number of at least {minimum}.")
+
+        self.max_processing_threads = system_config_data.get("max_processing_threads", 10)
+        if not isinstance(self.max_processing_threads, int) or self.max_processing_threads < 1:
+            raise ConfigError(f"System {name} max_processing_threads must be a positive integer.")
+        self.autoscale = self._section("autoscale")
+        if self.autoscale is not None and not 1 <= self.autoscale.get("min_processing_threads", 1) <= \
+                self.max_processing_threads:
+            raise ConfigError(f"System {name} autoscale min_processing_threads must be between 1 and "
+                              f"max_processing_threads.")
+        self.worker_pool = global_config_data.get("worker_pool", {}) or {}
+        self.worker_weight = system_config_data.get("worker_weight", 1)
+        if not isinstance(self.worker_weight, (int, float)) or self.worker_weight <= 0:
+            raise ConfigError(f"System {name} worker_weight must be a positive number.")
+        self.reserved_threads = system_config_data.get("reserved_threads", 0)
+        if not isinstance(self.reserved_threads, int) or self.reserved_threads < 0:
+            raise ConfigError(f"System {name} reserved_threads must be zero or a positive integer.")
+
+        self.keep_files = bool(system_config_data.get("keep_files", system_config_data.get("keep_local_files", False)))
+
+        self.temp_file_path = global_config_data.get("temp_file_path") or None
+        if self.temp_file_path and not os.path.isdir(self.temp_file_path):
+            module_logger.warning(f"temp_file_path {self.temp_file_path} does not exist, staging disabled for {name}.")
+            self.temp_file_path = None
+        self.temp_min_free_mb = global_config_data.get("temp_min_free_mb", 32)
+
+        self.call_index = global_config_data.get("call_index", {})
+        self.call_index = self.call_index if _is_enabled(self.call_index) else None
+        self.journal = global_config_data.get("journal", {})
+        self.journal = self.journal if _is_enabled(self.journal) else None
+        self.write_call_json = system_config_data.get("write_call_json", 1) == 1
+
+        self.talkgroup_csv_path = system_config_data.get("talkgroup_csv_path", "")
+        self.channels = self._load_channels()
+
+        self.claim = self._section("claim")
+        if self.claim is not None and self.claim.get("heartbeat_interval", 15) >= self.claim.get("lease_seconds", 60):
+            raise ConfigError(f"System {name} claim heartbeat_interval must be shorter than lease_seconds.")
+        # Calls are claimed with a rename, which fails across filesystems.
+        if self.claim is not None and self.claim.get("claim_directory") and \
+                _filesystem_device(self.claim["claim_directory"]) != _filesystem_device(self.watch_directory):
+            raise ConfigError(f"System {name} claim claim_directory must be on the same filesystem as "
+                              f"watch_directory.")
+
+        self.duplicate_detection = self._section("duplicate_detection")
+        self.audio_compression = self._section("audio_compression")
+        self.tone_detection = self._section("tone_detection")
+        self.transcribe = self._section("transcribe", ("api_url",))
+        if self.transcribe is not None and self.transcribe.get("max_concurrency", 4) < 1:
+            raise ConfigError(f"System {name} transcribe max_concurrency must be a positive integer.")
+        self.openmhz = self._section("openmhz", ("short_name", "api_key"))
+        self.broadcastify_calls = self._section("broadcastify_calls", ("system_id", "api_key"))
+        self.icad_player = self._section("icad_player", ("api_url",))
+        self.icad_alerting = self._section("icad_alerting", ("api_url",))
+        self.archive = self._load_archive()
+
+        self.rdio_systems = tuple(
+            rdio for rdio in self._section_list("rdio_systems", ("rdio_url", "rdio_api_key", "system_id")))
+        self.icad_tone_detect_legacy = tuple(self._section_list("icad_tone_detect_legacy", ("icad_url",)))
+
+        self.talkgroup_config = system_config_data.get("talkgroup_config", {}) or {}
+        if not isinstance(self.talkgroup_config, dict):
+            raise ConfigError(f"System {name} talkgroup_config must be an object.")
+        for key in self.talkgroup_config:
+            if key != "*":
+                try:
+                    int(key)
+                except ValueError:
+                    raise ConfigError(f"System {name} talkgroup_config has an invalid talkgroup key: {key!r}")
+
+        self._allow_lists = {
+            section_name: _parse_talkgroups(section.get("allowed_talkgroups", []), f"{name} {section_name}")
+            for section_name, section in (("tone_detection", self.tone_detection), ("transcribe", self.transcribe),
+                                          ("icad_player", self.icad_player),
+                                          ("icad_alerting", self.icad_alerting))
+            if section is not None
+        }
+        self._legacy_allow_lists = tuple(
+            (legacy, _parse_talkgroups(legacy.get("talkgroups", ["*"]), f"{name} icad_tone_detect_legacy"))
+            for legacy in self.icad_tone_detect_legacy
+        )
+
+        talkgroups = {int(row.get("talkgroup_decimal") or 0) for row in self.channels.values()}
+        talkgroups.update(int(key) for key in self.talkgroup_config if key != "*")
+        self.routes = {talkgroup: self._build_route(talkgroup) for talkgroup in talkgroups}
+
+    def _section(self, section_name, required_keys=()):
+        section = self.data.get(section_name, {})
+        if not _is_enabled(section):
+            return None
+        _require_keys(section, required_keys, f"System {self.name} {section_name}")
+        return section
+
+    def _section_list(self, section_name, required_keys=()):
+        sections = self.data.get(section_name, [])
+        if not isinstance(sections, list):
+            raise ConfigError(f"System {self.name} {section_name} must be a list.")
+        for section in sections:
+            if _is_enabled(section):
+                _require_keys(section, required_keys, f"System {self.name} {section_name}")
+                yield section
+
+    def _load_archive(self):
+        archive = self.data.get("archive", {})
+        if not _is_enabled(archive) or archive.get("archive_days", 0) < 1:
+            return None
+
+        archive_type = archive.get("archive_type", "")
+        if archive_type not in ARCHIVE_TYPES:
+            raise ConfigError(f"System {self.name} archive_type {archive_type!r} is invalid.")
+        if not archive.get("archive_path", "") and archive_type not in ("google_cloud", "aws_s3"):
+            raise ConfigError(f"System {self.name} archive_path is not set.")
+        if not isinstance(archive.get(archive_type), dict):
+            raise ConfigError(f"System {self.name} archive is missing the {archive_type} section.")
+        if archive.get("content_addressed", 0) == 1:
+            if not archive.get("retention_database_path", ""):
+                raise ConfigError(f"System {self.name} content_addressed archive needs retention_database_path.")
+            if ".json" not in archive.get("archive_extensions", []):
+                raise ConfigError(f"System {self.name} content_addressed archive needs .json in archive_extensions.")
+        return archive
+
+    def _load_channels(self):
+        channel_data = load_csv_channels(self.talkgroup_csv_path)
+        if channel_data is None:
+            raise ConfigError(f"System {self.name} talkgroup CSV {self.talkgroup_csv_path!r} could not be loaded.")
+
+        channels = {}
+        for row in channel_data:
+            try:
+                frequency = int(row.get("channel_frequency") or 0)
+                int(row.get("talkgroup_decimal") or 0)
+            except ValueError:
+                raise ConfigError(f"System {self.name} talkgroup CSV has an invalid row: {row}")
+            channels.setdefault(frequency, row)
+        return channels
+
+    def _build_route(self, talkgroup):
+        def allowed(section_name):
+            allow_list = self._allow_lists.get(section_name)
+            if allow_list is None:
+                return False
+            wildcard, talkgroups = allow_list
+            return wildcard or talkgroup in talkgroups
+
+        if talkgroup > 0 and self.talkgroup_config:
+            talkgroup_config = self.talkgroup_config.get(str(talkgroup)) or self.talkgroup_config.get("*", {})
+        else:
+            talkgroup_config = {}
+
+        return TalkgroupRoute(
+            talkgroup=talkgroup,
+            talkgroup_config=talkgroup_config,
+            tone_detection=allowed("tone_detection"),
+            transcribe=allowed("transcribe"),
+            icad_player=allowed("icad_player"),
+            icad_alerting=allowed("icad_alerting"),
+            icad_tone_detect_legacy=tuple(legacy for legacy, (wildcard, talkgroups) in self._legacy_allow_lists
+                                          if wildcard or talkgroup in talkgroups),
+            openmhz=self.openmhz is not None,
+            broadcastify_calls=self.broadcastify_calls is not None,
+            rdio_systems=self.rdio_systems,
+            archive=self.archive is not None
+        )
+
+    def get_channel(self, frequency):
+        """Returns the CSV row for a frequency, or None if the frequency is unknown."""
+        try:
+            return self.channels.get(int(frequency))
+        except (TypeError, ValueError):
+            return None
+
+    def get_route(self, talkgroup):
+        """Returns the precomputed stage plan for a talkgroup."""
+        route = self.routes.get(talkgroup)
+        if route is None:
+            route = self._build_route(talkgroup)
+        return route
+
+
+def compile_config(config_data, system_names=None):
+    """
+    Builds a SystemConfig for every system in the configuration, or only those in system_names when given.
+
+    Duplicate detection only compares calls within one process, so process_mode allows it on a single system.
+
+    Raises ConfigError listing every invalid system so all problems surface at startup.
+    """
+    if not isinstance(config_data, dict) or not isinstance(config_data.get("systems"), dict):
+        raise ConfigError("Configuration has no systems.")
+
+    systems = {}
+    errors = []
+    for system_name, system_config_data in config_data["systems"].items():
+        if system_names is not None and system_name not in system_names:
+            continue
+        try:
+            systems[system_name] = SystemConfig(system_name, system_config_data, config_data)
+        except ConfigError as e:
+            errors.append(str(e))
+
+    # Minimum threads over the budget would be clamped at startup, so refuse them here. Process mode workers each
+    # have their own budget and only clamp.
+    max_total_threads = (config_data.get("worker_pool", {}) or {}).get("max_total_threads", 0)
+    if max_total_threads and not _is_enabled(config_data.get("process_mode")):
+        minimum_threads = sum(
+            system_config.autoscale.get("min_processing_threads", 1) if system_config.autoscale is not None
+            else system_config.max_processing_threads
+            for system_config in systems.values() if system_config.worker_pool.get("shared", 0) != 1)
+        if minimum_threads > max_total_threads:
+            errors.append(f"worker_pool max_total_threads {max_total_threads} is below the {minimum_threads} "
+                          f"threads the systems need at minimum (max_processing_threads, or "
+                          f"min_processing_threads with autoscale)")
+
+    # Each process mode worker has its own duplicate index, so copies recorded by different systems would never
+    # be compared.
+    if _is_enabled(config_data.get("process_mode")):
+        detecting_systems = sorted(
+            name for name, system_config_data in config_data["systems"].items()
+            if isinstance(system_config_data, dict) and _is_enabled(system_config_data.get("duplicate_detection")))
+        if len(detecting_systems) > 1:
+            errors.append(f"duplicate_detection can only be enabled on one system with process_mode, found: "
+                          f"{', '.join(detecting_systems)}")
 
-    # Determine the appropriate talkgroup configuration
-    if talkgroup_dec > 0 and talkgroup_config:
-        talkgroup_dec_str = str(talkgroup_dec)
-        talkgroup_config_data = talkgroup_config.get(talkgroup_dec_str) or talkgroup_config.get("*", {})
+    if errors:
+        raise ConfigError("; ".join(errors))
 
-    return talkgroup_config_data
+    return systems
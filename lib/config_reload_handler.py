@@ -0,0 +1,110 @@
+import json
+import logging
+import os
+import threading
+
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+
+from lib.config_handler import compile_config, ConfigError
+
+module_logger = logging.getLogger('rtl_watcher.config_reload')
+
+
+class ConfigFileEventHandler(FileSystemEventHandler):
+    def __init__(self, reloader):
+        self.reloader = reloader
+
+    def on_created(self, event):
+        self._process_event(event, event.src_path)
+
+    def on_modified(self, event):
+        self._process_event(event, event.src_path)
+
+    def on_moved(self, event):
+        # Editors commonly save by writing a temporary file and renaming it over the original.
+        self._process_event(event, event.dest_path)
+
+    def _process_event(self, event, event_path):
+        if not event.is_directory and os.path.abspath(event_path) in self.reloader.watched_files:
+            module_logger.debug(f"Configuration file changed: {event_path}")
+            self.reloader.schedule_reload()
+
+
+class ConfigReloader:
+    """
+    Watches config.json and every system talkgroup CSV and rebuilds the configuration snapshot when one changes.
+
+    A new snapshot is only handed to on_reload after it validates, so a bad edit leaves the running config in place.
+    """
+
+    def __init__(self, config_file_path, on_reload, system_names=None, debounce_seconds=1.0):
+        self.config_file_path = os.path.abspath(config_file_path)
+        self.system_names = system_names
+        self.on_reload = on_reload
+        self.debounce_seconds = debounce_seconds
+        self.observer = Observer()
+        self.event_handler = ConfigFileEventHandler(self)
+        self.watched_files = frozenset()
+        self.watched_directories = {}
+        self.timer = None
+        self.lock = threading.Lock()
+
+    def start(self, config_data):
+        self._update_watched_files(config_data)
+        self.observer.start()
+        module_logger.info(f"Watching {len(self.watched_files)} configuration files for changes.")
+
+    def stop(self):
+        with self.lock:
+            if self.timer:
+                self.timer.cancel()
+        self.observer.stop()
+        self.observer.join()
+
+    def schedule_reload(self):
+        # Coalesce the burst of events a single save produces into one reload.
+        with self.lock:
+            if self.timer:
+                self.timer.cancel()
+            self.timer = threading.Timer(self.debounce_seconds, self.reload)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def reload(self):
+        try:
+            with open(self.config_file_path, 'r') as f:
+                config_data = json.load(f)
+            system_configs = compile_config(config_data, self.system_names)
+        except (OSError, json.JSONDecodeError) as e:
+            module_logger.error(f"<<Reload>> <<failed>> could not read {self.config_file_path}: {e}")
+            return
+        except ConfigError as e:
+            module_logger.error(f"<<Reload>> <<failed>> configuration is invalid, keeping current configuration: {e}")
+            return
+
+        module_logger.info(f"<<Reloaded>> <<configuration>> for {len(system_configs)} systems")
+        self._update_watched_files(config_data)
+
+        try:
+            self.on_reload(config_data, system_configs)
+        except Exception as e:
+            module_logger.error(f"<<Unexpected>> <<error>> applying reloaded configuration: {e}", exc_info=True)
+
+    def _update_watched_files(self, config_data):
+        watched_files = {self.config_file_path}
+        for system_name, system_config_data in (config_data.get("systems") or {}).items():
+            if self.system_names is not None and system_name not in self.system_names:
+                continue
+            if isinstance(system_config_data, dict) and system_config_data.get("talkgroup_csv_path"):
+                watched_files.add(os.path.abspath(system_config_data["talkgroup_csv_path"]))
+        self.watched_files = frozenset(watched_files)
+
+        directories = {os.path.dirname(path) for path in watched_files}
+        for directory in list(self.watched_directories):
+            if directory not in directories:
+                self.observer.unschedule(self.watched_directories.pop(directory))
+        for directory in directories:
+            if directory not in self.watched_directories and os.path.isdir(directory):
+                self.watched_directories[directory] = self.observer.schedule(self.event_handler, directory,
+                                                                             recursive=False)
@@ -0,0 +1,180 @@
+import logging
+import subprocess
+import threading
+import time
+
+module_logger = logging.getLogger('rtl_watcher.duplicate_detect')
+
+
+def decode_pcm(audio_file_path, sample_rate=8000):
+    """
+    Decodes an audio file to mono 16 bit PCM at sample_rate using ffmpeg.
+    """
+    import numpy as np
+
+    command = ["ffmpeg", "-v", "error", "-i", audio_file_path, "-ac", "1", "-ar", str(sample_rate), "-f", "s16le",
+               "-"]
+    result = subprocess.run(command, capture_output=True, check=True)
+    return np.frombuffer(result.stdout, dtype=np.int16)
+
+
+def compute_fingerprint(samples, sample_rate=8000, frame_ms=50):
+    """
+    Builds an energy envelope fingerprint: one bit per frame, set when the frame is louder than the previous one.
+
+    The envelope shape survives the different gains, noise floors and codecs of separate recorders.
+    """
+    import numpy as np
+
+    frame_size = int(sample_rate * frame_ms / 1000)
+    frame_count = len(samples) // frame_size
+    if frame_count < 2:
+        return None
+
+    frames = samples[:frame_count * frame_size].astype(np.float32).reshape(frame_count, frame_size)
+    energy = np.log10(np.mean(frames * frames, axis=1) + 1.0)
+    return np.diff(energy) > 0
+
+
+def fingerprint_distance(fingerprint_a, fingerprint_b, max_offset=10, min_overlap=20):
+    """
+    Returns the lowest bit error rate between two fingerprints over alignments of +/- max_offset frames.
+    """
+    import numpy as np
+
+    best = 1.0
+    for offset in range(-max_offset, max_offset + 1):
+        if offset >= 0:
+            a, b = fingerprint_a[offset:], fingerprint_b
+        else:
+            a, b = fingerprint_a, fingerprint_b[-offset:]
+        overlap = min(len(a), len(b))
+        if overlap < min_overlap:
+            continue
+        best = min(best, float(np.count_nonzero(a[:overlap] != b[:overlap])) / overlap)
+    return best
+
+
+class DuplicateCallEntry:
+    __slots__ = ("system_name", "mp3_file_path", "start_time", "duration", "fingerprint", "registered_at", "completed",
+                 "settled")
+
+    def __init__(self, system_name, mp3_file_path, start_time, duration, fingerprint):
+        self.system_name = system_name
+        self.mp3_file_path = mp3_file_path
+        self.start_time = start_time
+        self.duration = duration
+        self.fingerprint = fingerprint
+        self.registered_at = time.monotonic()
+        # Set once the call has been processed, or has failed and left the index.
+        self.completed = False
+        self.settled = threading.Event()
+
+
+class DuplicateCallIndex:
+    """
+    Time windowed index of recent call fingerprints keyed by frequency, shared by every system in the process so
+    copies from different recorders are matched.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def _prune(self, window_seconds):
+        cutoff = time.monotonic() - window_seconds
+        for frequency in list(self.calls):
+            entries = [entry for entry in self.calls[frequency] if entry.registered_at >= cutoff]
+            if entries:
+                self.calls[frequency] = entries
+            else:
+                del self.calls[frequency]
+
+    def check_and_register(self, entry, frequency, detect_config):
+        """
+        Returns the earlier entry this call duplicates, or registers the call and returns None.
+
+        Matching and registering happen under one lock so two copies processed at once can't both pass. A call
+        processed again from the same path, such as one resumed from the journal, replaces its own entry rather
+        than matching it.
+        """
+        window_seconds = detect_config.get("window_seconds", 30)
+        start_tolerance = detect_config.get("start_tolerance", 2)
+        duration_tolerance = detect_config.get("duration_tolerance", 1.0)
+        max_distance = detect_config.get("max_distance", 0.2)
+
+        with self.lock:
+            self._prune(window_seconds)
+            for candidate in self.calls.get(frequency, []):
+                if candidate.mp3_file_path == entry.mp3_file_path:
+                    continue
+                if abs(candidate.start_time - entry.start_time) > start_tolerance:
+                    continue
+                if abs(candidate.duration - entry.duration) > duration_tolerance:
+                    continue
+                distance = fingerprint_distance(candidate.fingerprint, entry.fingerprint)
+                if distance <= max_distance:
+                    module_logger.debug(f"Fingerprint distance {distance:.3f} to {candidate.mp3_file_path}")
+                    return candidate
+
+            entries = [candidate for candidate in self.calls.get(frequency, [])
+                       if candidate.mp3_file_path != entry.mp3_file_path]
+            entries.append(entry)
+            self.calls[frequency] = entries
+            return None
+
+    def settle(self, mp3_file_path, completed):
+        """
+        Records the outcome of a registered call. Failed calls leave the index so another copy can take their place.
+        """
+        with self.lock:
+            for frequency in list(self.calls):
+                entries = self.calls[frequency]
+                for entry in entries:
+                    if entry.mp3_file_path != mp3_file_path:
+                        continue
+                    entry.completed = completed
+                    entry.settled.set()
+                    if not completed:
+                        entries.remove(entry)
+                        if not entries:
+                            del self.calls[frequency]
+                    return
+
+
+duplicate_call_index = DuplicateCallIndex()
+
+
+def find_duplicate_call(detect_config, system_name, mp3_file_path, frequency, start_time, duration):
+    """
+    Fingerprints a call and checks it against recent calls on the same frequency.
+
+    Returns the matching DuplicateCallEntry, or None when the call is unique or can't be fingerprinted.
+    """
+    sample_rate = detect_config.get("sample_rate", 8000)
+    try:
+        samples = decode_pcm(mp3_file_path, sample_rate)
+    except (subprocess.CalledProcessError, OSError) as e:
+        module_logger.warning(f"<<Duplicate>> <<detection>> unable to decode {mp3_file_path}: {e}")
+        return None
+
+    fingerprint = compute_fingerprint(samples, sample_rate)
+    if fingerprint is None:
+        return None
+
+    entry = DuplicateCallEntry(system_name, mp3_file_path, start_time, duration, fingerprint)
+    while True:
+        duplicate = duplicate_call_index.check_and_register(entry, int(frequency), detect_config)
+        if duplicate is None or duplicate.completed:
+            return duplicate
+        # The earlier copy is still being processed, this one is only dropped once that copy has made it through.
+        if not duplicate.settled.wait(detect_config.get("window_seconds", 30)):
+            module_logger.warning(f"<<Duplicate>> <<detection>> {duplicate.mp3_file_path} is still processing, "
+                                  f"keeping {mp3_file_path}")
+            return None
+        if duplicate.completed:
+            return duplicate
+
+
+def settle_duplicate_call(mp3_file_path, completed):
+    duplicate_call_index.settle(mp3_file_path, completed)
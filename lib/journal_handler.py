@@ -0,0 +1,239 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+module_logger = logging.getLogger('rtl_watcher.journal')
+
+
+def _journal_payload(result):
+    """
+    Returns a stage result in a form the journal can store, True when the result is not JSON serializable.
+    """
+    try:
+        json.dumps(result)
+        return result
+    except (TypeError, ValueError):
+        return True
+
+
+class JournalEntry:
+    """
+    Journal state for one call: the stages that already finished, with their results.
+    """
+
+    def __init__(self, journal, call_key, completed=None):
+        self.journal = journal
+        self.call_key = call_key
+        self.completed = completed or {}
+        self.lock = threading.Lock()
+
+    def run(self, stage_name, target, *args, succeeded=bool):
+        """
+        Runs a stage unless it completed before a restart, in which case its recorded result is returned.
+
+        Results for which succeeded() is false are not recorded, so failed stages run again on resume.
+        """
+        with self.lock:
+            if stage_name in self.completed:
+                module_logger.info(f"<<Journal>> {stage_name} already completed for {self.call_key}, skipping")
+                return self.completed[stage_name]
+
+        result = target(*args)
+        if succeeded(result):
+            self.complete(stage_name, result)
+        return result
+
+    def has_completed(self, stage_name):
+        with self.lock:
+            return stage_name in self.completed
+
+    def complete(self, stage_name, result=True):
+        payload = _journal_payload(result)
+        with self.lock:
+            self.completed[stage_name] = payload
+        self.journal.append({"call": self.call_key, "stage": stage_name, "result": payload})
+
+    def finish(self):
+        self.journal.finish(self)
+
+
+class CallJournal:
+    """
+    Append-only journal of call progress for one system.
+
+    Every call writes a start record, one record per finished stage and a done record once its files are
+    finalized. Records are written by a single thread that fsyncs once per batch, so a burst of stage completions
+    costs one fsync every fsync_interval_ms rather than one each. Calls without a done record were interrupted;
+    they are resumed on the next start and stages already recorded are skipped. The file is compacted down to the
+    unfinished calls when it is opened and whenever it grows past compact_bytes.
+    """
+
+    def __init__(self, journal_path, fsync_interval_ms=100, compact_bytes=4 * 1024 * 1024):
+        self.journal_path = journal_path
+        self.fsync_interval = fsync_interval_ms / 1000
+        self.compact_bytes = compact_bytes
+        self.lock = threading.Lock()
+        self.active = {}
+        self.interrupted = self._load()
+        self.records = queue.Queue()
+
+        os.makedirs(os.path.dirname(journal_path) or ".", exist_ok=True)
+        self._compact(list(self.interrupted.values()))
+        self.journal_file = open(self.journal_path, "a", encoding="utf-8")
+        self.writer = threading.Thread(target=self._write_records, name="call-journal", daemon=True)
+        self.writer.start()
+
+    def _load(self):
+        interrupted = {}
+        try:
+            with open(self.journal_path, "r", encoding="utf-8") as journal_file:
+                for line in journal_file:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A torn final line from a crash mid-write.
+                        continue
+                    call_key = record.get("call")
+                    if "start" in record:
+                        # Compaction can repeat a start record, which must not lose the stages before it.
+                        interrupted.setdefault(call_key, JournalEntry(self, call_key))
+                    elif "stage" in record and call_key in interrupted:
+                        interrupted[call_key].completed[record["stage"]] = record.get("result")
+                    elif "done" in record:
+                        interrupted.pop(call_key, None)
+        except FileNotFoundError:
+            pass
+        if interrupted:
+            module_logger.warning(f"<<Journal>> {len(interrupted)} interrupted calls found in {self.journal_path}")
+        return interrupted
+
+    def interrupted_calls(self):
+        """
+        Returns the calls interrupted by the last shutdown that still have audio to resume from, dropping the rest.
+        """
+        with self.lock:
+            call_keys = list(self.interrupted)
+        resumable = []
+        for call_key in call_keys:
+            if os.path.exists(call_key):
+                resumable.append(call_key)
+            else:
+                module_logger.warning(f"<<Journal>> interrupted call {call_key} no longer exists, dropping it")
+                with self.lock:
+                    entry = self.interrupted.pop(call_key, None)
+                if entry is not None:
+                    self.append({"call": call_key, "done": time.time()})
+        return resumable
+
+    def begin(self, call_key):
+        """
+        Starts journaling a call, returning its JournalEntry, or None when the call is already being processed.
+
+        A call interrupted by the last shutdown gets back the stages it had completed.
+        """
+        with self.lock:
+            if call_key in self.active:
+                return None
+            entry = self.interrupted.pop(call_key, None)
+            resumed = entry is not None
+            if entry is None:
+                entry = JournalEntry(self, call_key)
+            self.active[call_key] = entry
+        if resumed:
+            module_logger.info(f"<<Journal>> resuming {call_key}, completed: {', '.join(entry.completed) or 'none'}")
+        else:
+            self.append({"call": call_key, "start": time.time()})
+        return entry
+
+    def finish(self, entry):
+        with self.lock:
+            self.active.pop(entry.call_key, None)
+        self.append({"call": entry.call_key, "done": time.time()})
+
+    def append(self, record):
+        self.records.put(record)
+
+    def flush(self):
+        """
+        Blocks until every record appended so far is on disk.
+        """
+        synced = threading.Event()
+        self.records.put(synced)
+        synced.wait()
+
+    def _write_records(self):
+        while True:
+            batch = [self.records.get()]
+            deadline = time.monotonic() + self.fsync_interval
+            while time.monotonic() < deadline:
+                try:
+                    batch.append(self.records.get(timeout=deadline - time.monotonic()))
+                except (queue.Empty, ValueError):
+                    break
+
+            waiters = []
+            try:
+                for record in batch:
+                    if isinstance(record, threading.Event):
+                        waiters.append(record)
+                    else:
+                        self.journal_file.write(json.dumps(record, separators=(",", ":")) + "\n")
+                self.journal_file.flush()
+                os.fsync(self.journal_file.fileno())
+
+                if self.journal_file.tell() > self.compact_bytes:
+                    with self.lock:
+                        entries = list(self.active.values()) + list(self.interrupted.values())
+                    self.journal_file.close()
+                    self._compact(entries)
+                    self.journal_file = open(self.journal_path, "a", encoding="utf-8")
+            except Exception as e:
+                module_logger.error(f"<<Journal>> failed writing {self.journal_path}: {e}")
+            finally:
+                for waiter in waiters:
+                    waiter.set()
+
+    def _compact(self, entries):
+        """
+        Rewrites the journal with only the given unfinished calls, atomically replacing the old file.
+        """
+        temporary_path = f"{self.journal_path}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as journal_file:
+            for entry in entries:
+                with entry.lock:
+                    completed = dict(entry.completed)
+                journal_file.write(json.dumps({"call": entry.call_key, "start": time.time()}, separators=(",", ":"))
+                                   + "\n")
+                for stage_name, result in completed.items():
+                    journal_file.write(json.dumps({"call": entry.call_key, "stage": stage_name, "result": result},
+                                                  separators=(",", ":")) + "\n")
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+        os.replace(temporary_path, self.journal_path)
+
+
+_call_journals = {}
+_call_journals_lock = threading.Lock()
+
+
+def get_call_journal(journal_config, system_name):
+    """
+    Returns the process wide CallJournal for a system, one file per system so worker processes never share one.
+    """
+    journal_path = os.path.abspath(os.path.join(journal_config.get("directory", "var/journal"),
+                                                f"{system_name}.journal"))
+    with _call_journals_lock:
+        if journal_path not in _call_journals:
+            _call_journals[journal_path] = CallJournal(journal_path, journal_config.get("fsync_interval_ms", 100),
+                                                       journal_config.get("compact_bytes", 4 * 1024 * 1024))
+        return _call_journals[journal_path]
+
+
+def flush_call_journals():
+    with _call_journals_lock:
+        call_journals = list(_call_journals.values())
+    for call_journal in call_journals:
+        call_journal.flush()
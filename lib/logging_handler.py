@@ -3,6 +3,11 @@ from colorama import Fore, Style
 import datetime
 
 
+def get_log_level(log_level):
+    return {1: logging.DEBUG, 2: logging.INFO, 3: logging.WARNING, 4: logging.ERROR, 5: logging.CRITICAL}.get(
+        log_level, logging.INFO)
+
+
 class ColoredFormatter(logging.Formatter):
     COLOR_CODES = {
         logging.DEBUG: Fore.CYAN,
@@ -72,9 +77,7 @@ class CustomLogger:
             return
 
         self.logger = logging.getLogger(logger_name)
-        self.logger.setLevel(
-            {1: logging.DEBUG, 2: logging.INFO, 3: logging.WARNING, 4: logging.ERROR, 5: logging.CRITICAL}.get(
-                log_level, logging.INFO))
+        self.logger.setLevel(get_log_level(log_level))
 
         console_handler = logging.StreamHandler()
         file_handler = logging.FileHandler(log_path)
@@ -89,8 +92,7 @@ class CustomLogger:
         self.is_initialized = True
 
     def set_log_level(self, log_level):
-        level = {1: logging.DEBUG, 2: logging.INFO, 3: logging.WARNING, 4: logging.ERROR, 5: logging.CRITICAL}.get(
-            log_level, logging.INFO)
+        level = get_log_level(log_level)
         self.logger.setLevel(level)
         for handler in self.logger.handlers:
             handler.setLevel(level)
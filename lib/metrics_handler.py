@@ -0,0 +1,103 @@
+import logging
+import threading
+
+module_logger = logging.getLogger('rtl_watcher.metrics')
+
+# Weight of the newest sample in the recent averages, so they follow the last few dozen calls.
+RECENT_WEIGHT = 0.2
+
+
+class Metrics:
+    """
+    Thread safe per-system call and stage counters.
+
+    Snapshots are plain dicts so they can be sent between processes and merged by the supervisor. Alongside the
+    lifetime totals, exponentially weighted recent averages of call and stage times follow the current load.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.stages = {}
+        self.recent_calls = {}
+        self.recent_stages = {}
+
+    def record_call(self, system_name, elapsed_seconds, completed):
+        with self.lock:
+            call_stats = self.calls.setdefault(system_name, {"completed": 0, "failed": 0, "seconds": 0.0})
+            call_stats["completed" if completed else "failed"] += 1
+            call_stats["seconds"] += elapsed_seconds
+            self.recent_calls[system_name] = self._weigh(self.recent_calls.get(system_name), elapsed_seconds)
+
+    def record_stage(self, system_name, stage_name, elapsed_seconds):
+        with self.lock:
+            stage_stats = self.stages.setdefault(system_name, {}).setdefault(stage_name,
+                                                                             {"count": 0, "seconds": 0.0})
+            stage_stats["count"] += 1
+            stage_stats["seconds"] += elapsed_seconds
+            recent_stages = self.recent_stages.setdefault(system_name, {})
+            recent_stages[stage_name] = self._weigh(recent_stages.get(stage_name), elapsed_seconds)
+
+    @staticmethod
+    def _weigh(average, elapsed_seconds):
+        return elapsed_seconds if average is None else average + RECENT_WEIGHT * (elapsed_seconds - average)
+
+    def call_average(self, system_name):
+        with self.lock:
+            call_stats = self.calls.get(system_name)
+            if not call_stats:
+                return None
+            total_calls = call_stats["completed"] + call_stats["failed"]
+            return call_stats["seconds"] / total_calls if total_calls else None
+
+    def stage_average(self, system_name, stage_name):
+        with self.lock:
+            stage_stats = self.stages.get(system_name, {}).get(stage_name)
+            if not stage_stats or not stage_stats["count"]:
+                return None
+            return stage_stats["seconds"] / stage_stats["count"]
+
+    def recent_call_average(self, system_name):
+        with self.lock:
+            return self.recent_calls.get(system_name)
+
+    def recent_stage_averages(self, system_name):
+        with self.lock:
+            return dict(self.recent_stages.get(system_name, {}))
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "calls": {system: dict(stats) for system, stats in self.calls.items()},
+                "stages": {system: {stage: dict(stats) for stage, stats in stages.items()}
+                           for system, stages in self.stages.items()}
+            }
+
+
+def merge_snapshots(snapshots):
+    """
+    Sums a list of Metrics snapshots into a single snapshot.
+    """
+    merged = Metrics()
+    for snapshot in snapshots:
+        for system, stats in snapshot.get("calls", {}).items():
+            call_stats = merged.calls.setdefault(system, {"completed": 0, "failed": 0, "seconds": 0.0})
+            for key in call_stats:
+                call_stats[key] += stats.get(key, 0)
+        for system, stages in snapshot.get("stages", {}).items():
+            for stage, stats in stages.items():
+                stage_stats = merged.stages.setdefault(system, {}).setdefault(stage, {"count": 0, "seconds": 0.0})
+                for key in stage_stats:
+                    stage_stats[key] += stats.get(key, 0)
+    return merged.snapshot()
+
+
+def log_snapshot(snapshot):
+    for system, stats in sorted(snapshot.get("calls", {}).items()):
+        total_calls = stats["completed"] + stats["failed"]
+        average = stats["seconds"] / total_calls if total_calls else 0
+        module_logger.info(
+            f"<<Metrics>> {system}: {stats['completed']} completed, {stats['failed']} failed, {average:.2f}s average")
+
+
+metrics = Metrics()
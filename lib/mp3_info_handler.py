@@ -0,0 +1,214 @@
+import os
+import re
+import struct
+
+# Enough for any ID3 header, the first frame header and its Xing/Info/VBRI header with a LAME tag.
+HEADER_READ_BYTES = 4096
+
+# Bitrates in kbps by (MPEG version, layer), MPEG 2.5 uses the MPEG 2 tables.
+BITRATES = {
+    (1, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (1, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (1, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (2, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (2, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+BITRATES[(2, 3)] = BITRATES[(2, 2)]
+
+SAMPLE_RATES = {
+    1: (44100, 48000, 32000),
+    2: (22050, 24000, 16000),
+    2.5: (11025, 12000, 8000)
+}
+
+MPEG_VERSIONS = (2.5, None, 2, 1)
+MONO = 3
+
+LAME_VERSION = re.compile(rb"(?:LAME|L)(\d)\.*(\d+)")
+
+
+class FrameHeader:
+    __slots__ = ("version", "layer", "bitrate", "sample_rate", "mode", "samples_per_frame", "frame_length")
+
+    def __init__(self, version, layer, bitrate, sample_rate, padding, mode):
+        self.version = version
+        self.layer = layer
+        self.bitrate = bitrate
+        self.sample_rate = sample_rate
+        self.mode = mode
+        if layer == 1:
+            self.samples_per_frame, slot = 384, 4
+        elif version != 1 and layer == 3:
+            self.samples_per_frame, slot = 576, 1
+        else:
+            self.samples_per_frame, slot = 1152, 1
+        self.frame_length = ((self.samples_per_frame // 8 * bitrate) // sample_rate + padding) * slot
+
+
+def parse_frame_header(data):
+    """
+    Returns the FrameHeader for the four bytes of an MPEG audio frame header, or None if they are not one.
+    """
+    if len(data) < 4:
+        return None
+    header = struct.unpack(">I", data[:4])[0]
+    if header >> 21 != 0x7ff:
+        return None
+    version_bits = (header >> 19) & 0x3
+    layer_bits = (header >> 17) & 0x3
+    bitrate_index = (header >> 12) & 0xf
+    sample_rate_index = (header >> 10) & 0x3
+    if version_bits == 1 or layer_bits == 0 or sample_rate_index == 3 or bitrate_index in (0, 0xf):
+        return None
+
+    version = MPEG_VERSIONS[version_bits]
+    layer = 4 - layer_bits
+    bitrate = BITRATES[(1 if version == 1 else 2, layer)][bitrate_index] * 1000
+    return FrameHeader(version, layer, bitrate, SAMPLE_RATES[version][sample_rate_index], (header >> 9) & 0x1,
+                       (header >> 6) & 0x3)
+
+
+def _xing_duration(block, frame_start, frame):
+    """
+    Returns the duration from a Xing/Info header in the first frame, -1 when it has no frame count or None when
+    there is no header. Raises ValueError for a LAME tag that cannot be read reliably.
+    """
+    if frame.version == 1:
+        offset = frame_start + (21 if frame.mode == MONO else 36)
+    else:
+        offset = frame_start + (13 if frame.mode == MONO else 21)
+    if block[offset:offset + 4] not in (b"Xing", b"Info") or len(block) < offset + 8:
+        return None
+
+    flags = struct.unpack(">I", block[offset + 4:offset + 8])[0]
+    position = offset + 8
+    frame_count = -1
+    if flags & 0x1:
+        frame_count = struct.unpack(">I", block[position:position + 4])[0]
+        position += 4
+    if flags & 0x2:
+        position += 4
+    if flags & 0x4:
+        position += 100
+    if flags & 0x8:
+        position += 4
+    if frame_count == -1:
+        return -1
+
+    samples = frame.samples_per_frame * frame_count
+    lame_tag = block[position:position + 36]
+    if lame_tag.startswith((b"LAME", b"L3.99")):
+        match = LAME_VERSION.match(lame_tag)
+        if match is None or len(lame_tag) < 36:
+            raise ValueError("truncated LAME tag")
+        lame_version = (int(match.group(1)), int(match.group(2)))
+        if lame_version == (3, 90):
+            # 3.90 alpha builds may or may not write the extended tag.
+            raise ValueError("ambiguous LAME 3.90 tag")
+        if lame_version > (3, 90) and lame_tag[9] >> 4 == 0:
+            encoder_delay = (lame_tag[21] << 4) | (lame_tag[22] >> 4)
+            encoder_padding = ((lame_tag[22] & 0x0f) << 8) | lame_tag[23]
+            samples = max(0, samples - encoder_delay - encoder_padding)
+    return samples / frame.sample_rate
+
+
+def _vbri_duration(block, frame_start, frame):
+    """
+    Returns the duration from a version 1 VBRI header in the first frame, or None when there is none.
+    """
+    offset = frame_start + 36
+    if block[offset:offset + 4] != b"VBRI" or len(block) < offset + 26:
+        return None
+    version, frame_count, toc_entries, toc_entry_size = struct.unpack(">H8xIH2xH2x", block[offset + 4:offset + 26])
+    if version != 1 or toc_entry_size not in (2, 4):
+        return None
+    if offset + 26 + toc_entries * toc_entry_size > len(block):
+        raise ValueError("VBRI table of contents past the header block")
+    return frame.samples_per_frame * frame_count / frame.sample_rate
+
+
+def read_mp3_duration(mp3_file_path):
+    """
+    Returns the duration of an MP3 in seconds from its headers alone, or None when the file needs a full parse.
+    Raises ValueError for headers it will not guess at.
+
+    ID3v2 tags are skipped, then the first frame header is read along with any Xing/Info (less the LAME encoder
+    delay and padding) or VBRI header. Without one, the stream is taken as CBR and timed from the file size after
+    checking the second frame header agrees with the first. Durations match mutagen's MP3 info.length.
+    """
+    with open(mp3_file_path, "rb") as mp3_file:
+        file_size = os.fstat(mp3_file.fileno()).st_size
+        audio_start = 0
+        block = mp3_file.read(HEADER_READ_BYTES)
+
+        # Some taggers write more than one ID3v2 tag, skip them all.
+        while block[:3] == b"ID3" and len(block) >= 10:
+            tag_size = (block[6] & 0x7f) << 21 | (block[7] & 0x7f) << 14 | (block[8] & 0x7f) << 7 | (block[9] & 0x7f)
+            if tag_size == 0:
+                break
+            audio_start += 10 + tag_size + (10 if block[5] & 0x10 else 0)
+            mp3_file.seek(audio_start)
+            block = mp3_file.read(HEADER_READ_BYTES)
+
+        frame = parse_frame_header(block[:4])
+        if frame is None:
+            return None
+
+        if frame.layer == 3:
+            duration = _xing_duration(block, 0, frame)
+            if duration is None:
+                duration = _vbri_duration(block, 0, frame)
+            elif duration == -1:
+                duration = None
+            if duration is not None:
+                return duration
+
+        if frame.frame_length + 4 <= len(block):
+            next_header = block[frame.frame_length:frame.frame_length + 4]
+        else:
+            mp3_file.seek(audio_start + frame.frame_length)
+            next_header = mp3_file.read(4)
+
+    next_frame = parse_frame_header(next_header)
+    if next_frame is None or (next_frame.version, next_frame.layer, next_frame.sample_rate) != \
+            (frame.version, frame.layer, frame.sample_rate):
+        return None
+    return 8 * (file_size - audio_start) / frame.bitrate
+
+
+if __name__ == "__main__":
+    # Microbenchmark: python -m lib.mp3_info_handler [--iterations N] call.mp3 ...
+    import argparse
+    import tempfile
+    import timeit
+
+    from mutagen.mp3 import MP3
+
+    from lib.audio_file_handler import parse_call_file_name, parse_call_file_name_strptime
+
+    parser = argparse.ArgumentParser(description="Compare the MP3 header parser with mutagen.")
+    parser.add_argument("files", nargs="*", help="MP3 files to time, a generated CBR call is used without any.")
+    parser.add_argument("--iterations", type=int, default=2000, help="Iterations per file.")
+    args = parser.parse_args()
+
+    mp3_file_paths = args.files
+    if not mp3_file_paths:
+        # 30 seconds of silent 32 kbps 16 kHz mono MPEG 2 layer III frames, as trunk-recorder writes them.
+        frame_header = struct.pack(">I", 0xfff3_4800 | (MONO << 6))
+        frame_bytes = frame_header + bytes(parse_frame_header(frame_header).frame_length - 4)
+        mp3_file_path = os.path.join(tempfile.mkdtemp(), "example_20240101_120000_851012500.mp3")
+        with open(mp3_file_path, "wb") as mp3_file:
+            mp3_file.write(frame_bytes * int(30 * 16000 / 576))
+        mp3_file_paths = [mp3_file_path]
+
+    for mp3_file_path in mp3_file_paths:
+        mp3_file_name = os.path.basename(mp3_file_path)
+        fast_duration = read_mp3_duration(mp3_file_path)
+        mutagen_duration = MP3(mp3_file_path).info.length
+        print(f"{mp3_file_name}: header {fast_duration} s, mutagen {mutagen_duration} s")
+        for label, statement in (("duration (header)", lambda: read_mp3_duration(mp3_file_path)),
+                                 ("duration (mutagen)", lambda: MP3(mp3_file_path).info.length),
+                                 ("file name (pattern)", lambda: parse_call_file_name(mp3_file_name)),
+                                 ("file name (strptime)", lambda: parse_call_file_name_strptime(mp3_file_name))):
+            seconds = timeit.timeit(statement, number=args.iterations)
+            print(f"  {label:<22} {seconds / args.iterations * 1e6:>9.1f} us")
@@ -1,25 +1,61 @@
 from datetime import datetime, timezone, timedelta
+import errno
+import json
 import logging
 import mimetypes
 import os
 import shutil
+import threading
 import time
 import traceback
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+from functools import lru_cache
 from stat import S_ISDIR
 from contextlib import contextmanager
-from google.cloud import storage
-from google.cloud.exceptions import GoogleCloudError
 from urllib.parse import urljoin, quote
 
-import boto3
-from botocore.exceptions import ClientError, NoCredentialsError, ParamValidationError
-
-from paramiko import SSHClient, AutoAddPolicy, RSAKey, SSHException
+from lib.retention_handler import clean_archive, get_retention_index
 
 module_logger = logging.getLogger('rtl_watcher.file_storage')
 
+# Client libraries are imported by each backend when it is used, so deployments only load the ones they configure.
+ARCHIVE_BACKEND_MODULES = {
+    "google_cloud": ("google.cloud.storage", "google.cloud.storage.transfer_manager"),
+    "aws_s3": ("boto3", "boto3.s3.transfer"),
+    "scp": ("paramiko",),
+    "local": (),
+}
+
+# Linux ioctl that shares a file's extents with another file (btrfs, XFS, bcachefs).
+FICLONE = 0x40049409
+
+
+_archive_classes = {}
+_archive_classes_lock = threading.Lock()
+
 
 def get_archive_class(archive_config):
+    """
+    Returns the storage backend for an archive configuration.
+
+    Backends are shared by every call using the same archive configuration so connections, caches and the
+    retention index are reused; a reloaded configuration gets a fresh backend.
+    """
+    archive_key = json.dumps(archive_config, sort_keys=True)
+    with _archive_classes_lock:
+        if archive_key not in _archive_classes:
+            archive_class = _create_archive_class(archive_config)
+            if archive_class is None:
+                return None
+            archive_class.configure_retention(archive_config)
+            _archive_classes[archive_key] = archive_class
+        return _archive_classes[archive_key]
+
+
+def _create_archive_class(archive_config):
     if archive_config.get("archive_type") == 'scp':
         return SCPStorage(archive_config.get('scp'))
     elif archive_config.get("archive_type") == 'google_cloud':
@@ -33,13 +69,128 @@ def get_archive_class(archive_config):
         return None
 
 
-class GoogleCloudStorage:
+def parent_directories(object_key, prefix):
+    """
+    Returns the directories between an object and the retention prefix, deepest first, excluding the prefix itself.
+    Only the object's own directory is returned when it is not under the prefix.
+    """
+    root = prefix.rstrip("/") if prefix else ""
+    directory = os.path.dirname(object_key)
+    directories = [directory]
+    while root and directory.startswith(root + "/"):
+        directory = os.path.dirname(directory)
+        if directory == root:
+            break
+        directories.append(directory)
+    return directories
+
+
+@lru_cache(maxsize=None)
+def get_content_type(extension):
+    """Returns the MIME type for a file extension, looked up once per extension."""
+    mime_type, _ = mimetypes.guess_type(f"file{extension}")
+    return mime_type or 'application/octet-stream'
+
+
+class DirectoryCache:
+    """
+    Thread-safe set of destination directories known to exist.
+
+    Archive folders only change once a day per system, so after the first upload into a folder the existence
+    checks are skipped entirely. Anything that removes a directory must discard it here.
+    """
+
+    def __init__(self):
+        self._directories = set()
+        self._lock = threading.Lock()
+
+    def __contains__(self, directory):
+        with self._lock:
+            return directory in self._directories
+
+    def add(self, directory):
+        with self._lock:
+            self._directories.add(directory)
+
+    def discard(self, directory):
+        """Forgets a directory along with everything cached beneath it."""
+        prefix = directory.rstrip("/") + "/"
+        with self._lock:
+            self._directories = {cached for cached in self._directories
+                                 if cached != directory and not cached.startswith(prefix)}
+
+
+class ArchiveStorage:
+    """
+    Retention handling shared by every storage backend.
+
+    Backends implement upload_file, delete_objects (bulk delete of keys under a prefix, returning the keys that
+    are gone) and reconcile_files (the full listing cleanup).
+    """
+    backend_name = None
+    location = ""
+    base_url = ""
+    retention_index = None
+    clean_interval_seconds = 600
+    reconcile_hours = 24
+    blob_root = None
+
+    def configure_retention(self, archive_config):
+        self.retention_index = get_retention_index(archive_config.get("retention_database_path", ""))
+        self.clean_interval_seconds = archive_config.get("clean_interval_minutes", 10) * 60
+        self.reconcile_hours = archive_config.get("reconcile_hours", 24)
+        if archive_config.get("content_addressed", 0) == 1:
+            self.blob_root = os.path.join(archive_config.get("archive_path", ""), "blobs") + "/"
+
+    def record_upload(self, object_key):
+        if self.retention_index is None:
+            return
+        # Blobs are reference counted rather than aged out, so they are tracked apart from dated objects.
+        if self.blob_root is not None and object_key.startswith(self.blob_root):
+            self.retention_index.record_blob(self.backend_name, self.location, object_key)
+        else:
+            self.retention_index.record_upload(self.backend_name, self.location, object_key)
+
+    def get_file_url(self, destination_file_path, destination_generated_path):
+        # Encode the basename of the local_audio_path to ensure it's URL-safe
+        encoded_file_name = quote(os.path.basename(destination_file_path))
+
+        # First, join the base URL with the current_date
+        url_with_date = urljoin(self.base_url + '/', destination_generated_path + '/')
+
+        # Then, join the result with the encoded file name
+        return urljoin(url_with_date, encoded_file_name)
+
+    def clean_files(self, archive_path, archive_days):
+        return clean_archive(self, archive_path, archive_days)
+
+    def upload_files(self, uploads):
+        """
+        Uploads (source, destination, generated path) tuples, returning a URL or a falsy value for each.
+
+        Retries are handled by the caller, so each file gets a single attempt here.
+        """
+        return [self.upload_file(source_file_path, destination_file_path, destination_generated_path, max_attempts=1)
+                for source_file_path, destination_file_path, destination_generated_path in uploads]
+
+
+class GoogleCloudStorage(ArchiveStorage):
+    backend_name = "google_cloud"
 
     def __init__(self, storage_config):
+        # "acl" sets publicRead in the upload request itself, "bucket_policy" leaves visibility to the bucket.
+        self.public_access = storage_config.get('public_access', 'acl')
+        self.multipart_threshold = storage_config.get('multipart_threshold_mb', 8) * 1024 * 1024
+        self.multipart_chunk_size = storage_config.get('multipart_chunk_mb', 8) * 1024 * 1024
+        self.max_concurrency = storage_config.get('max_concurrency', 4)
+        from google.cloud import storage
+        from google.cloud.exceptions import GoogleCloudError
         try:
             self.storage_client = storage.Client.from_service_account_json(
                 storage_config['credentials_file'], project=storage_config['project_id'])
             self.bucket_name = storage_config['bucket_name']
+            self.location = self.bucket_name
+            self.public_base_url = f"https://storage.googleapis.com/{self.bucket_name}/"
             self.bucket = self.storage_client.get_bucket(self.bucket_name)
         except KeyError as e:
             module_logger.error(f"Google Cloud Missing required configuration data: {e}")
@@ -47,24 +198,32 @@ class GoogleCloudStorage:
             module_logger.error(f"Google Cloud Storage error: {e}")
 
     def upload_file(self, source_file_path, destination_file_path, destination_generated_path, max_attempts=3):
+        from google.cloud.exceptions import GoogleCloudError
+        from google.cloud.storage import transfer_manager
         try:
             if not os.path.exists(source_file_path) or not os.path.isfile(source_file_path):
                 module_logger.error(f'Source file {source_file_path} does not exist or is not a file.')
                 return False
 
-            mime_type, _ = mimetypes.guess_type(source_file_path)
-            if mime_type is None:
-                mime_type = 'application/octet-stream'
+            mime_type = get_content_type(os.path.splitext(source_file_path)[1])
 
             if self.bucket:
                 blob = self.bucket.blob(destination_file_path)
 
-                with open(source_file_path, 'rb') as file:
-                    blob.upload_from_file(file, content_type=mime_type)
+                # Composite chunked uploads cannot carry an ACL, so they are only used when the bucket grants access.
+                if (self.public_access == 'bucket_policy'
+                        and os.path.getsize(source_file_path) >= self.multipart_threshold):
+                    transfer_manager.upload_chunks_concurrently(
+                        source_file_path, blob, content_type=mime_type, chunk_size=self.multipart_chunk_size,
+                        max_workers=self.max_concurrency)
+                else:
+                    predefined_acl = 'publicRead' if self.public_access == 'acl' else None
+                    blob.upload_from_filename(source_file_path, content_type=mime_type,
+                                              predefined_acl=predefined_acl)
 
-                blob.make_public()
+                self.record_upload(destination_file_path)
 
-                return blob.public_url
+                return self.get_file_url(destination_file_path, destination_generated_path)
             else:
                 module_logger.warning("Google Storage Bucket is not available.")
                 return None
@@ -72,7 +231,26 @@ class GoogleCloudStorage:
             module_logger.error(f"Failed to upload file to Google Cloud Storage: {e}")
             return None
 
-    def clean_files(self, archive_path, archive_days):
+    def get_file_url(self, destination_file_path, destination_generated_path):
+        return self.public_base_url + quote(destination_file_path, safe="/~")
+
+    def delete_objects(self, object_keys, prefix=None):
+        from google.cloud.exceptions import GoogleCloudError
+        deleted_keys = []
+        for index in range(0, len(object_keys), 1000):
+            chunk = object_keys[index:index + 1000]
+            try:
+                # Missing blobs are already gone, so batch errors are not raised.
+                with self.storage_client.batch(raise_exception=False):
+                    for object_key in chunk:
+                        self.bucket.delete_blob(object_key)
+                deleted_keys.extend(chunk)
+            except GoogleCloudError as e:
+                module_logger.error(f"Failed to batch delete from Google Cloud Storage: {e}")
+        return deleted_keys
+
+    def reconcile_files(self, archive_path, archive_days):
+        from google.cloud.exceptions import GoogleCloudError
         delete_count = 0
         try:
             now = datetime.now(timezone.utc)
@@ -93,9 +271,13 @@ class GoogleCloudStorage:
             return None
 
 
-class AWSS3Storage:
+class AWSS3Storage(ArchiveStorage):
+    backend_name = "aws_s3"
 
     def __init__(self, storage_config):
+        import boto3
+        from boto3.s3.transfer import TransferConfig
+        from botocore.exceptions import NoCredentialsError
         try:
 
             if not storage_config.get("access_key_id", "") or not storage_config.get("secret_access_key",
@@ -110,43 +292,71 @@ class AWSS3Storage:
                 aws_secret_access_key=storage_config.get("secret_access_key", "")
             )
             self.bucket_name = storage_config.get('bucket_name', "")
+            self.location = self.bucket_name
             self.bucket = self.s3.Bucket(self.bucket_name)
+            self.public_base_url = f'https://{self.bucket_name}.s3.amazonaws.com/'
+
+            # "acl" sends public-read with the upload itself, "bucket_policy" leaves visibility to the bucket.
+            self.public_access = storage_config.get('public_access', 'acl')
+            self.transfer_config = TransferConfig(
+                multipart_threshold=storage_config.get('multipart_threshold_mb', 8) * 1024 * 1024,
+                multipart_chunksize=storage_config.get('multipart_chunk_mb', 8) * 1024 * 1024,
+                max_concurrency=storage_config.get('max_concurrency', 4))
 
         except KeyError as e:
             module_logger.error(f"AWS S3 Missing required configuration data: {e}")
         except NoCredentialsError as e:
             module_logger.error(f"Credentials not available for AWS S3: {e}")
 
-    def upload_file(self, source_file_path, destination_file_path, destination_generated_path, max_attempts=3):\
+    def upload_file(self, source_file_path, destination_file_path, destination_generated_path, max_attempts=3):
+        from boto3.exceptions import S3UploadFailedError
+        from botocore.exceptions import ClientError, ParamValidationError
 
         if not os.path.exists(source_file_path) or not os.path.isfile(source_file_path):
             module_logger.error(f'Source file {source_file_path} does not exist or is not a file.')
             return None
 
         try:
-            with open(source_file_path, 'rb') as file:
-                self.bucket.put_object(Key=destination_file_path, Body=file)
+            extra_args = {'ContentType': get_content_type(os.path.splitext(source_file_path)[1])}
+            if self.public_access == 'acl':
+                extra_args['ACL'] = 'public-read'
 
-            self.s3.ObjectAcl(self.bucket_name, destination_file_path).put(ACL='public-read')
+            # Small files go up in one PutObject, larger ones as a concurrent multipart upload.
+            self.bucket.upload_file(source_file_path, destination_file_path, ExtraArgs=extra_args,
+                                    Config=self.transfer_config)
+            self.record_upload(destination_file_path)
 
-            # Encode the basename of the local_audio_path to ensure it's URL-safe
-            encoded_file_name = quote(os.path.basename(destination_file_path))
-
-            # First, join the base URL with the current_date
-            url_with_date = urljoin(f'https://{self.bucket_name}.s3.amazonaws.com/',
-                                    os.path.dirname(destination_file_path) + '/')
-
-            # Then, join the result with the encoded file name
-            return urljoin(url_with_date, encoded_file_name)
+            return self.get_file_url(destination_file_path, destination_generated_path)
 
         except FileNotFoundError:
             module_logger.error(f"Local file {source_file_path} not found.")
             return None
-        except (ClientError, ParamValidationError) as e:
+        except (ClientError, ParamValidationError, S3UploadFailedError) as e:
             module_logger.error(f"Error uploading file to AWS S3: {e}")
             return None
 
-    def clean_files(self, archive_path, archive_days):
+    def get_file_url(self, destination_file_path, destination_generated_path):
+        return self.public_base_url + quote(destination_file_path, safe="/~")
+
+    def delete_objects(self, object_keys, prefix=None):
+        from botocore.exceptions import ClientError
+        s3_client = self.s3.meta.client
+        deleted_keys = []
+        for index in range(0, len(object_keys), 1000):
+            chunk = object_keys[index:index + 1000]
+            try:
+                response = s3_client.delete_objects(Bucket=self.bucket_name, Delete={
+                    "Objects": [{"Key": object_key} for object_key in chunk], "Quiet": True})
+                failed_keys = {error["Key"] for error in response.get("Errors", [])}
+                for error in response.get("Errors", []):
+                    module_logger.warning(f"Unable to delete S3 object {error['Key']}: {error.get('Message')}")
+                deleted_keys.extend(object_key for object_key in chunk if object_key not in failed_keys)
+            except ClientError as e:
+                module_logger.error(f"Error batch deleting S3 files: {e}")
+        return deleted_keys
+
+    def reconcile_files(self, archive_path, archive_days):
+        from botocore.exceptions import ClientError
 
         s3_client = self.s3.meta.client
         bucket_name = self.bucket_name  # Your S3 bucket name
@@ -179,23 +389,33 @@ class AWSS3Storage:
             return None
 
 
-class SCPStorage:
+class SCPStorage(ArchiveStorage):
+    backend_name = "scp"
+
     def __init__(self, storage_config):
         self.host = storage_config.get("host")
+        self.location = f"{storage_config.get('host')}:{storage_config.get('port', 22)}"
         self.port = storage_config.get("port", 22)
         self.username = storage_config.get("user", "")
         self.password = storage_config.get("password", "")
         self.private_key_path = storage_config.get('private_key_path', "")
         self.base_url = storage_config.get('base_url', "")
+        self.retry_backoff = storage_config.get('retry_backoff', 5)
+        self.directory_cache = DirectoryCache()
 
     def ensure_destination_directory_exists(self, sftp, destination_directory):
         """Ensure the remote directory structure exists."""
+        if destination_directory in self.directory_cache:
+            return
+
         parts = destination_directory.split("/")
         current_path = ""
 
         for part in parts[1:]:
 
             current_path = f'{current_path}/{part}'.replace("\\", "/")
+            if current_path in self.directory_cache:
+                continue
 
             try:
                 sftp.stat(current_path)
@@ -205,6 +425,8 @@ class SCPStorage:
             except Exception as e:
                 traceback.print_exc()
                 module_logger.error(f"SCP Unhandled Exception: {e}")
+                return
+            self.directory_cache.add(current_path)
 
     def upload_file(self, source_file_path, destination_file_path, destination_generated_path, max_attempts=3):
         """Uploads a file to the SCP storage."""
@@ -219,26 +441,69 @@ class SCPStorage:
                     self.ensure_destination_directory_exists(sftp, os.path.dirname(destination_file_path))
 
                     sftp.put(source_file_path, destination_file_path)
+                    self.record_upload(destination_file_path)
 
-                    # Encode the basename of the local_audio_path to ensure it's URL-safe
-                    encoded_file_name = quote(os.path.basename(destination_file_path))
-
-                    # First, join the base URL with the current_date
-                    url_with_date = urljoin(self.base_url + '/', destination_generated_path + '/')
-
-                    # Then, join the result with the encoded file name
-                    return urljoin(url_with_date, encoded_file_name)
+                    return self.get_file_url(destination_file_path, destination_generated_path)
 
             except Exception as error:  # Preferably catch more specific exceptions
                 traceback.print_exc()
                 module_logger.warning(f'Attempt {attempt} failed: {error}')
+                self.directory_cache.discard(os.path.dirname(destination_file_path))
                 if attempt < max_attempts:
-                    time.sleep(5)
+                    time.sleep(self.retry_backoff * 2 ** (attempt - 1))
 
         module_logger.error(f'All {max_attempts} attempts failed.')
         return False
 
-    def clean_files(self, archive_path, archive_days):
+    def upload_files(self, uploads):
+        """Uploads a batch of files over a single SFTP session."""
+        results = []
+        with self._create_sftp_session() as (ssh_client, sftp):
+            for source_file_path, destination_file_path, destination_generated_path in uploads:
+                if not os.path.isfile(source_file_path):
+                    module_logger.error(f'Source file {source_file_path} does not exist or is not a file.')
+                    results.append(False)
+                    continue
+                try:
+                    self.ensure_destination_directory_exists(sftp, os.path.dirname(destination_file_path))
+                    sftp.put(source_file_path, destination_file_path)
+                    self.record_upload(destination_file_path)
+                    results.append(self.get_file_url(destination_file_path, destination_generated_path))
+                except Exception as error:
+                    module_logger.warning(f'SCP upload of {source_file_path} failed: {error}')
+                    self.directory_cache.discard(os.path.dirname(destination_file_path))
+                    results.append(False)
+        return results
+
+    def delete_objects(self, object_keys, prefix=None):
+        """Removes files over a single SFTP session, then any directories below the prefix left empty."""
+        deleted_keys = []
+        directories = set()
+        try:
+            with self._create_sftp_session() as (ssh_client, sftp):
+                for object_key in object_keys:
+                    try:
+                        sftp.remove(object_key)
+                    except FileNotFoundError:
+                        pass
+                    except IOError as e:
+                        module_logger.warning(f"Unable to remove remote file {object_key}: {e}")
+                        continue
+                    deleted_keys.append(object_key)
+                    directories.update(parent_directories(object_key, prefix))
+
+                # Deepest directories first so emptied parents up to the prefix can go too.
+                for directory in sorted(directories, key=len, reverse=True):
+                    try:
+                        sftp.rmdir(directory)
+                        self.directory_cache.discard(directory)
+                    except IOError:
+                        pass  # Directory not empty
+        except Exception as e:
+            module_logger.error(f"Error during remote cleanup: {e}")
+        return deleted_keys
+
+    def reconcile_files(self, archive_path, archive_days):
         """Removes files older than a specified number of days within the remote archive path."""
 
         def clean_directory(sftp, path, archive_seconds):
@@ -251,6 +516,7 @@ class SCPStorage:
                     # Try to remove the directory if it's empty
                     try:
                         sftp.rmdir(remote_path)
+                        self.directory_cache.discard(remote_path)
                     except IOError:
                         pass  # Directory not empty
                 else:
@@ -264,6 +530,7 @@ class SCPStorage:
                 count = 0
                 clean_directory(sftp, archive_path, archive_days * 24 * 3600)
                 module_logger.info(f"Cleaned {count} files remotely.")
+                return count
         except Exception as e:
             module_logger.error(f"Error during remote cleanup: {e}")
             raise  # Consider re-raising the exception if the caller can handle it
@@ -276,6 +543,8 @@ class SCPStorage:
         :raises: FileNotFoundError if private key file doesn't exist.
                   SSHException for other SSH connection errors.
         """
+        from paramiko import SSHClient, AutoAddPolicy, RSAKey, SSHException
+
         ssh_client = SSHClient()
         ssh_client.load_system_host_keys()
         ssh_client.set_missing_host_key_policy(AutoAddPolicy())
@@ -319,14 +588,26 @@ class SCPStorage:
             ssh_client.close()
 
 
-class LocalStorage:
+# Hardlink errors that hold for every file on a filesystem.
+UNLINKABLE_ERRNOS = (errno.EPERM, errno.EXDEV, errno.EOPNOTSUPP)
+
+
+class LocalStorage(ArchiveStorage):
+    backend_name = "local"
+
     def __init__(self, storage_config):
         self.base_url = storage_config.get("base_url", "")
+        self.directory_cache = DirectoryCache()
+        # "auto" hardlinks or reflinks when the archive shares a filesystem with the source, "copy" always copies.
+        self.link_mode = storage_config.get("link_mode", "auto")
+        self._unlinkable_devices = set()
 
     def ensure_destination_directory_exists(self, destination_directory):
         """Ensure the local directory structure exists."""
-        if not os.path.exists(destination_directory):
-            os.makedirs(destination_directory)
+        if destination_directory in self.directory_cache:
+            return
+        os.makedirs(destination_directory, exist_ok=True)
+        self.directory_cache.add(destination_directory)
 
     def upload_file(self, source_file_path, destination_file_path, destination_generated_path, max_attempts=None):
         """Copies a file to the local storage with a date-based directory structure."""
@@ -337,36 +618,111 @@ class LocalStorage:
         try:
             self.ensure_destination_directory_exists(os.path.dirname(destination_file_path))
 
-            shutil.copy(source_file_path, destination_file_path)
-
-            # Encode the basename of the local_audio_path to ensure it's URL-safe
-            encoded_file_name = quote(os.path.basename(destination_file_path))
+            self.place_file(source_file_path, destination_file_path)
+            self.record_upload(destination_file_path)
 
-            # First, join the base URL with the current_date
-            url_with_date = urljoin(self.base_url + '/', destination_generated_path + '/')
-
-            # Then, join the result with the encoded file name
-            return urljoin(url_with_date, encoded_file_name)
+            return self.get_file_url(destination_file_path, destination_generated_path)
 
         except Exception as error:  # Preferably catch more specific exceptions
             module_logger.warning(f'Local Archive Failed: {error}')
+            self.directory_cache.discard(os.path.dirname(destination_file_path))
             return False
 
-    def clean_files(self, archive_path, archive_days):
+    def place_file(self, source_file_path, destination_file_path):
+        """
+        Puts a file into the archive without copying its bytes when possible.
+
+        A hardlink costs the same as a rename but leaves the source in place for the other stages still reading
+        it; once the call files are cleaned up the archive holds the only link. Filesystems that refuse
+        hardlinks get a reflink, and anything across devices falls back to a plain copy.
+        """
+        if self.link_mode != "copy":
+            device_pair = (os.stat(source_file_path).st_dev,
+                           os.stat(os.path.dirname(destination_file_path)).st_dev)
+            if device_pair[0] == device_pair[1] and device_pair not in self._unlinkable_devices:
+                if os.path.lexists(destination_file_path):
+                    os.remove(destination_file_path)
+                link_errno = None
+                try:
+                    os.link(source_file_path, destination_file_path)
+                    return "hardlink"
+                except OSError as e:
+                    link_errno = e.errno
+                    module_logger.debug(f"Hardlink to {destination_file_path} failed: {e}")
+                if self._reflink(source_file_path, destination_file_path):
+                    return "reflink"
+                # Only errors that mean the filesystem can never link stop later calls from trying, anything else
+                # (a concurrent upload, permissions, the link limit) just copies this one file.
+                if link_errno in UNLINKABLE_ERRNOS:
+                    module_logger.info(f"Local archive can not link files on device {device_pair[0]}, copying "
+                                       f"instead.")
+                    self._unlinkable_devices.add(device_pair)
+
+        shutil.copy(source_file_path, destination_file_path)
+        return "copy"
+
+    @staticmethod
+    def _reflink(source_file_path, destination_file_path):
+        if fcntl is None:
+            return False
+        try:
+            with open(source_file_path, 'rb') as source_file, open(destination_file_path, 'wb') as destination_file:
+                fcntl.ioctl(destination_file.fileno(), FICLONE, source_file.fileno())
+            shutil.copymode(source_file_path, destination_file_path)
+            return True
+        except OSError as e:
+            if e.errno not in (errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL, errno.EPERM):
+                module_logger.debug(f"Reflink to {destination_file_path} failed: {e}")
+            try:
+                os.remove(destination_file_path)
+            except FileNotFoundError:
+                pass
+            return False
+
+    def delete_objects(self, object_keys, prefix=None):
+        """Removes files, then any directories below the prefix left empty."""
+        deleted_keys = []
+        directories = set()
+        for object_key in object_keys:
+            try:
+                os.remove(object_key)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                module_logger.warning(f"Unable to remove local file {object_key}: {e}")
+                continue
+            deleted_keys.append(object_key)
+            directories.update(parent_directories(object_key, prefix))
+
+        # Deepest directories first so emptied parents up to the prefix can go too.
+        for directory in sorted(directories, key=len, reverse=True):
+            try:
+                os.rmdir(directory)
+                self.directory_cache.discard(directory)
+            except OSError:
+                pass  # Directory not empty or other error
+        return deleted_keys
+
+    def reconcile_files(self, archive_path, archive_days):
         """Removes files older than a specified number of days within the local archive path."""
         archive_seconds = archive_days * 24 * 3600
         current_time = time.time()
+        count = 0
 
         for root, dirs, files in os.walk(archive_path, topdown=False):
             for name in files:
                 file_path = os.path.join(root, name)
                 if current_time - os.path.getmtime(file_path) >= archive_seconds:
                     os.remove(file_path)
+                    count += 1
                     module_logger.debug(f"Successfully cleaned local file: {file_path}")
 
             for name in dirs:
                 dir_path = os.path.join(root, name)
                 try:
                     os.rmdir(dir_path)  # Try to remove the directory if it's empty
+                    self.directory_cache.discard(dir_path)
                 except OSError:
                     pass  # Directory not empty or other error
+
+        return count
@@ -0,0 +1,235 @@
+import logging
+import os
+import threading
+import time
+
+from lib.sqlite_handler import connect_database
+
+module_logger = logging.getLogger('rtl_watcher.retention')
+
+RETENTION_SCHEMA = """
+CREATE TABLE IF NOT EXISTS archive_objects (
+    backend TEXT NOT NULL,
+    location TEXT NOT NULL,
+    object_key TEXT NOT NULL,
+    uploaded_at REAL NOT NULL,
+    PRIMARY KEY (backend, location, object_key)
+);
+CREATE INDEX IF NOT EXISTS idx_archive_objects_uploaded_at ON archive_objects (backend, location, uploaded_at);
+CREATE TABLE IF NOT EXISTS archive_reconciles (
+    backend TEXT NOT NULL,
+    location TEXT NOT NULL,
+    prefix TEXT NOT NULL,
+    reconciled_at REAL NOT NULL,
+    PRIMARY KEY (backend, location, prefix)
+);
+CREATE TABLE IF NOT EXISTS archive_blobs (
+    backend TEXT NOT NULL,
+    location TEXT NOT NULL,
+    blob_key TEXT NOT NULL,
+    stored_at REAL NOT NULL,
+    PRIMARY KEY (backend, location, blob_key)
+);
+CREATE TABLE IF NOT EXISTS archive_blob_refs (
+    backend TEXT NOT NULL,
+    location TEXT NOT NULL,
+    object_key TEXT NOT NULL,
+    blob_key TEXT NOT NULL,
+    PRIMARY KEY (backend, location, object_key, blob_key)
+);
+CREATE INDEX IF NOT EXISTS idx_archive_blob_refs_blob_key ON archive_blob_refs (backend, location, blob_key);
+"""
+
+
+class CleanupThrottle:
+    """
+    Limits cleanup to once per clean interval for each archive prefix in this process.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.last_cleaned = {}
+
+    def should_clean(self, backend, location, prefix, clean_interval_seconds):
+        key = (backend, location, prefix)
+        now = time.monotonic()
+        with self.lock:
+            if now - self.last_cleaned.get(key, float("-inf")) < clean_interval_seconds:
+                return False
+            self.last_cleaned[key] = now
+            return True
+
+
+# Archives without a retention index are cleaned by a full listing, which is too slow to run after every call.
+unindexed_cleanup_throttle = CleanupThrottle()
+
+
+class RetentionIndex:
+    """
+    Records every archived object with its upload time so cleanup only has to look at expired keys instead of
+    listing the whole archive.
+    """
+
+    def __init__(self, database_path):
+        self.database_path = database_path
+        self.connection = connect_database(database_path, RETENTION_SCHEMA)
+        self.lock = threading.Lock()
+        self.cleanup_throttle = CleanupThrottle()
+
+    def record_upload(self, backend, location, object_key, uploaded_at=None):
+        try:
+            with self.lock, self.connection:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO archive_objects (backend, location, object_key, uploaded_at) "
+                    "VALUES (?, ?, ?, ?)", (backend, location, object_key, uploaded_at or time.time()))
+        except Exception as e:
+            module_logger.error(f"<<Retention>> <<index>> failed recording {object_key}: {e}")
+
+    def expired_keys(self, backend, location, prefix, archive_days):
+        cutoff = time.time() - archive_days * 86400
+        # Matched as a directory, so cleanup for system "sys" leaves "sys2" alone.
+        prefix = prefix.rstrip("/") + "/"
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT object_key FROM archive_objects WHERE backend = ? AND location = ? AND uploaded_at < ? "
+                "AND substr(object_key, 1, ?) = ?", (backend, location, cutoff, len(prefix), prefix)).fetchall()
+        return [row[0] for row in rows]
+
+    def remove_keys(self, backend, location, object_keys):
+        if not object_keys:
+            return
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "DELETE FROM archive_objects WHERE backend = ? AND location = ? AND object_key = ?",
+                [(backend, location, object_key) for object_key in object_keys])
+
+    def acquire_blob(self, backend, location, object_key, blob_key):
+        """
+        References a content-addressed blob from an archived object, returning True when the blob is already stored.
+
+        The reference is added in the same transaction as the existence check, so cleanup either sees it and keeps
+        the blob or has already forgotten the blob and the caller uploads it again.
+        """
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR IGNORE INTO archive_blob_refs (backend, location, object_key, blob_key) VALUES (?, ?, ?, ?)",
+                (backend, location, object_key, blob_key))
+            row = self.connection.execute(
+                "SELECT 1 FROM archive_blobs WHERE backend = ? AND location = ? AND blob_key = ?",
+                (backend, location, blob_key)).fetchone()
+        return row is not None
+
+    def record_blob(self, backend, location, blob_key):
+        try:
+            with self.lock, self.connection:
+                self.connection.execute(
+                    "INSERT OR IGNORE INTO archive_blobs (backend, location, blob_key, stored_at) VALUES (?, ?, ?, ?)",
+                    (backend, location, blob_key, time.time()))
+        except Exception as e:
+            module_logger.error(f"<<Retention>> <<index>> failed recording blob {blob_key}: {e}")
+
+    def release_blobs(self, backend, location, object_keys):
+        """
+        Drops the blob references held by deleted objects and returns the blobs nothing references any more.
+
+        Unreferenced blobs are forgotten here, before they are deleted from storage, so a new call carrying the same
+        audio uploads it again rather than pointing at a blob that is about to disappear.
+        """
+        if not object_keys:
+            return []
+        with self.lock, self.connection:
+            blob_keys = set()
+            for object_key in object_keys:
+                blob_keys.update(row[0] for row in self.connection.execute(
+                    "SELECT blob_key FROM archive_blob_refs WHERE backend = ? AND location = ? AND object_key = ?",
+                    (backend, location, object_key)))
+            self.connection.executemany(
+                "DELETE FROM archive_blob_refs WHERE backend = ? AND location = ? AND object_key = ?",
+                [(backend, location, object_key) for object_key in object_keys])
+            orphaned_keys = [blob_key for blob_key in blob_keys if self.connection.execute(
+                "SELECT 1 FROM archive_blob_refs WHERE backend = ? AND location = ? AND blob_key = ? LIMIT 1",
+                (backend, location, blob_key)).fetchone() is None]
+            self.connection.executemany(
+                "DELETE FROM archive_blobs WHERE backend = ? AND location = ? AND blob_key = ?",
+                [(backend, location, blob_key) for blob_key in orphaned_keys])
+        return orphaned_keys
+
+    def should_clean(self, backend, location, prefix, clean_interval_seconds):
+        """
+        Throttles cleanup to once per clean_interval_seconds for each archive prefix in this process.
+        """
+        return self.cleanup_throttle.should_clean(backend, location, prefix, clean_interval_seconds)
+
+    def reconcile_due(self, backend, location, prefix, reconcile_hours):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT reconciled_at FROM archive_reconciles WHERE backend = ? AND location = ? AND prefix = ?",
+                (backend, location, prefix)).fetchone()
+        return row is None or time.time() - row[0] >= reconcile_hours * 3600
+
+    def mark_reconciled(self, backend, location, prefix):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO archive_reconciles (backend, location, prefix, reconciled_at) "
+                "VALUES (?, ?, ?, ?)", (backend, location, prefix, time.time()))
+
+
+_retention_indexes = {}
+_retention_indexes_lock = threading.Lock()
+
+
+def get_retention_index(database_path):
+    """
+    Returns the process wide RetentionIndex for a database path, or None when retention indexing is disabled.
+    """
+    if not database_path:
+        return None
+
+    database_path = os.path.abspath(database_path)
+    with _retention_indexes_lock:
+        if database_path not in _retention_indexes:
+            _retention_indexes[database_path] = RetentionIndex(database_path)
+        return _retention_indexes[database_path]
+
+
+def clean_archive(storage, archive_path, archive_days):
+    """
+    Deletes expired archive objects for a storage backend.
+
+    Expired keys come from the retention index and are deleted in bulk. A full listing of the archive
+    (storage.reconcile_files) still runs every reconcile_hours to catch objects missing from the index, and is
+    the only strategy when the index is disabled. Either way cleanup runs at most once per clean interval.
+    """
+    retention_index = storage.retention_index
+    backend, location = storage.backend_name, storage.location
+    if retention_index is None:
+        if not unindexed_cleanup_throttle.should_clean(backend, location, archive_path,
+                                                       storage.clean_interval_seconds):
+            return 0
+        return storage.reconcile_files(archive_path, archive_days)
+
+    if not retention_index.should_clean(backend, location, archive_path, storage.clean_interval_seconds):
+        return 0
+
+    delete_count = 0
+    if retention_index.reconcile_due(backend, location, archive_path, storage.reconcile_hours):
+        module_logger.info(f"<<Retention>> reconciling {backend} {location}/{archive_path}")
+        delete_count += storage.reconcile_files(archive_path, archive_days) or 0
+        retention_index.mark_reconciled(backend, location, archive_path)
+
+    expired_keys = retention_index.expired_keys(backend, location, archive_path, archive_days)
+    if expired_keys:
+        deleted_keys = storage.delete_objects(expired_keys, archive_path)
+        retention_index.remove_keys(backend, location, deleted_keys)
+        delete_count += len(deleted_keys)
+        module_logger.info(f"<<Retention>> deleted {len(deleted_keys)} of {len(expired_keys)} expired objects from "
+                           f"{backend} {location}/{archive_path}")
+
+        # Content-addressed audio is only deleted once the last call referencing it has expired.
+        orphaned_keys = retention_index.release_blobs(backend, location, deleted_keys)
+        if orphaned_keys:
+            deleted_blobs = storage.delete_objects(orphaned_keys, storage.blob_root)
+            delete_count += len(deleted_blobs)
+            module_logger.info(f"<<Retention>> deleted {len(deleted_blobs)} unreferenced blobs from {backend} {location}")
+
+    return delete_count
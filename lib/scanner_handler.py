@@ -0,0 +1,141 @@
+import logging
+import os
+import threading
+import time
+
+module_logger = logging.getLogger('rtl_watcher.scanner')
+
+
+class DirectoryScanner:
+    """
+    Polls a watch directory for filesystems where inotify events are not delivered, such as NFS and SMB mounts.
+
+    Directories are only re-listed when their mtime changes, so a tick over an idle tree costs one stat per
+    directory. New files are held as pending until their size and mtime are unchanged across two scans.
+    """
+
+    # Directories are re-listed every tick until one listing ran this long after their current mtime was first
+    # seen, because coarse mtime resolution on network filesystems can hide a second change within the same
+    # timestamp. Measured with this host's clock only, so a file server's clock skew does not matter.
+    recent_change_seconds = 2.0
+
+    def __init__(self, watch_directory, on_stable, scan_interval=2.0, extensions=(".mp3",), scan_existing=False,
+                 ignore_path=None, batch_size=1000):
+        self.watch_directory = os.path.abspath(watch_directory)
+        self.on_stable = on_stable
+        self.scan_interval = scan_interval
+        self.extensions = tuple(extensions)
+        self.scan_existing = scan_existing
+        self.ignore_path = ignore_path
+        self.batch_size = batch_size
+
+        # directory -> (mtime_ns, monotonic time that mtime was first seen, monotonic time of the last listing)
+        self.directory_mtimes = {}
+        self.subdirectories = {}
+        self.seen = {}
+        self.pending = {}
+        self.initial_scan = True
+        self.stop_event = threading.Event()
+
+    def run(self):
+        module_logger.info(f"Scanning directory {self.watch_directory} every {self.scan_interval} seconds.")
+        while not self.stop_event.is_set():
+            tick_start = time.time()
+            try:
+                self.scan()
+            except Exception as e:
+                module_logger.error(f"<<Scanner>> <<error>> in {self.watch_directory}: {e}", exc_info=True)
+            self.stop_event.wait(max(0.0, self.scan_interval - (time.time() - tick_start)))
+
+    def stop(self):
+        self.stop_event.set()
+
+    def scan(self):
+        """
+        Runs one incremental scan and dispatches every file that has become stable.
+        """
+        directories = [self.watch_directory]
+        visited = set()
+        while directories:
+            directory = directories.pop()
+            visited.add(directory)
+            directories.extend(self._scan_directory(directory))
+
+        for directory in list(self.directory_mtimes):
+            if directory not in visited:
+                self._forget_directory(directory)
+
+        self._check_pending()
+        self.initial_scan = False
+
+    def _scan_directory(self, directory):
+        try:
+            mtime_ns = os.stat(directory).st_mtime_ns
+        except FileNotFoundError:
+            return []
+
+        now = time.monotonic()
+        last_mtime_ns, first_seen, last_listed = self.directory_mtimes.get(directory, (None, None, None))
+        if last_mtime_ns == mtime_ns:
+            if last_listed - first_seen > self.recent_change_seconds:
+                return self.subdirectories.get(directory, [])
+        else:
+            first_seen = now
+        self.directory_mtimes[directory] = (mtime_ns, first_seen, now)
+        seen_names = self.seen.setdefault(directory, set())
+        listed_names = set()
+        subdirectories = []
+
+        try:
+            with os.scandir(directory) as entries:
+                for index, entry in enumerate(entries):
+                    if index and index % self.batch_size == 0:
+                        # Yield between batches so a huge listing doesn't starve the processing threads.
+                        time.sleep(0)
+
+                    if entry.is_dir(follow_symlinks=False):
+                        if self.ignore_path is None or not self.ignore_path(entry.path):
+                            subdirectories.append(entry.path)
+                        continue
+
+                    name = entry.name
+                    listed_names.add(name)
+                    if name in seen_names or not name.lower().endswith(self.extensions):
+                        continue
+
+                    seen_names.add(name)
+                    if not self.initial_scan or self.scan_existing:
+                        self.pending[entry.path] = None
+        except FileNotFoundError:
+            return []
+
+        removed_names = seen_names - listed_names
+        if removed_names:
+            seen_names -= removed_names
+            for name in removed_names:
+                self.pending.pop(os.path.join(directory, name), None)
+
+        self.subdirectories[directory] = subdirectories
+        return subdirectories
+
+    def _forget_directory(self, directory):
+        self.directory_mtimes.pop(directory, None)
+        self.subdirectories.pop(directory, None)
+        for name in self.seen.pop(directory, ()):
+            self.pending.pop(os.path.join(directory, name), None)
+
+    def _check_pending(self):
+        for path, last_state in list(self.pending.items()):
+            try:
+                stat_result = os.stat(path)
+            except FileNotFoundError:
+                del self.pending[path]
+                continue
+
+            state = (stat_result.st_size, stat_result.st_mtime_ns)
+            if state == last_state and stat_result.st_size > 0:
+                del self.pending[path]
+                module_logger.debug(f"<<Scanner>> file is stable: {path}")
+                self.on_stable(path)
+            else:
+                self.pending[path] = state
@@ -0,0 +1,21 @@
+import logging
+import os
+import sqlite3
+
+module_logger = logging.getLogger('rtl_watcher.sqlite')
+
+
+def connect_database(database_path, schema=None):
+    """
+    Opens a SQLite database in WAL mode so readers never block the writer and several processes can share it.
+    """
+    database_directory = os.path.dirname(os.path.abspath(database_path))
+    os.makedirs(database_directory, exist_ok=True)
+
+    connection = sqlite3.connect(database_path, timeout=30, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    if schema:
+        connection.executescript(schema)
+        connection.commit()
+    return connection
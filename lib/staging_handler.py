@@ -0,0 +1,76 @@
+import logging
+import os
+import shutil
+import time
+
+module_logger = logging.getLogger('rtl_watcher.staging')
+
+
+def get_staging_directory(temp_file_path, system_name, mp3_file_path, min_free_mb=32, size_multiplier=4):
+    """
+    Returns the directory a call's working files should be written to.
+
+    Calls are staged under temp_file_path (normally the /dev/shm tmpfs) when it has room for roughly
+    size_multiplier times the MP3 plus min_free_mb, otherwise they fall back to the MP3's own directory.
+    """
+    mp3_directory = os.path.dirname(mp3_file_path)
+    if not temp_file_path:
+        return mp3_directory
+
+    staging_directory = os.path.join(temp_file_path, "rtl_watcher", system_name)
+    try:
+        os.makedirs(staging_directory, exist_ok=True)
+        free_bytes = shutil.disk_usage(staging_directory).free
+        required_bytes = os.path.getsize(mp3_file_path) * size_multiplier + min_free_mb * 1024 * 1024
+    except OSError as e:
+        module_logger.warning(f"<<Staging>> unavailable at {temp_file_path}, using {mp3_directory}: {e}")
+        return mp3_directory
+
+    if free_bytes < required_bytes:
+        module_logger.warning(
+            f"<<Staging>> <<low>> <<space>> {free_bytes // (1024 * 1024)}MB free in {temp_file_path}, using {mp3_directory}")
+        return mp3_directory
+
+    return staging_directory
+
+
+def release_staged_files(staged_file_paths, destination_directory, keep_files):
+    """
+    Removes staged files, or moves them next to the MP3 when files are being kept.
+    """
+    for file_path in staged_file_paths:
+        if not os.path.exists(file_path):
+            continue
+        try:
+            if keep_files:
+                shutil.move(file_path, os.path.join(destination_directory, os.path.basename(file_path)))
+            else:
+                module_logger.debug(f"Removing staged file {file_path}")
+                os.remove(file_path)
+        except OSError as e:
+            module_logger.warning(f"<<Staging>> unable to release {file_path}: {e}")
+
+
+def sweep_staging_directory(temp_file_path, system_name, max_age_seconds=3600):
+    """
+    Removes staged files left behind by a previous run that was killed mid-call.
+    """
+    if not temp_file_path:
+        return
+
+    staging_directory = os.path.join(temp_file_path, "rtl_watcher", system_name)
+    if not os.path.isdir(staging_directory):
+        return
+
+    cutoff = time.time() - max_age_seconds
+    removed = 0
+    with os.scandir(staging_directory) as entries:
+        for entry in entries:
+            try:
+                if entry.is_file() and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    removed += 1
+            except OSError:
+                continue
+    if removed:
+        module_logger.info(f"<<Staging>> removed {removed} stale files from {staging_directory}")
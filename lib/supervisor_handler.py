@@ -0,0 +1,271 @@
+import logging
+import logging.handlers
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+
+from lib.call_index_handler import flush_call_indexes
+from lib.config_reload_handler import ConfigReloader
+from lib.journal_handler import flush_call_journals
+from lib.logging_handler import get_log_level
+from lib.metrics_handler import metrics, merge_snapshots, log_snapshot
+from lib.watcher_handler import WatcherManager
+
+module_logger = logging.getLogger('rtl_watcher.supervisor')
+
+
+def plan_worker_groups(system_names, systems_per_process, existing_groups=()):
+    """
+    Splits systems into worker groups of at most systems_per_process systems.
+
+    Existing groups whose systems are all still configured are kept so reloads only touch affected workers.
+    """
+    system_names = set(system_names)
+    groups = [group for group in existing_groups if group <= system_names]
+    assigned = set().union(*groups) if groups else set()
+
+    unassigned = sorted(system_names - assigned)
+    for index in range(0, len(unassigned), systems_per_process):
+        groups.append(frozenset(unassigned[index:index + systems_per_process]))
+
+    return groups
+
+
+def assign_cpus(group_index, group_count):
+    """
+    Spreads worker groups across the CPUs available to this process.
+    """
+    if not hasattr(os, "sched_getaffinity"):
+        return None
+
+    cpus = sorted(os.sched_getaffinity(0))
+    if group_count <= len(cpus):
+        return {cpu for position, cpu in enumerate(cpus) if position % group_count == group_index}
+    return {cpus[group_index % len(cpus)]}
+
+
+def run_worker(system_configs, config_data, config_file_path, log_queue, metrics_queue, log_level, cpus,
+               metrics_interval):
+    """
+    Entry point for a worker process. Runs a WatcherManager for its systems and reports logs and metrics to the
+    supervisor over queues.
+
+    The worker starts from the configuration the supervisor last validated rather than re-reading the file, so a
+    worker restarted while config.json holds a rejected edit still comes up.
+    """
+    system_names = frozenset(system_configs)
+    # The supervisor owns Ctrl-C handling and stops workers with SIGTERM.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    stop_requested = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_requested.append(signum))
+
+    root_logger = logging.getLogger('rtl_watcher')
+    for handler in list(root_logger.handlers):
+        root_logger.removeHandler(handler)
+        handler.close()
+    root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    root_logger.setLevel(log_level)
+
+    if cpus:
+        try:
+            os.sched_setaffinity(0, cpus)
+        except OSError as e:
+            module_logger.warning(f"Unable to pin worker to CPUs {sorted(cpus)}: {e}")
+
+    watcher_manager = WatcherManager()
+    watcher_manager.apply(system_configs)
+
+    def reload_config(new_config_data, new_system_configs):
+        root_logger.setLevel(get_log_level(new_config_data.get("log_level", 1)))
+        watcher_manager.apply(new_system_configs)
+
+    config_reloader = ConfigReloader(config_file_path, reload_config, system_names=system_names)
+    config_reloader.start(config_data)
+
+    last_metrics = time.time()
+    while not stop_requested:
+        time.sleep(1)
+        if time.time() - last_metrics >= metrics_interval:
+            metrics_queue.put((tuple(sorted(system_names)), metrics.snapshot()))
+            last_metrics = time.time()
+
+    config_reloader.stop()
+    watcher_manager.stop()
+    flush_call_indexes()
+    flush_call_journals()
+    metrics_queue.put((tuple(sorted(system_names)), metrics.snapshot()))
+
+
+class WorkerProcess:
+    def __init__(self, system_names):
+        self.system_names = system_names
+        self.process = None
+        self.restart_at = None
+        self.restart_count = 0
+
+
+class Supervisor:
+    """
+    Runs each group of systems in its own worker process so tone detection and JSON work for different systems
+    don't share a GIL. Crashed workers are restarted, worker logs are written by this process and worker metrics
+    are merged and logged periodically.
+    """
+
+    def __init__(self, config_file_path, config_data, system_configs, logging_instance):
+        process_mode = config_data.get("process_mode", {})
+        self.config_file_path = config_file_path
+        self.systems_per_process = max(1, process_mode.get("systems_per_process", 1))
+        self.restart_delay = process_mode.get("restart_delay", 5)
+        self.pin_cpus = process_mode.get("pin_cpus", 1) == 1
+        self.metrics_interval = process_mode.get("metrics_interval", 300)
+        self.stop_timeout = process_mode.get("stop_timeout", 120)
+
+        # Spawn avoids forking a process that already has observer and logging threads running.
+        self.context = multiprocessing.get_context("spawn")
+        self.log_queue = self.context.Queue()
+        self.metrics_queue = self.context.Queue()
+
+        self.logging_instance = logging_instance
+        root_logger = logging.getLogger('rtl_watcher')
+        self.log_listener = logging.handlers.QueueListener(self.log_queue, *root_logger.handlers,
+                                                           respect_handler_level=True)
+
+        self.workers = {}
+        self.stopping_workers = []
+        self.worker_metrics = {}
+        self.retired_metrics = []
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.config_reloader = ConfigReloader(config_file_path, self.reload)
+        self.config_data = config_data
+        self.system_configs = system_configs
+        self.system_names = set(system_configs)
+
+    def run(self):
+        self.log_listener.start()
+        self.apply_groups()
+        self.config_reloader.start(self.config_data)
+
+        last_metrics = time.time()
+        try:
+            while not self.stop_event.is_set():
+                self.collect_metrics(timeout=1)
+                self.check_workers()
+                if time.time() - last_metrics >= self.metrics_interval:
+                    log_snapshot(self.aggregate_metrics())
+                    last_metrics = time.time()
+        except KeyboardInterrupt:
+            module_logger.info("Shutting down workers, waiting for in-flight calls to finish.")
+
+        self.stop()
+
+    def reload(self, config_data, system_configs):
+        self.logging_instance.set_log_level(config_data.get("log_level", 1))
+        with self.lock:
+            self.config_data = config_data
+            self.system_configs = system_configs
+            self.system_names = set(system_configs)
+        self.apply_groups()
+
+    def apply_groups(self):
+        with self.lock:
+            groups = plan_worker_groups(self.system_names, self.systems_per_process, list(self.workers))
+
+            for group in list(self.workers):
+                if group not in groups:
+                    module_logger.info(f"Stopping worker for {', '.join(sorted(group))}")
+                    self._stop_worker(self.workers.pop(group))
+
+            for group in groups:
+                if group not in self.workers:
+                    self.workers[group] = WorkerProcess(group)
+                    self._start_worker(self.workers[group])
+
+    def _start_worker(self, worker):
+        group_index = sorted(self.workers, key=lambda group: sorted(group)).index(worker.system_names)
+        cpus = assign_cpus(group_index, len(self.workers)) if self.pin_cpus else None
+
+        worker.process = self.context.Process(
+            target=run_worker,
+            args=({name: self.system_configs[name] for name in worker.system_names}, self.config_data,
+                  self.config_file_path, self.log_queue, self.metrics_queue, logging.getLogger('rtl_watcher').level,
+                  cpus, self.metrics_interval),
+            name=f"worker-{'-'.join(sorted(worker.system_names))}"
+        )
+        worker.process.start()
+        worker.restart_at = None
+        module_logger.info(
+            f"Started worker {worker.process.pid} for {', '.join(sorted(worker.system_names))}"
+            + (f" on CPUs {sorted(cpus)}" if cpus else ""))
+
+    def _stop_worker(self, worker):
+        """
+        Asks a worker to drain and exit, and waits for it on a background thread so the lock is not held meanwhile.
+        """
+        if worker.process is not None and worker.process.is_alive():
+            worker.process.terminate()
+            reaper = threading.Thread(target=self._reap_worker, args=(worker,),
+                                      name=f"reap-{worker.process.name}", daemon=True)
+            self.stopping_workers = [thread for thread in self.stopping_workers if thread.is_alive()] + [reaper]
+            reaper.start()
+
+    def _reap_worker(self, worker):
+        """
+        Waits up to stop_timeout for a terminated worker to finish its in-flight calls, then kills it.
+        """
+        worker.process.join(self.stop_timeout)
+        if worker.process.is_alive():
+            module_logger.warning(f"Worker {worker.process.pid} for {', '.join(sorted(worker.system_names))} did "
+                                  f"not finish within {self.stop_timeout} seconds, killing it.")
+            worker.process.kill()
+            worker.process.join()
+
+    def check_workers(self):
+        with self.lock:
+            for worker in self.workers.values():
+                if worker.process.is_alive():
+                    continue
+
+                if worker.restart_at is None:
+                    worker.restart_count += 1
+                    worker.restart_at = time.time() + self.restart_delay
+                    module_logger.error(
+                        f"Worker for {', '.join(sorted(worker.system_names))} exited with code "
+                        f"{worker.process.exitcode}, restarting in {self.restart_delay} seconds.")
+                    key = tuple(sorted(worker.system_names))
+                    if key in self.worker_metrics:
+                        self.retired_metrics.append(self.worker_metrics.pop(key))
+                elif time.time() >= worker.restart_at:
+                    self._start_worker(worker)
+
+    def collect_metrics(self, timeout):
+        try:
+            key, snapshot = self.metrics_queue.get(timeout=timeout)
+        except queue.Empty:
+            return
+        self.worker_metrics[key] = snapshot
+        while True:
+            try:
+                key, snapshot = self.metrics_queue.get_nowait()
+            except queue.Empty:
+                return
+            self.worker_metrics[key] = snapshot
+
+    def aggregate_metrics(self):
+        return merge_snapshots(self.retired_metrics + list(self.worker_metrics.values()))
+
+    def stop(self):
+        self.stop_event.set()
+        self.config_reloader.stop()
+        with self.lock:
+            for worker in self.workers.values():
+                self._stop_worker(worker)
+            reapers = list(self.stopping_workers)
+        for reaper in reapers:
+            reaper.join()
+        self.collect_metrics(timeout=0)
+        log_snapshot(self.aggregate_metrics())
+        self.log_listener.stop()
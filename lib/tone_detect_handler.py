@@ -2,18 +2,22 @@ import io
 import logging
 import traceback
 
-from icad_tone_detection import tone_detect
-
 module_logger = logging.getLogger('rtl_watcher.tone_detect')
 
 
 def get_tones(tone_detect_config, mp3_file_path):
+    """
+    Returns the two tone, long tone and hi-low tones detected in a call, or None when detection failed so the
+    journal does not record the stage as done.
+    """
     detected_tones = {
         "two_tone": [],
         "long_tone": [],
         "hi_low_tone": []
     }
     try:
+        # Imported on first use; it brings in the scientific Python stack and most systems leave tone detection off.
+        from icad_tone_detection import tone_detect
 
         results = tone_detect(mp3_file_path, tone_detect_config.get("matching_threshold", 2), tone_detect_config.get("time_resolution_ms", 50), tone_detect_config.get("tone_a_min_length", 0.8), tone_detect_config.get("tone_b_min_length", 2.8), tone_detect_config.get("hi_low_interval",0.2), tone_detect_config.get("hi_low_min_alternations", 3), tone_detect_config.get("long_tone_min_length", 1.5))
         detected_tones.update({
@@ -25,5 +29,6 @@ def get_tones(tone_detect_config, mp3_file_path):
     except Exception as e:
         traceback.print_exc()
         module_logger.error(f"<<Tone>> <<Detect>> - Error {e}")
+        return None
 
     return detected_tones
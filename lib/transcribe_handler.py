@@ -1,35 +1,160 @@
-import io
+import collections
+import itertools
 import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
 
 import requests
 import logging
 
+from lib.audio_trim_handler import trim_audio
+
 module_logger = logging.getLogger('rtl_watcher.transcribe')
 
+# Returned for calls with nothing left to transcribe once tones and silence are cut.
+EMPTY_TRANSCRIPT = {"transcript": "", "segments": []}
+
+
+class TranscriptContextCache:
+    """
+    The latest transcript of each recently active talkgroup, keyed by (short_name, talkgroup). Each transcribe
+    section keeps its own, sized by that section.
+
+    Entries expire ttl_seconds after they were stored and the least recently used are evicted beyond max_entries,
+    so systems with thousands of talkgroups hold only the ones that are talking. Results that arrive out of order
+    never replace the context of a later call.
+    """
+
+    def __init__(self, max_entries=1000, ttl_seconds=300):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            text, start_time, stored = entry
+            if time.monotonic() - stored > self.ttl_seconds:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return text
+
+    def put(self, key, text, start_time):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] > start_time:
+                return
+            self.entries[key] = (text, start_time, time.monotonic())
+            self.entries.move_to_end(key)
+            self._evict()
+
+    def _evict(self):
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+
+def context_key(call_data):
+    return call_data.get("short_name"), call_data.get("talkgroup")
+
+
+def apply_transcript_context(transcript_context, transcribe_config, call_data, whisper_config):
+    """
+    Returns whisper_config with the talkgroup's last transcript as initial_prompt when use_last_as_initial_prompt
+    is set, after any configured initial_prompt and cut to the last context_max_chars characters.
+    """
+    if transcript_context is None or not whisper_config.get("use_last_as_initial_prompt", False):
+        return whisper_config
+    last_transcript = transcript_context.get(context_key(call_data))
+    if not last_transcript:
+        return whisper_config
 
-def upload_to_transcribe(transcribe_config, mp3_file_path, call_data, talkgroup_config=None):
+    max_chars = transcribe_config.get("context_max_chars", 400)
+    if len(last_transcript) > max_chars:
+        # Keep the end of the transcript, starting on a word.
+        last_transcript = last_transcript[-max_chars:].split(" ", 1)[-1]
+    initial_prompt = whisper_config.get("initial_prompt")
+    return dict(whisper_config,
+                initial_prompt=f"{initial_prompt} {last_transcript}" if initial_prompt else last_transcript)
+
+
+def update_transcript_context(transcript_context, call_data, talkgroup_config, result):
+    whisper_config = (talkgroup_config or {}).get("whisper", {}) or {}
+    if transcript_context is None or not whisper_config.get("use_last_as_initial_prompt", False) or \
+            not isinstance(result, dict):
+        return
+    text = (result.get("transcript") or result.get("text") or "").strip()
+    if text:
+        transcript_context.put(context_key(call_data), text, call_data.get("start_time", 0))
+
+
+def prepare_transcribe_upload(transcribe_config, mp3_file_path, call_data, talkgroup_config=None,
+                              transcript_context=None):
+    """
+    Returns (audio_file, whisper_config) for a call, trimmed to its speech when trim_audio is enabled and with the
+    talkgroup's previous transcript as its initial prompt when use_last_as_initial_prompt is set.
+
+    audio_file is a (file name, bytes, content type) tuple for the upload, or None when trimming left no speech.
+    """
+    whisper_config = (talkgroup_config or {}).get("whisper", {}) or {}
+
+    # Cut tones and dead air locally so only speech is sent and the server has nothing left to trim.
+    if transcribe_config.get("trim_audio", 0) == 1 and whisper_config:
+        trimmed_audio = None
+        try:
+            trimmed_audio = trim_audio(mp3_file_path, whisper_config, call_data.get("tones"))
+        except Exception as err:
+            module_logger.warning(f"<<Transcribe>> unable to trim {mp3_file_path}, sending it whole: {err}")
+        if trimmed_audio == b"":
+            module_logger.info(f"<<Transcribe>> no speech left in {mp3_file_path} after trimming, skipping upload")
+            return None, whisper_config
+        if trimmed_audio is not None:
+            audio_file_name = os.path.basename(mp3_file_path)
+            whisper_config = apply_transcript_context(transcript_context, transcribe_config, call_data,
+                                                      whisper_config)
+            return (audio_file_name, trimmed_audio, 'audio/mpeg'), dict(whisper_config, cut_tones=False,
+                                                                        vad_filter=False)
+
+    whisper_config = apply_transcript_context(transcript_context, transcribe_config, call_data, whisper_config)
+    with open(mp3_file_path, 'rb') as audio_file:
+        return (os.path.basename(mp3_file_path), audio_file.read(), None), whisper_config
+
+
+def upload_to_transcribe(transcribe_config, mp3_file_path, call_data, talkgroup_config=None,
+                         transcript_context=None):
     url = transcribe_config['api_url']
     module_logger.info(f'Starting upload to <<iCAD>> <<Transcribe>>: {url}')
 
     config_data = {}  # Initialize as an empty dict
 
-    if talkgroup_config:
-        config_data['whisper_config_data'] = json.dumps(talkgroup_config.get("whisper", {}))
-
     try:
+        audio_file, whisper_config = prepare_transcribe_upload(transcribe_config, mp3_file_path, call_data,
+                                                               talkgroup_config, transcript_context)
+        if audio_file is None:
+            return dict(EMPTY_TRANSCRIPT)
+
+        if talkgroup_config:
+            config_data['whisper_config_data'] = json.dumps(whisper_config)
+
         json_string = json.dumps(call_data)
         json_bytes = json_string.encode('utf-8')
 
-        with open(mp3_file_path, 'rb') as audio_file:
-             data = {
-                 'audioFile': audio_file,
-                 'jsonFile': json_bytes
-             }
-             response = requests.post(url, files=data, data=config_data)
+        data = {
+            'audioFile': audio_file,
+            'jsonFile': json_bytes
+        }
+        response = requests.post(url, files=data, data=config_data)
 
         response.raise_for_status()
         response_json = response.json()
         module_logger.info(f'<<iCAD>> <<Transcribe>> successfully transcribed audio: {url}')
+        update_transcript_context(transcript_context, call_data, talkgroup_config, response_json)
 
         return response_json
 
@@ -39,3 +164,165 @@ def upload_to_transcribe(transcribe_config, mp3_file_path, call_data, talkgroup_
     except Exception as err:
         module_logger.error(f"<<Unexpected>> <<error>> occurred while uploading to <<iCAD>> <<Transcribe>> API: {err}")
         return None
+
+
+class TranscribeJob:
+    __slots__ = ("transcribe_config", "mp3_file_path", "call_data", "talkgroup_config", "transcript_context",
+                 "future")
+
+    def __init__(self, transcribe_config, mp3_file_path, call_data, talkgroup_config, transcript_context):
+        self.transcribe_config = transcribe_config
+        self.mp3_file_path = mp3_file_path
+        self.call_data = call_data
+        self.talkgroup_config = talkgroup_config
+        self.transcript_context = transcript_context
+        self.future = Future()
+
+
+# How long a thread of a retired dispatcher waits for another call before exiting.
+RETIRED_IDLE_SECONDS = 1.0
+
+
+class TranscribeDispatcher:
+    """
+    Sends calls to one transcribe API URL from at most max_concurrency threads, so no more requests are in flight
+    at once whichever systems the calls come from. Each call carries its own transcribe section and context.
+
+    Calls wait in a priority queue and talkgroups with a higher transcribe_priority, such as dispatch channels,
+    are sent first. Threads start as calls arrive. Once retired, because no system uses the URL any more, they
+    exit when the queue is empty, and a call still running on an old configuration starts them again.
+    """
+
+    def __init__(self, api_url, max_concurrency=4):
+        self.api_url = api_url
+        self.max_concurrency = max(1, max_concurrency)
+        self.queue = queue.PriorityQueue()
+        self.sequence = itertools.count()
+        self.thread_numbers = itertools.count(1)
+        self.lock = threading.Lock()
+        self.thread_count = 0
+        self.pending_count = 0
+        self.retired = False
+
+    def submit(self, transcribe_config, mp3_file_path, call_data, talkgroup_config=None, transcript_context=None):
+        """
+        Queues a call and returns a Future resolving to its transcript, or None if transcription failed.
+        """
+        job = TranscribeJob(transcribe_config, mp3_file_path, call_data, talkgroup_config, transcript_context)
+        priority = (talkgroup_config or {}).get("transcribe_priority", 0)
+        with self.lock:
+            self.queue.put((-priority, next(self.sequence), job))
+            self.pending_count += 1
+            if self.thread_count < min(self.pending_count, self.max_concurrency):
+                self.thread_count += 1
+                threading.Thread(target=self._worker, name=f"transcribe_{next(self.thread_numbers)}",
+                                 daemon=True).start()
+        return job.future
+
+    def configure(self, max_concurrency, retired=False):
+        """
+        Changes the thread limit or retires the dispatcher. Surplus threads exit once the calls queued so far are
+        sent.
+        """
+        with self.lock:
+            self.max_concurrency = max(1, max_concurrency)
+            self.retired = retired
+            surplus = self.thread_count if retired else self.thread_count - self.max_concurrency
+            # Wake markers sort after every call, whatever its priority.
+            for _ in range(max(0, surplus)):
+                self.queue.put((float("inf"), next(self.sequence), None))
+
+    def _should_exit(self):
+        with self.lock:
+            if (self.retired and self.pending_count == 0) or self.thread_count > self.max_concurrency:
+                self.thread_count -= 1
+                return True
+            return False
+
+    def _worker(self):
+        while True:
+            try:
+                job = self.queue.get(timeout=RETIRED_IDLE_SECONDS if self.retired else None)[2]
+            except queue.Empty:
+                job = None
+            if job is None:
+                if self._should_exit():
+                    return
+                continue
+
+            with self.lock:
+                self.pending_count -= 1
+            result = None
+            try:
+                result = upload_to_transcribe(job.transcribe_config, job.mp3_file_path, job.call_data,
+                                              job.talkgroup_config, job.transcript_context)
+            except Exception as e:
+                module_logger.error(f"<<Unexpected>> <<error>> in <<Transcribe>> dispatcher: {e}")
+            job.future.set_result(result)
+
+
+def create_transcript_context(transcribe_config):
+    return TranscriptContextCache(transcribe_config.get("context_max_entries", 1000),
+                                  transcribe_config.get("context_ttl_seconds", 300))
+
+
+_transcribe_dispatchers = {}
+_transcript_contexts = {}
+_active_transcribe_keys = None
+_active_url_concurrency = None
+_transcribe_dispatchers_lock = threading.Lock()
+
+
+def submit_to_transcribe(transcribe_config, mp3_file_path, call_data, talkgroup_config=None):
+    """
+    Queues a call on the shared dispatcher for its API URL and returns the transcript Future.
+
+    Systems sending to the same URL share its dispatcher, capped by the lowest max_concurrency among them, while
+    each transcribe section keeps its own settings and transcript context. A call still running on a
+    configuration replaced by a reload keeps to that cap, and its context is not kept.
+    """
+    transcribe_key = json.dumps(transcribe_config, sort_keys=True)
+    api_url = transcribe_config["api_url"]
+    with _transcribe_dispatchers_lock:
+        dispatcher = _transcribe_dispatchers.get(api_url)
+        if dispatcher is None:
+            dispatcher = _transcribe_dispatchers[api_url] = TranscribeDispatcher(
+                api_url, transcribe_config.get("max_concurrency", 4))
+            if _active_url_concurrency is not None:
+                if api_url in _active_url_concurrency:
+                    dispatcher.configure(_active_url_concurrency[api_url])
+                else:
+                    dispatcher.configure(dispatcher.max_concurrency, retired=True)
+        transcript_context = _transcript_contexts.get(transcribe_key)
+        if transcript_context is None:
+            transcript_context = create_transcript_context(transcribe_config)
+            if _active_transcribe_keys is None or transcribe_key in _active_transcribe_keys:
+                _transcript_contexts[transcribe_key] = transcript_context
+    return dispatcher.submit(transcribe_config, mp3_file_path, call_data, talkgroup_config, transcript_context)
+
+
+def retire_transcribe_dispatchers(transcribe_configs):
+    """
+    Applies the transcribe configurations in use after a reload: each URL's dispatcher is capped by the lowest
+    max_concurrency sending to it, dispatchers of URLs no longer used are retired once their queued calls are sent
+    and the contexts of replaced sections are dropped.
+    """
+    global _active_transcribe_keys, _active_url_concurrency
+    with _transcribe_dispatchers_lock:
+        _active_transcribe_keys = set()
+        _active_url_concurrency = url_concurrency = {}
+        for transcribe_config in transcribe_configs:
+            _active_transcribe_keys.add(json.dumps(transcribe_config, sort_keys=True))
+            api_url = transcribe_config["api_url"]
+            max_concurrency = transcribe_config.get("max_concurrency", 4)
+            url_concurrency[api_url] = min(url_concurrency.get(api_url, max_concurrency), max_concurrency)
+
+        for api_url, dispatcher in _transcribe_dispatchers.items():
+            if api_url in url_concurrency:
+                dispatcher.configure(url_concurrency[api_url])
+            elif not dispatcher.retired:
+                module_logger.info(f"<<Transcribe>> retiring the dispatcher for {api_url}, no system uses it")
+                dispatcher.configure(dispatcher.max_concurrency, retired=True)
+        for transcribe_key in list(_transcript_contexts):
+            if transcribe_key not in _active_transcribe_keys:
+                del _transcript_contexts[transcribe_key]
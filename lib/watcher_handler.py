@@ -1,21 +1,44 @@
 import logging
 import os
-from concurrent.futures import ThreadPoolExecutor
-import time
+import threading
 
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 
-from lib.call_processor import process_call
+from lib.call_processor import preload_stage_dependencies, process_call, retire_replaced_clients
+from lib.claim_handler import ClaimManager
+from lib.coalescer_handler import EventCoalescer
+from lib.journal_handler import get_call_journal
+from lib.scanner_handler import DirectoryScanner
+from lib.staging_handler import sweep_staging_directory
+from lib.worker_pool_handler import create_executor
 
 module_logger = logging.getLogger('rtl_watcher.watcher')
 
 
+class InFlightCall:
+    __slots__ = ("future",)
+
+    def __init__(self):
+        self.future = None
+
+
 class FileEventHandler(FileSystemEventHandler):
-    def __init__(self, executor, system_config_data):
-        self.system_config_data = system_config_data
+    """
+    Feeds observer events for MP3s through an EventCoalescer, so each call is submitted once its file is
+    complete, whether the recorder renames it into place or writes it in place.
+    """
+
+    def __init__(self, executor, system_config, claim_manager=None):
+        self.system_config = system_config
         self.executor = executor
-        self.futures = []
+        self.claim_manager = claim_manager
+        self.coalescer = EventCoalescer(self.process_path, system_config.event_debounce_ms / 1000,
+                                        system_config.event_stable_seconds, name=f"coalescer-{system_config.name}")
+        # Calls submitted and not yet finalized, by path, so the same call is never queued twice at once. Entries
+        # last until the call's files are finalized, as uploads still running hold them after processing returns.
+        self.in_flight = {}
+        self.in_flight_lock = threading.Lock()
 
     def on_moved(self, event):
         """
@@ -25,6 +48,8 @@ class FileEventHandler(FileSystemEventHandler):
         event: The event object containing information about the move.
         """
         module_logger.debug(f"File or directory moved: {event.dest_path}")
+        if not event.is_directory:
+            self.coalescer.discard(event.src_path)
         self._process_file_moved_created_event(event, event.dest_path)
 
     def on_created(self, event):
@@ -34,9 +59,8 @@ class FileEventHandler(FileSystemEventHandler):
         Args:
         event: The event object containing information about the creation.
         """
-        #module_logger.debug(f"File or directory created: {event.src_path}")
-        #self._process_file_moved_created_event(event, event.src_path)
-        pass
+        module_logger.debug(f"File or directory created: {event.src_path}")
+        self._process_file_moved_created_event(event, event.src_path)
 
     def on_opened(self, event):
         """
@@ -65,8 +89,7 @@ class FileEventHandler(FileSystemEventHandler):
         Args:
         event: The event object containing information about the modification.
         """
-        #module_logger.debug(f"File or directory modified: {event.src_path}")
-        pass
+        self._process_file_moved_created_event(event, event.src_path)
 
     def _process_file_moved_created_event(self, event, event_path):
         """
@@ -75,52 +98,263 @@ class FileEventHandler(FileSystemEventHandler):
         Args:
         path (str): The path of the file or directory.
         """
-        if not event.is_directory:
-            _, file_extension = os.path.splitext(event_path)
-            if file_extension.lower() in [".mp3"]:
-                module_logger.debug(f"Starting new thread for file: {event_path}")
+        if not event.is_directory and self._is_call_path(event_path):
+            self.coalescer.add(event_path)
+
+    def _is_call_path(self, file_path):
+        _, file_extension = os.path.splitext(file_path)
+        if file_extension.lower() not in [".mp3"]:
+            return False
+        return self.claim_manager is None or not self.claim_manager.is_claim_path(file_path)
+
+    def process_path(self, file_path):
+        """
+        Claims (when enabled) and submits a stable MP3 found by the coalescer or the polling scanner.
+        """
+        if self._is_call_path(file_path):
+            if self.claim_manager is not None:
+                file_path = self.claim_manager.claim(file_path)
+                if file_path is None:
+                    return
+            self.submit_call(file_path)
+
+    def submit_call(self, mp3_file_path):
+        """
+        Submits a call to the processing pool unless it is already queued or being processed.
+        """
+        in_flight_call = InFlightCall()
+        with self.in_flight_lock:
+            if mp3_file_path in self.in_flight:
+                module_logger.debug(f"{mp3_file_path} is already in flight, skipping")
+                return
+            # Reserved before submitting so a concurrent event for the same path can't slip in.
+            self.in_flight[mp3_file_path] = in_flight_call
+            active_threads = sum(1 for call in self.in_flight.values()
+                                 if call.future is not None and call.future.running())
 
-                # Log the number of currently running threads before submitting the new task
-                active_threads = sum(1 for f in self.futures if f.running())
-                module_logger.debug(f"Currently active threads before submitting: {active_threads}")
+        module_logger.debug(f"Starting new thread for file: {mp3_file_path}")
+        module_logger.debug(f"Currently active threads before submitting: {active_threads}")
 
-                try:
-                    future = self.executor.submit(process_call, self.system_config_data, event_path)
-                    self.futures.append(future)
+        def on_finalized(finalized_mp3_file_path):
+            # Claimed calls are released once their files are finalized, after the last upload finishes.
+            try:
+                if self.claim_manager is not None:
+                    self.claim_manager.release(finalized_mp3_file_path)
+            finally:
+                self._call_done(mp3_file_path, in_flight_call)
 
-                    # Log the number of currently running threads after submitting the new task
-                    active_threads = sum(1 for f in self.futures if f.running())
-                    module_logger.debug(f"Currently active threads after submitting: {active_threads}")
+        try:
+            future = self.executor.submit(process_call, self.system_config, mp3_file_path, on_finalized)
+        except Exception as e:
+            module_logger.error(f"Error starting thread for file {mp3_file_path}: {e}", exc_info=True)
+            self._call_done(mp3_file_path, in_flight_call)
+            return
 
-                except Exception as e:
-                    module_logger.error(f"Error starting thread for file {event_path}: {e}", exc_info=True)
+        with self.in_flight_lock:
+            in_flight_call.future = future
+        future.add_done_callback(lambda done_future: self._call_returned(mp3_file_path, in_flight_call, done_future))
+
+    def _call_returned(self, mp3_file_path, in_flight_call, future):
+        # Skipped or failed calls may never be finalized, so they leave in_flight as soon as they return.
+        if future.cancelled() or future.exception() is not None or not future.result():
+            self._call_done(mp3_file_path, in_flight_call)
+
+    def _call_done(self, mp3_file_path, in_flight_call):
+        with self.in_flight_lock:
+            # A later submission of the same path has its own entry.
+            if self.in_flight.get(mp3_file_path) is in_flight_call:
+                del self.in_flight[mp3_file_path]
 
 
 class Watcher:
-    def __init__(self, system_config_data):
-        self.system_config_data = system_config_data
-        self.directory_to_watch = self.system_config_data.get("watch_directory") or None
+    def __init__(self, system_config, previous_thread=None):
+        self.system_config = system_config
+        self.directory_to_watch = self.system_config.watch_directory
+        # The thread of the watcher this one replaces, which has to finish its in-flight calls first.
+        self.previous_thread = previous_thread
+        self.config_lock = threading.Lock()
+        self.observer = None
+        self.executor = None
+        self.claim_manager = None
+        self.event_handler = None
+        self.stop_event = threading.Event()
+
+    def _create_components(self):
         self.observer = Observer()
-        self.executor = ThreadPoolExecutor(max_workers=self.system_config_data.get("max_processing_threads", 10))
+        self.executor = create_executor(self.system_config)
+        if self.system_config.claim is not None:
+            self.claim_manager = ClaimManager(self.system_config.claim, self.directory_to_watch,
+                                              on_reclaimed=self.submit_calls)
+        self.event_handler = FileEventHandler(self.executor, self.system_config, self.claim_manager)
 
     def run(self):
+        if self.previous_thread is not None and self.previous_thread.is_alive():
+            module_logger.info(f"Waiting for the previous Folder Watcher For: {self.system_config.name} to finish "
+                               f"in-flight calls")
+            self.previous_thread.join()
+        self.previous_thread = None
 
-        event_handler = FileEventHandler(self.executor, self.system_config_data)
-        if self.directory_to_watch:
-            module_logger.info(
-                f"Watching directory {self.directory_to_watch} with {self.system_config_data.get("max_processing_threads", 10)} processing threads.")
-            self.observer.schedule(event_handler, self.directory_to_watch, recursive=True)
+        # Built only now, so the executor and claim manager never overlap with the ones being replaced.
+        with self.config_lock:
+            if self.stop_event.is_set():
+                return
+            self._create_components()
+
+        module_logger.info(
+            f"Watching directory {self.directory_to_watch} with {self.system_config.max_processing_threads} processing threads.")
+
+        # Optional libraries load on a processing thread while the watcher starts.
+        self.executor.submit(preload_stage_dependencies, self.system_config)
+
+        scanner = None
+        scanner_thread = None
+        if self.system_config.watch_mode == "polling":
+            scanner = DirectoryScanner(self.directory_to_watch, self.event_handler.process_path,
+                                       scan_interval=self.system_config.scan_interval,
+                                       scan_existing=self.system_config.scan_existing,
+                                       ignore_path=self.claim_manager.is_claim_path if self.claim_manager else None)
+            scanner_thread = threading.Thread(target=scanner.run, name=f"scanner-{self.system_config.name}")
+            scanner_thread.start()
         else:
-            module_logger.error("Watch Directory not set.")
-            return
+            self.event_handler.coalescer.start()
+            self.observer.schedule(self.event_handler, self.directory_to_watch, recursive=True)
+            self.observer.start()
+
+        sweep_staging_directory(self.system_config.temp_file_path, self.system_config.name)
+
+        pending_claims = []
+        if self.claim_manager is not None:
+            self.claim_manager.start()
+            # Resume calls this node claimed before it last stopped.
+            pending_claims = self.claim_manager.pending_claims()
+            self.submit_calls(pending_claims)
+
+        if self.system_config.journal is not None:
+            # Resume calls interrupted mid-processing, skipping the stages the journal shows already ran.
+            call_journal = get_call_journal(self.system_config.journal, self.system_config.name)
+            interrupted_calls = call_journal.interrupted_calls()
+            self.submit_calls([call for call in interrupted_calls if call not in pending_claims])
 
-        self.observer.start()
         try:
-            while True:
-                time.sleep(5)
+            while not self.stop_event.wait(5):
+                pass
         except KeyboardInterrupt:
+            pass
+
+        if scanner is not None:
+            scanner.stop()
+            scanner_thread.join()
+            module_logger.info(f"Scanner Stopped for {self.directory_to_watch}")
+        else:
             self.observer.stop()
-            module_logger.info("Observer Stopped")
+            module_logger.info(f"Observer Stopped for {self.directory_to_watch}")
+            self.observer.join()
+            # Files still settling are submitted before the executor drains.
+            self.event_handler.coalescer.stop()
+
+        if self.claim_manager is not None:
+            self.claim_manager.stop()
 
-        self.observer.join()
+        # In-flight calls finish on the configuration they were submitted with.
         self.executor.shutdown(wait=True)
+
+    def submit_calls(self, mp3_file_paths):
+        for mp3_file_path in mp3_file_paths:
+            self.event_handler.submit_call(mp3_file_path)
+
+    def update_config(self, system_config):
+        """
+        Swaps the configuration snapshot used for newly submitted calls.
+        """
+        with self.config_lock:
+            self.system_config = system_config
+            if self.event_handler is not None:
+                self.event_handler.system_config = system_config
+
+    def requires_restart(self, system_config):
+        """
+        Returns True if the new configuration can't be applied to the running watcher.
+        """
+        return (system_config.watch_directory != self.system_config.watch_directory or
+                system_config.max_processing_threads != self.system_config.max_processing_threads or
+                system_config.autoscale != self.system_config.autoscale or
+                system_config.worker_pool != self.system_config.worker_pool or
+                system_config.worker_weight != self.system_config.worker_weight or
+                system_config.reserved_threads != self.system_config.reserved_threads or
+                system_config.claim != self.system_config.claim or
+                system_config.journal != self.system_config.journal or
+                system_config.watch_mode != self.system_config.watch_mode or
+                system_config.scan_interval != self.system_config.scan_interval or
+                system_config.scan_existing != self.system_config.scan_existing or
+                system_config.event_debounce_ms != self.system_config.event_debounce_ms or
+                system_config.event_stable_seconds != self.system_config.event_stable_seconds)
+
+    def stop(self):
+        self.stop_event.set()
+
+
+class WatcherManager:
+    """
+    Starts, stops and updates one Watcher per configured system.
+    """
+
+    def __init__(self):
+        self.watchers = {}
+        self.watcher_threads = {}
+        self.draining_threads = {}
+        self.lock = threading.Lock()
+
+    def apply(self, system_configs):
+        """
+        Applies a new set of validated system configurations.
+
+        New systems are started, removed systems are stopped and changed systems either get the new
+        snapshot swapped in or, when the watch directory or thread count changed, are restarted. A system's
+        previous watcher finishes its in-flight calls before its replacement starts, otherwise the new claim
+        manager and journal would resubmit calls the old executor still holds. The replacement waits on its own
+        thread, so apply never blocks on a drain.
+        """
+        with self.lock:
+            for system in list(self.watchers):
+                if system not in system_configs:
+                    module_logger.info(f"Stopping Folder Watcher For: {system}")
+                    self._stop_watcher(system)
+
+            for system, system_config in system_configs.items():
+                watcher = self.watchers.get(system)
+                if watcher is not None and watcher.requires_restart(system_config):
+                    module_logger.info(f"Restarting Folder Watcher For: {system}")
+                    self._stop_watcher(system)
+                    watcher = None
+
+                if watcher is None:
+                    module_logger.info(f"Starting Folder Watcher For: {system}")
+                    self._start_watcher(system, system_config)
+                elif watcher.system_config is not system_config:
+                    module_logger.info(f"Updated Configuration For: {system}")
+                    watcher.update_config(system_config)
+
+            retire_replaced_clients(system_configs)
+
+    def _start_watcher(self, system, system_config):
+        watcher = Watcher(system_config, self.draining_threads.pop(system, None))
+        t = threading.Thread(target=watcher.run, name=f"watcher-{system}")
+        t.start()
+        self.watchers[system] = watcher
+        self.watcher_threads[system] = t
+
+    def _stop_watcher(self, system):
+        # The watcher thread drains its executor in the background, only a replacement for the same system waits.
+        # A replacement that is still waiting hands its wait down, its thread ends once the previous one does.
+        self.watchers.pop(system).stop()
+        self.draining_threads[system] = self.watcher_threads.pop(system)
+
+    def stop(self):
+        with self.lock:
+            for system in list(self.watchers):
+                self._stop_watcher(system)
+            threads = list(self.draining_threads.values())
+            self.draining_threads.clear()
+
+        for t in threads:
+            t.join()
@@ -0,0 +1,382 @@
+import collections
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from lib.metrics_handler import metrics
+
+module_logger = logging.getLogger('rtl_watcher.worker_pool')
+
+
+class WorkerBudget:
+    """
+    Process wide cap on processing threads shared by every system's pool.
+
+    Fixed pools reserve their threads up front and autoscaled pools take one per thread they start, so one busy
+    system can borrow the capacity quiet systems are not using. Every pool is granted its first thread even when
+    the budget is spent, otherwise its calls would never run; anything beyond that, minimums included, is clamped
+    to the limit. A limit of 0 disables the cap.
+    """
+
+    def __init__(self, limit=0):
+        self.limit = limit
+        self.lock = threading.Lock()
+        self.active = 0
+
+    def set_limit(self, limit):
+        with self.lock:
+            self.limit = limit
+
+    def acquire(self, required=False):
+        with self.lock:
+            if not required and self.limit and self.active >= self.limit:
+                return False
+            self.active += 1
+            return True
+
+    def reserve(self, count):
+        """
+        Takes up to count threads for a fixed pool, at least one, and returns how many were granted.
+        """
+        with self.lock:
+            granted = max(1, min(count, self.limit - self.active)) if self.limit else count
+            self.active += granted
+            return granted
+
+    def release(self, count=1):
+        with self.lock:
+            self.active -= count
+
+
+worker_budget = WorkerBudget()
+
+
+class AdaptiveWorkerPool:
+    """
+    Executor whose thread count follows the load between min_workers and max_workers.
+
+    A thread is added when calls are queued with no idle worker to take them, unless the recent call time says
+    the backlog will clear within target_wait_seconds anyway, the host load per CPU is above max_load_per_cpu, or
+    the global worker budget is spent. This is checked on every submit and whenever a worker finishes a call, so a
+    backlog that builds without new submissions still grows the pool. Threads above the minimum exit after
+    idle_seconds without work.
+    """
+
+    def __init__(self, name, min_workers, max_workers, autoscale_config, budget=worker_budget):
+        self.name = name
+        self.min_workers = max(1, min(min_workers, max_workers))
+        self.max_workers = max_workers
+        self.idle_seconds = autoscale_config.get("idle_seconds", 30)
+        self.target_wait_seconds = autoscale_config.get("target_wait_seconds", 2)
+        self.max_load_per_cpu = autoscale_config.get("max_load_per_cpu", 1.5)
+        self.budget = budget
+        self.work_queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.workers = set()
+        self.idle_workers = 0
+        self.worker_counter = 0
+        self.shutting_down = False
+
+        with self.lock:
+            self._start_worker(required=True)
+            while len(self.workers) < self.min_workers and self._start_worker():
+                pass
+            if len(self.workers) < self.min_workers:
+                module_logger.warning(f"{self.name} worker pool started {len(self.workers)} of its "
+                                      f"{self.min_workers} minimum threads, the worker budget is spent")
+                self.min_workers = len(self.workers)
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        with self.lock:
+            if self.shutting_down:
+                raise RuntimeError("cannot schedule new calls after shutdown")
+            self.work_queue.put((future, fn, args, kwargs))
+            self._scale_up()
+        return future
+
+    def shutdown(self, wait=True):
+        """
+        Stops the pool once every queued call has run, like ThreadPoolExecutor.shutdown.
+        """
+        with self.lock:
+            self.shutting_down = True
+            workers = list(self.workers)
+            for _ in workers:
+                self.work_queue.put(None)
+        if wait:
+            for worker in workers:
+                worker.join()
+
+    def _scale_up(self):
+        pending = self.work_queue.qsize()
+        if pending <= self.idle_workers or len(self.workers) >= self.max_workers:
+            return
+
+        average_call_seconds = self._recent_call_seconds()
+        if average_call_seconds is not None:
+            busy_workers = max(len(self.workers) - self.idle_workers, 1)
+            if pending * average_call_seconds / busy_workers < self.target_wait_seconds:
+                return
+
+        if self.max_load_per_cpu and hasattr(os, "getloadavg"):
+            if os.getloadavg()[0] / (os.cpu_count() or 1) > self.max_load_per_cpu:
+                return
+
+        if self._start_worker():
+            module_logger.debug(f"{self.name} worker pool grew to {len(self.workers)} threads, {pending} queued")
+
+    def _recent_call_seconds(self):
+        """
+        Returns the recent average call time, or before any call has finished, the sum of the recent stage times.
+        """
+        average_call_seconds = metrics.recent_call_average(self.name)
+        if average_call_seconds is None:
+            stage_averages = metrics.recent_stage_averages(self.name)
+            average_call_seconds = sum(stage_averages.values()) if stage_averages else None
+        return average_call_seconds
+
+    def _start_worker(self, required=False):
+        if not self.budget.acquire(required):
+            return False
+        self.worker_counter += 1
+        worker = threading.Thread(target=self._worker, name=f"{self.name}_{self.worker_counter}", daemon=True)
+        self.workers.add(worker)
+        worker.start()
+        return True
+
+    def _worker(self):
+        worker = threading.current_thread()
+        try:
+            while True:
+                with self.lock:
+                    self.idle_workers += 1
+                try:
+                    work_item = self.work_queue.get(timeout=self.idle_seconds)
+                except queue.Empty:
+                    with self.lock:
+                        self.idle_workers -= 1
+                        if len(self.workers) > self.min_workers and not self.shutting_down:
+                            self.workers.discard(worker)
+                            module_logger.debug(
+                                f"{self.name} worker pool shrank to {len(self.workers)} threads")
+                            return
+                    continue
+
+                with self.lock:
+                    self.idle_workers -= 1
+                if work_item is None:
+                    with self.lock:
+                        self.workers.discard(worker)
+                    return
+
+                future, fn, args, kwargs = work_item
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    future.set_result(fn(*args, **kwargs))
+                except BaseException as e:
+                    future.set_exception(e)
+                with self.lock:
+                    if not self.shutting_down:
+                        self._scale_up()
+        finally:
+            self.budget.release()
+
+
+class FixedWorkerPool(ThreadPoolExecutor):
+    """
+    ThreadPoolExecutor whose threads are reserved from the worker budget for as long as the pool runs.
+    """
+
+    def __init__(self, name, max_workers, budget=worker_budget):
+        self.budget = budget
+        self.budget_lock = threading.Lock()
+        self.reserved = budget.reserve(max_workers)
+        if self.reserved < max_workers:
+            module_logger.warning(f"{name} worker pool limited to {self.reserved} of its {max_workers} threads by "
+                                  f"the worker budget")
+        super().__init__(max_workers=self.reserved, thread_name_prefix=name)
+
+    def shutdown(self, wait=True, **kwargs):
+        super().shutdown(wait=wait, **kwargs)
+        with self.budget_lock:
+            reserved, self.reserved = self.reserved, 0
+        if reserved:
+            self.budget.release(reserved)
+
+
+class SystemQueue:
+    """
+    One system's queue in the SharedWorkerPool, used by its Watcher in place of an executor.
+    """
+
+    def __init__(self, pool, name, weight, reserved_threads):
+        self.pool = pool
+        self.name = name
+        self.weight = weight
+        self.reserved_threads = reserved_threads
+        self.pending = collections.deque()
+        self.running = 0
+        self.pass_value = 0.0
+        self.closed = False
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        self.pool.enqueue(self, (future, fn, args, kwargs))
+        return future
+
+    def shutdown(self, wait=True):
+        """
+        Stops accepting calls and, with wait, returns once this system's queued and running calls are done.
+        """
+        self.pool.close(self, wait)
+
+
+class SharedWorkerPool:
+    """
+    One set of processing threads shared by every system in the process.
+
+    Calls queue per system and free threads pick the next one by weighted fair queuing (stride scheduling): each
+    dispatch advances the system's pass by 1 / weight and the lowest pass goes next, so a system with weight 2
+    gets twice the threads of a weight 1 system while both are busy and all of them when it is the only one
+    busy. Systems below their reserved_threads are served first, and enough threads are held back for the
+    reservations of every registered system.
+    """
+
+    def __init__(self, thread_count):
+        self.condition = threading.Condition()
+        self.queues = []
+        self.thread_count = 0
+        self.threads = 0
+        self.idle_threads = 0
+        self.virtual_time = 0.0
+        self.thread_counter = 0
+        self.resize(thread_count)
+
+    def resize(self, thread_count):
+        with self.condition:
+            self.thread_count = max(thread_count, sum(q.reserved_threads for q in self.queues) + 1)
+            while self.threads < self.thread_count:
+                self.threads += 1
+                self.thread_counter += 1
+                threading.Thread(target=self._worker, name=f"shared_worker_{self.thread_counter}",
+                                 daemon=True).start()
+            # Extra threads exit the next time they are idle.
+            self.condition.notify_all()
+
+    def register(self, name, weight=1, reserved_threads=0):
+        system_queue = SystemQueue(self, name, weight, reserved_threads)
+        with self.condition:
+            system_queue.pass_value = self.virtual_time
+            self.queues.append(system_queue)
+        if sum(q.reserved_threads for q in self.queues) >= self.thread_count:
+            module_logger.warning(f"Shared worker pool reservations exceed its {self.thread_count} threads, growing it.")
+            self.resize(self.thread_count)
+        return system_queue
+
+    def enqueue(self, system_queue, work_item):
+        with self.condition:
+            if system_queue.closed:
+                raise RuntimeError("cannot schedule new calls after shutdown")
+            if not system_queue.pending and not system_queue.running:
+                # A system returning from idle starts level with the others instead of spending saved-up credit.
+                system_queue.pass_value = max(system_queue.pass_value, self.virtual_time)
+            system_queue.pending.append(work_item)
+            self.condition.notify()
+
+    def close(self, system_queue, wait):
+        with self.condition:
+            system_queue.closed = True
+            if wait:
+                self.condition.wait_for(lambda: not system_queue.pending and not system_queue.running)
+            if not system_queue.pending and not system_queue.running and system_queue in self.queues:
+                self.queues.remove(system_queue)
+                self.condition.notify_all()
+
+    def _next_work_item(self):
+        waiting = [q for q in self.queues if q.pending]
+        if not waiting:
+            return None
+
+        under_reserved = [q for q in waiting if q.running < q.reserved_threads]
+        if under_reserved:
+            system_queue = min(under_reserved, key=lambda q: q.pass_value)
+        else:
+            # Keep enough idle threads for systems that have not used their reservation yet.
+            outstanding = sum(max(0, q.reserved_threads - q.running) for q in self.queues if not q.closed)
+            if self.idle_threads - 1 < outstanding:
+                return None
+            system_queue = min(waiting, key=lambda q: q.pass_value)
+
+        self.virtual_time = system_queue.pass_value
+        system_queue.pass_value += 1 / system_queue.weight
+        system_queue.running += 1
+        return system_queue, system_queue.pending.popleft()
+
+    def _worker(self):
+        while True:
+            with self.condition:
+                self.idle_threads += 1
+                next_item = None
+                while next_item is None:
+                    if self.threads > self.thread_count:
+                        self.threads -= 1
+                        self.idle_threads -= 1
+                        return
+                    next_item = self._next_work_item()
+                    if next_item is None:
+                        self.condition.wait()
+                self.idle_threads -= 1
+
+            system_queue, (future, fn, args, kwargs) = next_item
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(fn(*args, **kwargs))
+                    except BaseException as e:
+                        future.set_exception(e)
+            finally:
+                with self.condition:
+                    system_queue.running -= 1
+                    if system_queue.closed and not system_queue.pending and not system_queue.running and \
+                            system_queue in self.queues:
+                        self.queues.remove(system_queue)
+                    self.condition.notify_all()
+
+
+_shared_pool = None
+_shared_pool_lock = threading.Lock()
+
+
+def get_shared_pool(thread_count):
+    """
+    Returns the process wide SharedWorkerPool, creating it or resizing it to thread_count.
+    """
+    global _shared_pool
+    with _shared_pool_lock:
+        if _shared_pool is None:
+            _shared_pool = SharedWorkerPool(thread_count)
+        elif _shared_pool.thread_count != thread_count:
+            _shared_pool.resize(thread_count)
+        return _shared_pool
+
+
+def create_executor(system_config):
+    """
+    Returns the call processing executor for a system: its queue in the shared pool when worker_pool.shared is
+    enabled, an AdaptiveWorkerPool when autoscale is enabled, otherwise a FixedWorkerPool of
+    max_processing_threads. Both draw on the worker_pool.max_total_threads budget.
+    """
+    if system_config.worker_pool.get("shared", 0) == 1:
+        thread_count = system_config.worker_pool.get("shared_threads", 0) or (os.cpu_count() or 1) * 4
+        return get_shared_pool(thread_count).register(system_config.name, system_config.worker_weight,
+                                                      system_config.reserved_threads)
+
+    worker_budget.set_limit(system_config.worker_pool.get("max_total_threads", 0))
+    if system_config.autoscale is None:
+        return FixedWorkerPool(system_config.name, system_config.max_processing_threads)
+    return AdaptiveWorkerPool(system_config.name, system_config.autoscale.get("min_processing_threads", 1),
+                              system_config.max_processing_threads, system_config.autoscale)
@@ -0,0 +1,67 @@
+import argparse
+import json
+import os
+import sqlite3
+import sys
+from datetime import datetime
+
+from lib.call_index_handler import parse_time, query_calls
+
+root_path = os.getcwd()
+config_file_path = os.path.join(root_path, 'etc', 'config.json')
+
+
+def default_database_path():
+    try:
+        with open(config_file_path, 'r') as f:
+            return json.load(f).get("call_index", {}).get("database_path", "var/calls.db")
+    except (OSError, ValueError):
+        return "var/calls.db"
+
+
+def format_call(call):
+    start = datetime.fromtimestamp(call["start_time"]).strftime('%Y-%m-%d %H:%M:%S')
+    transcript = call["transcript"]
+    if isinstance(transcript, dict):
+        transcript = transcript.get("transcript") or transcript.get("text") or ""
+    transcript = (transcript or "").replace("\n", " ")
+    return (f"{start}  {call['system']:<16} TG {call['talkgroup']:<6} {call['talkgroup_tag'] or '':<20} "
+            f"{call['frequency']:<10} {call['call_length']:>6.1f}s {'TONES' if call['has_tones'] else '     '}  "
+            f"{transcript[:80]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the rtl_watcher call index.")
+    parser.add_argument("--database", default=None, help="Call index database path (defaults to config.json).")
+    parser.add_argument("--system", help="System name.")
+    parser.add_argument("--talkgroup", type=int, help="Talkgroup decimal.")
+    parser.add_argument("--frequency", type=int, help="Frequency in Hz.")
+    parser.add_argument("--since", type=parse_time, help="Start of range: 1h, 30m, 2d, epoch or ISO date.")
+    parser.add_argument("--until", type=parse_time, help="End of range: 1h, 30m, 2d, epoch or ISO date.")
+    parser.add_argument("--tones", action="store_true", help="Only calls with detected tones.")
+    parser.add_argument("--transcript", help="Only calls whose transcript contains this text.")
+    parser.add_argument("--limit", type=int, default=100, help="Maximum calls to return.")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+    args = parser.parse_args()
+
+    database_path = args.database or default_database_path()
+    if not os.path.exists(database_path):
+        print(f"Call index {database_path} does not exist.", file=sys.stderr)
+        return 1
+
+    connection = sqlite3.connect(f"file:{database_path}?mode=ro", uri=True)
+    calls = query_calls(connection, system=args.system, talkgroup=args.talkgroup, frequency=args.frequency,
+                        since=args.since, until=args.until, tones=args.tones, transcript=args.transcript,
+                        limit=args.limit)
+
+    if args.json:
+        print(json.dumps(calls, indent=4))
+    else:
+        for call in calls:
+            print(format_call(call))
+        print(f"{len(calls)} calls", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+from lib.call_processor import get_stage_dependencies
+from lib.config_handler import compile_config, load_config_file
+from lib.remote_storage_handler import ARCHIVE_BACKEND_MODULES
+
+root_path = os.getcwd()
+config_file_path = os.path.join(root_path, 'etc', 'config.json')
+
+# Modules every watcher process imports regardless of configuration.
+core_modules = ["lib.watcher_handler", "lib.supervisor_handler", "lib.config_reload_handler"]
+
+profile_script = """
+import resource
+{imports}
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+
+def configured_modules(config_path):
+    config_data = load_config_file(config_path)
+    module_names = []
+    for system_config in compile_config(config_data).values():
+        for module_name in get_stage_dependencies(system_config):
+            if module_name not in module_names:
+                module_names.append(module_name)
+    return module_names
+
+
+def all_optional_modules():
+    module_names = [module_name for backend_modules in ARCHIVE_BACKEND_MODULES.values()
+                    for module_name in backend_modules]
+    return module_names + ["icad_tone_detection", "numpy"]
+
+
+def profile_imports(module_names):
+    """
+    Imports the modules in a fresh interpreter under -X importtime.
+
+    Returns (rows, max_rss_kb) where rows are (cumulative_us, self_us, depth, module) for every module loaded.
+    """
+    imports = "\n".join(f"import {module_name}" for module_name in module_names)
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", profile_script.format(imports=imports)],
+                            cwd=root_path, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, package = line[len("import time:"):].split("|")
+        depth = (len(package) - len(package.lstrip())) // 2
+        rows.append((int(cumulative_us), int(self_us), depth, package.strip()))
+    return rows, int(result.stdout.split()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report how long rtl_watcher takes to import its modules.")
+    parser.add_argument("--config", default=config_file_path, help="Profile the stages enabled in this config.")
+    parser.add_argument("--all", action="store_true", help="Profile every optional backend and stage.")
+    parser.add_argument("--core", action="store_true", help="Profile only the modules every process imports.")
+    parser.add_argument("--top", type=int, default=25, help="Number of modules to list.")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+    args = parser.parse_args()
+
+    if args.core:
+        optional_modules = []
+    elif args.all:
+        optional_modules = all_optional_modules()
+    else:
+        optional_modules = configured_modules(args.config)
+
+    try:
+        rows, max_rss_kb = profile_imports(core_modules + optional_modules)
+    except RuntimeError as e:
+        print(f"Import failed: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    total_us = sum(row[0] for row in rows if row[2] == 0)
+    rows.sort(reverse=True)
+
+    if args.json:
+        print(json.dumps({
+            "modules": core_modules + optional_modules,
+            "total_ms": total_us / 1000,
+            "max_rss_kb": max_rss_kb,
+            "imports": [{"module": module, "cumulative_ms": cumulative_us / 1000, "self_ms": self_us / 1000}
+                        for cumulative_us, self_us, depth, module in rows[:args.top]]
+        }, indent=2))
+        return
+
+    print(f"Profiled: {', '.join(core_modules + optional_modules)}")
+    print(f"Total import time {total_us / 1000:.1f} ms, peak RSS {max_rss_kb / 1024:.1f} MB\n")
+    print(f"{'cumulative':>12} {'self':>10}  module")
+    for cumulative_us, self_us, depth, module in rows[:args.top]:
+        print(f"{cumulative_us / 1000:>10.1f}ms {self_us / 1000:>8.1f}ms  {module}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+
+from lib.audio_file_handler import create_json, get_audio_file_info, parse_call_file_name, save_call_data
+from lib.call_index_handler import flush_call_indexes, get_call_index, lookup_call_data, parse_time
+from lib.config_handler import ConfigError, compile_config, load_config_file
+from lib.sqlite_handler import connect_database
+from lib.tone_detect_handler import get_tones
+from lib.transcribe_handler import create_transcript_context, upload_to_transcribe
+
+root_path = os.getcwd()
+config_file_path = os.path.join(root_path, 'etc', 'config.json')
+
+# Stages that only produce metadata, so historical calls can be rerun without posting anything anywhere.
+reprocess_stages = ("tone_detection", "transcribe")
+
+worker_system_config = None
+worker_call_index = None
+worker_transcript_context = None
+
+
+def call_start_time(mp3_file_path):
+    """
+    Returns the call start time encoded in a recorder file name (short_YYYYMMDD_HHMMSS_freq.mp3), or None.
+    """
+    try:
+        return parse_call_file_name(os.path.basename(mp3_file_path))[1]
+    except (ValueError, IndexError):
+        return None
+
+
+def find_calls(directory, since=None, until=None):
+    calls = []
+    for root, dirs, files in os.walk(directory):
+        # Skip claim and staging directories.
+        dirs[:] = [name for name in dirs if not name.startswith(".")]
+        for file_name in files:
+            if not file_name.lower().endswith(".mp3"):
+                continue
+            start_time = call_start_time(file_name)
+            if start_time is None:
+                continue
+            if (since is not None and start_time < since) or (until is not None and start_time > until):
+                continue
+            calls.append((start_time, os.path.join(root, file_name)))
+    return [mp3_file_path for start_time, mp3_file_path in sorted(calls)]
+
+
+def load_state(state_path):
+    try:
+        with open(state_path, "r", encoding="utf-8") as state_file:
+            return {line.rstrip("\n") for line in state_file}
+    except FileNotFoundError:
+        return set()
+
+
+def init_worker(config_path, system_name):
+    global worker_system_config, worker_call_index, worker_transcript_context
+    logging.basicConfig(level=logging.WARNING, format="%(processName)s %(levelname)s %(message)s")
+    worker_system_config = compile_config(load_config_file(config_path), [system_name])[system_name]
+    if worker_system_config.transcribe is not None:
+        worker_transcript_context = create_transcript_context(worker_system_config.transcribe)
+    if worker_system_config.call_index is not None:
+        worker_call_index = connect_database(
+            os.path.abspath(worker_system_config.call_index.get("database_path", "var/calls.db")))
+
+
+def load_call_data(system_config, mp3_file_path, json_file_path):
+    """
+    Returns the call's existing metadata from its JSON or, when that is gone, its call index row, so fields such
+    as the archive URLs survive the rewrite. Only a call known to neither starts from fresh metadata.
+    """
+    if os.path.exists(json_file_path):
+        with open(json_file_path, "r", encoding="utf-8") as json_file:
+            call_data = json.load(json_file)
+        if call_data:
+            return call_data
+
+    if worker_call_index is not None:
+        call_data = lookup_call_data(worker_call_index, system_config.name, os.path.basename(mp3_file_path))
+        if call_data:
+            return call_data
+
+    system_short_name, epoch_timestamp, frequency, duration_sec = get_audio_file_info(mp3_file_path)
+    talkgroup_data = system_config.get_channel(frequency)
+    if not talkgroup_data:
+        return None
+    return create_json(system_short_name, epoch_timestamp, frequency, duration_sec, talkgroup_data)
+
+
+def reprocess_call(task):
+    """
+    Runs the selected stages for one call and writes its metadata JSON next to the MP3. Only the tones and
+    transcript are replaced, and a stage that fails keeps its previous value while the others are still saved.
+
+    Returns (mp3_file_path, call_data or None, error or None); call_data is set whenever the JSON was written.
+    """
+    mp3_file_path, stages = task
+    system_config = worker_system_config
+    try:
+        system_short_name, epoch_timestamp, frequency, duration_sec = get_audio_file_info(mp3_file_path)
+        if any(value is None for value in [system_short_name, epoch_timestamp, frequency, duration_sec]):
+            return mp3_file_path, None, "can not read call information from the file name"
+
+        json_file_path = os.path.splitext(mp3_file_path)[0] + ".json"
+        call_data = load_call_data(system_config, mp3_file_path, json_file_path)
+        if call_data is None:
+            return mp3_file_path, None, f"no talkgroup configured for frequency {frequency}"
+
+        route = system_config.get_route(call_data.get("talkgroup", 0))
+        errors = []
+
+        if "tone_detection" in stages and route.tone_detection:
+            tones = get_tones(system_config.tone_detection, mp3_file_path)
+            if tones is None:
+                errors.append("tone detection failed")
+            else:
+                call_data["tones"] = tones
+
+        if "transcribe" in stages and route.transcribe:
+            transcribe_result = upload_to_transcribe(system_config.transcribe, mp3_file_path, call_data,
+                                                     route.talkgroup_config, worker_transcript_context)
+            if transcribe_result is None:
+                errors.append("transcription failed")
+            else:
+                call_data["transcript"] = transcribe_result
+
+        if not save_call_data(json_file_path, call_data):
+            return mp3_file_path, None, f"unable to write {json_file_path}"
+        return mp3_file_path, call_data, "; ".join(errors) or None
+    except Exception as e:
+        return mp3_file_path, None, str(e)
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m" if hours else f"{minutes}m{seconds:02d}s"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run archived calls back through metadata stages.")
+    parser.add_argument("--config", default=config_file_path, help="Configuration file.")
+    parser.add_argument("--system", required=True, help="System whose configuration and talkgroups to use.")
+    parser.add_argument("--directory", help="Directory of MP3 calls (defaults to the system's watch directory).")
+    parser.add_argument("--since", type=parse_time, help="Start of range: 1h, 30m, 2d, epoch or ISO date.")
+    parser.add_argument("--until", type=parse_time, help="End of range: 1h, 30m, 2d, epoch or ISO date.")
+    parser.add_argument("--stages", default=",".join(reprocess_stages),
+                        help=f"Comma separated stages to run: {', '.join(reprocess_stages)}.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes.")
+    parser.add_argument("--state", help="Progress file used to resume (defaults to var/reprocess/<system>.state).")
+    parser.add_argument("--fresh", action="store_true", help="Ignore progress from a previous run.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s %(message)s")
+
+    stages = tuple(stage.strip() for stage in args.stages.split(",") if stage.strip())
+    unknown_stages = [stage for stage in stages if stage not in reprocess_stages]
+    if not stages or unknown_stages:
+        print(f"Unknown stages {', '.join(unknown_stages)}; choose from {', '.join(reprocess_stages)}.",
+              file=sys.stderr)
+        return 1
+
+    try:
+        config_data = load_config_file(args.config)
+        system_config = compile_config(config_data, [args.system]).get(args.system)
+    except ConfigError as e:
+        print(f"Invalid configuration: {e}", file=sys.stderr)
+        return 1
+    if system_config is None:
+        print(f"System {args.system} is not configured.", file=sys.stderr)
+        return 1
+    for stage in stages:
+        if getattr(system_config, stage) is None:
+            print(f"{stage} is not enabled for {args.system}.", file=sys.stderr)
+            return 1
+
+    directory = args.directory or system_config.watch_directory
+    state_path = args.state or os.path.join("var", "reprocess", f"{args.system}.state")
+    os.makedirs(os.path.dirname(state_path) or ".", exist_ok=True)
+    if args.fresh and os.path.exists(state_path):
+        os.remove(state_path)
+    finished = load_state(state_path)
+
+    mp3_file_paths = [path for path in find_calls(directory, args.since, args.until) if path not in finished]
+    print(f"{len(mp3_file_paths)} calls to reprocess in {directory} ({len(finished)} already done), "
+          f"stages: {', '.join(stages)}", file=sys.stderr)
+    if not mp3_file_paths:
+        return 0
+
+    call_index = get_call_index(system_config.call_index) if system_config.call_index is not None else None
+    start_time = time.monotonic()
+    last_report = 0
+    failed = 0
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(args.workers, initializer=init_worker, initargs=(args.config, args.system)) as pool, \
+            open(state_path, "a", encoding="utf-8") as state_file:
+        tasks = ((mp3_file_path, stages) for mp3_file_path in mp3_file_paths)
+        for done, (mp3_file_path, call_data, error) in enumerate(
+                pool.imap_unordered(reprocess_call, tasks, chunksize=4), start=1):
+            # Partial results are indexed too, but only complete calls are skipped when the run is resumed.
+            if call_data is not None and call_index is not None:
+                call_index.add_call(args.system, mp3_file_path, call_data)
+            if error is None:
+                state_file.write(mp3_file_path + "\n")
+                state_file.flush()
+            else:
+                failed += 1
+                print(f"Failed {mp3_file_path}: {error}", file=sys.stderr)
+
+            elapsed = time.monotonic() - start_time
+            if done == len(mp3_file_paths) or elapsed - last_report >= 1:
+                last_report = elapsed
+                rate = done / elapsed if elapsed else 0
+                remaining = (len(mp3_file_paths) - done) / rate if rate else 0
+                print(f"[{done}/{len(mp3_file_paths)}] {done / len(mp3_file_paths):.1%} {rate:.1f} calls/s, "
+                      f"{failed} failed, ETA {format_duration(remaining)}", file=sys.stderr)
+
+    flush_call_indexes()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,14 @@
 import os
-import threading
 import time
 import traceback
 
-from lib.config_handler import load_config_file
+from lib.call_index_handler import flush_call_indexes
+from lib.config_handler import load_config_file, compile_config
+from lib.config_reload_handler import ConfigReloader
+from lib.journal_handler import flush_call_journals
 from lib.logging_handler import CustomLogger
-from lib.watcher_handler import Watcher
+from lib.supervisor_handler import Supervisor
+from lib.watcher_handler import WatcherManager
 
 app_name = "rtl_watcher"
 __version__ = "1.0"
@@ -17,38 +20,67 @@ log_file_name = f"{app_name}.log"
 
 log_path = os.path.join(root_path, 'log')
 
-if not os.path.exists(log_path):
-    os.makedirs(log_path)
-
 config_path = os.path.join(root_path, 'etc')
 
-logging_instance = CustomLogger(1, f'{app_name}',
-                                os.path.join(log_path, log_file_name))
+# Nothing at module level touches the config or logs: process mode workers are spawned and re-import this
+# script as __mp_main__, and must run on the configuration the supervisor hands them.
 
-try:
-    config_data = load_config_file(os.path.join(config_path, config_file_name))
-    logging_instance.set_log_level(config_data.get("log_level", 1))
-    logger = logging_instance.logger
-    logger.info("Loaded Config File")
-except Exception as e:
-    traceback.print_exc()
-    logging_instance.logger.error(f'Error while <<loading>> configuration : {e}')
-    time.sleep(5)
-    exit(1)
+
+def load_configuration(logging_instance):
+    try:
+        config_data = load_config_file(os.path.join(config_path, config_file_name))
+        logging_instance.set_log_level(config_data.get("log_level", 1))
+        logger = logging_instance.logger
+        logger.info("Loaded Config File")
+        system_configs = compile_config(config_data)
+        logger.info(f"Validated Configuration for {len(system_configs)} systems")
+        return config_data, system_configs
+    except Exception as e:
+        traceback.print_exc()
+        logging_instance.logger.error(f'Error while <<loading>> configuration : {e}')
+        time.sleep(5)
+        exit(1)
+
+
+def reload_config(new_config_data, new_system_configs, watcher_manager, logging_instance):
+    logging_instance.set_log_level(new_config_data.get("log_level", 1))
+    watcher_manager.apply(new_system_configs)
 
 
 def main():
-    watcher_threads = []
+    if not os.path.exists(log_path):
+        os.makedirs(log_path)
+
+    logging_instance = CustomLogger(1, f'{app_name}',
+                                    os.path.join(log_path, log_file_name))
+    logger = logging_instance.logger
+
+    config_data, system_configs = load_configuration(logging_instance)
+
+    if config_data.get("process_mode", {}).get("enabled", 0) == 1:
+        supervisor = Supervisor(os.path.join(config_path, config_file_name), config_data, system_configs,
+                                logging_instance)
+        supervisor.run()
+        return
+
+    watcher_manager = WatcherManager()
+    watcher_manager.apply(system_configs)
+
+    config_reloader = ConfigReloader(os.path.join(config_path, config_file_name),
+                                     lambda new_config_data, new_system_configs: reload_config(
+                                         new_config_data, new_system_configs, watcher_manager, logging_instance))
+    config_reloader.start(config_data)
 
-    for system in config_data.get("systems"):
-        watcher = Watcher(config_data["systems"][system])
-        logger.info(f"Starting Folder Watcher For: {system}")
-        t = threading.Thread(target=watcher.run)
-        t.start()
-        watcher_threads.append(t)
+    try:
+        while True:
+            time.sleep(5)
+    except KeyboardInterrupt:
+        logger.info("Shutting down, waiting for in-flight calls to finish.")
 
-    for t in watcher_threads:
-        t.join()
+    config_reloader.stop()
+    watcher_manager.stop()
+    flush_call_indexes()
+    flush_call_journals()
 
 
 if __name__ == "__main__":
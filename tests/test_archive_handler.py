@@ -0,0 +1,104 @@
+import os
+import tempfile
+import unittest
+from concurrent.futures import Future
+
+from lib import archive_handler
+from lib.archive_handler import ArchiveUploader, archive_uploader, release_blobs_on_failure, retire_archive_uploaders
+from lib.remote_storage_handler import LocalStorage
+from lib.retention_handler import RetentionIndex
+
+
+class ArchiveUploaderTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_directory = tempfile.TemporaryDirectory()
+        self.storage = LocalStorage({"link_mode": "copy"})
+        self.source_path = os.path.join(self.temp_directory.name, "call.json")
+        with open(self.source_path, "w") as source_file:
+            source_file.write("{}")
+        self.addCleanup(setattr, archive_handler, "_active_archive_keys", None)
+        self.addCleanup(archive_handler._archive_uploaders.clear)
+
+    def tearDown(self):
+        self.temp_directory.cleanup()
+
+    def archive_config(self, archive_days):
+        return {"archive_type": "local", "archive_path": self.temp_directory.name, "archive_days": archive_days,
+                "batch_window_ms": 0}
+
+    def test_retired_uploader_finishes_its_uploads_then_stops(self):
+        uploader = ArchiveUploader(self.storage, {"batch_window_ms": 0})
+        destination_path = os.path.join(self.temp_directory.name, "archive", "call.json")
+        upload_future = uploader.submit(self.source_path, destination_path, "archive")
+
+        uploader.retire()
+
+        self.assertTrue(upload_future.result(timeout=5))
+        uploader.thread.join(timeout=5)
+        self.assertFalse(uploader.thread.is_alive())
+        self.assertTrue(os.path.exists(destination_path))
+
+    def test_uploaders_are_shared_per_configuration_and_retired_on_reload(self):
+        with archive_uploader(self.archive_config(7), self.storage) as first:
+            pass
+        with archive_uploader(self.archive_config(7), self.storage) as same:
+            pass
+        self.assertIs(first, same)
+
+        retire_archive_uploaders([self.archive_config(14)])
+
+        first.thread.join(timeout=5)
+        self.assertFalse(first.thread.is_alive())
+        with archive_uploader(self.archive_config(14), self.storage) as replacement:
+            self.assertIsNot(first, replacement)
+
+    def test_call_on_a_replaced_configuration_gets_an_uploader_that_stops_after_it(self):
+        retire_archive_uploaders([self.archive_config(14)])
+
+        with archive_uploader(self.archive_config(7), self.storage) as uploader:
+            self.assertTrue(uploader.thread.is_alive())
+
+        uploader.thread.join(timeout=5)
+        self.assertFalse(uploader.thread.is_alive())
+        self.assertNotIn(uploader, archive_handler._archive_uploaders.values())
+
+
+class ReleaseBlobsOnFailureTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_directory = tempfile.TemporaryDirectory()
+        self.storage = LocalStorage({})
+        self.storage.retention_index = RetentionIndex(os.path.join(self.temp_directory.name, "retention.db"))
+        self.storage.blob_root = os.path.join(self.temp_directory.name, "blobs") + "/"
+        self.blob_key = os.path.join(self.storage.blob_root, "ab", "abcdef.mp3")
+        os.makedirs(os.path.dirname(self.blob_key))
+        with open(self.blob_key, "wb") as blob_file:
+            blob_file.write(b"audio")
+        self.storage.retention_index.acquire_blob("local", "", "call.json", self.blob_key)
+        self.storage.retention_index.record_blob("local", "", self.blob_key)
+
+    def tearDown(self):
+        self.storage.retention_index.connection.close()
+        self.temp_directory.cleanup()
+
+    def run_uploads(self, json_result):
+        upload_futures = {".mp3": Future(), ".json": Future()}
+        release_blobs_on_failure(self.storage, "call.json", upload_futures)
+        upload_futures[".json"].set_result(json_result)
+        # Nothing is released until the blob upload is done too.
+        self.assertTrue(os.path.exists(self.blob_key))
+        upload_futures[".mp3"].set_result("https://example.com/blobs/ab/abcdef.mp3")
+
+    def test_failed_json_upload_releases_its_blobs(self):
+        self.run_uploads(None)
+
+        self.assertFalse(os.path.exists(self.blob_key))
+        self.assertFalse(self.storage.retention_index.acquire_blob("local", "", "next.json", self.blob_key))
+
+    def test_archived_call_keeps_its_blobs(self):
+        self.run_uploads("https://example.com/call.json")
+
+        self.assertTrue(os.path.exists(self.blob_key))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from lib.audio_trim_handler import TRIM_SAMPLE_RATE, speech_mask, tone_regions, trim_audio
+
+VAD_PARAMETERS = {"threshold": 0.3, "min_speech_duration_ms": 250, "min_silence_duration_ms": 400,
+                  "speech_pad_ms": 0, "window_size_samples": 1024}
+
+
+def synthetic_call(*segments):
+    """
+    Builds 16 kHz PCM from (seconds, amplitude) segments: a 1 kHz sine for speech, low noise for silence.
+    """
+    rng = np.random.default_rng(1)
+    pieces = []
+    for seconds, amplitude in segments:
+        count = int(seconds * TRIM_SAMPLE_RATE)
+        noise = rng.normal(0, 30, count)
+        pieces.append(noise + amplitude * np.sin(2 * np.pi * 1000 * np.arange(count) / TRIM_SAMPLE_RATE))
+    return np.concatenate(pieces).astype(np.int16)
+
+
+def kept_seconds(mask, start, end):
+    return mask[int(start * TRIM_SAMPLE_RATE):int(end * TRIM_SAMPLE_RATE)].mean()
+
+
+class ToneRegionsTest(unittest.TestCase):
+    def test_tones_are_widened_and_malformed_entries_skipped(self):
+        tones = {"two_tone": [{"start": 1.0, "end": 3.0}], "long_tone": [{"start": 0.2, "end": 1.0}],
+                 "hi_low_tone": [{"start": None, "end": 2.0}, "bad"]}
+
+        self.assertEqual([(0.5, 3.5), (0.0, 1.5)], tone_regions(tones, 0.5, 0.5))
+        self.assertEqual([], tone_regions(None))
+
+
+class SpeechMaskTest(unittest.TestCase):
+    def test_short_silence_is_bridged_and_long_silence_cut(self):
+        samples = synthetic_call((1.0, 0), (1.0, 8000), (0.2, 0), (1.0, 8000), (2.0, 0), (1.0, 8000), (1.0, 0))
+
+        mask = speech_mask(samples, TRIM_SAMPLE_RATE, VAD_PARAMETERS)
+
+        self.assertLess(kept_seconds(mask, 0.0, 0.9), 0.1)
+        self.assertGreater(kept_seconds(mask, 1.1, 3.1), 0.9)
+        self.assertLess(kept_seconds(mask, 3.3, 5.1), 0.1)
+        self.assertGreater(kept_seconds(mask, 5.3, 6.0), 0.9)
+
+    def test_blips_shorter_than_min_speech_are_dropped(self):
+        samples = synthetic_call((1.0, 0), (0.1, 8000), (1.0, 0))
+
+        self.assertFalse(speech_mask(samples, TRIM_SAMPLE_RATE, VAD_PARAMETERS).any())
+
+
+class TrimAudioTest(unittest.TestCase):
+    def trim(self, samples, whisper_config, tones=None):
+        encoded = []
+        with mock.patch("lib.audio_trim_handler.decode_pcm", return_value=samples), \
+                mock.patch("lib.audio_trim_handler.encode_mp3",
+                           side_effect=lambda trimmed: encoded.append(trimmed) or b"mp3"):
+            result = trim_audio("call.mp3", whisper_config, tones)
+        return result, encoded
+
+    def test_tones_are_cut(self):
+        samples = synthetic_call((4.0, 8000))
+        whisper_config = {"cut_tones": True, "cut_pre_tone": 0.5, "cut_post_tone": 0.5}
+
+        result, encoded = self.trim(samples, whisper_config, {"two_tone": [{"start": 1.0, "end": 2.0}]})
+
+        self.assertEqual(b"mp3", result)
+        self.assertEqual(int(2.0 * TRIM_SAMPLE_RATE) + int(0.1 * TRIM_SAMPLE_RATE), len(encoded[0]))
+
+    def test_nothing_left_is_an_empty_result(self):
+        result, encoded = self.trim(synthetic_call((3.0, 0)), {"vad_filter": True, "vad_parameters": VAD_PARAMETERS})
+
+        self.assertEqual(b"", result)
+        self.assertEqual([], encoded)
+
+    def test_nothing_cut_sends_the_original(self):
+        result, encoded = self.trim(synthetic_call((3.0, 8000)),
+                                    {"cut_tones": True}, {"two_tone": [{"start": 10.0, "end": 12.0}]})
+
+        self.assertIsNone(result)
+        self.assertEqual([], encoded)
+
+    def test_disabled_trimming_does_not_decode(self):
+        with mock.patch("lib.audio_trim_handler.decode_pcm") as decode_pcm:
+            self.assertIsNone(trim_audio("call.mp3", {"cut_tones": True}, None))
+        decode_pcm.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
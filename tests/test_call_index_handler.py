@@ -0,0 +1,48 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from unittest import mock
+
+from lib.call_index_handler import CallIndex, lookup_call_data, parse_time, query_calls
+
+
+class ParseTimeTest(unittest.TestCase):
+    def test_relative_durations(self):
+        with mock.patch("lib.call_index_handler.time.time", return_value=1700000000):
+            self.assertEqual(1700000000 - 90, parse_time("90s"))
+            self.assertEqual(1700000000 - 2 * 86400, parse_time("2d"))
+
+    def test_epoch_and_iso(self):
+        self.assertEqual(1700000000, parse_time("1700000000"))
+        self.assertEqual(int(datetime(2024, 1, 1, 12).timestamp()), parse_time("2024-01-01T12:00:00"))
+
+
+class CallIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_directory = tempfile.TemporaryDirectory()
+        self.call_index = CallIndex(os.path.join(self.temp_directory.name, "calls.db"), flush_interval=0.01)
+
+    def tearDown(self):
+        self.temp_directory.cleanup()
+
+    def test_reindexing_a_call_replaces_its_row(self):
+        call_data = {"talkgroup": 1001, "freq": 851012500, "start_time": 1700000000, "call_length": 4.5,
+                     "tones": {"two_tone": [], "long_tone": [], "hi_low_tone": []},
+                     "audio_mp3_url": "https://example.com/call.mp3"}
+        self.call_index.add_call("north", "/calls/1001-1700000000_851012500.mp3", call_data)
+        self.call_index.add_call("north", "/calls/1001-1700000000_851012500.mp3",
+                                 dict(call_data, tones={"two_tone": [{"tone_id": "tt_1"}]}, transcript={"text": "hi"}))
+        self.call_index.flush()
+
+        calls = query_calls(self.call_index.connection, system="north", tones=True)
+        self.assertEqual(1, len(calls))
+        self.assertEqual({"text": "hi"}, calls[0]["transcript"])
+        self.assertEqual("https://example.com/call.mp3",
+                         lookup_call_data(self.call_index.connection, "north",
+                                          "1001-1700000000_851012500.mp3")["audio_mp3_url"])
+        self.assertIsNone(lookup_call_data(self.call_index.connection, "south", "1001-1700000000_851012500.mp3"))
+
+
+if __name__ == '__main__':
+    unittest.main()
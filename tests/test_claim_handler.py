@@ -0,0 +1,163 @@
+import errno
+import multiprocessing
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from lib.claim_handler import ClaimManager
+
+
+def claim_calls(node_id, watch_directory, paths, start_event, results):
+    # Runs in its own process, racing the other nodes for every call once they are all ready.
+    manager = ClaimManager({"node_id": node_id, "heartbeat_interval": 3600}, watch_directory)
+    manager.start()
+    start_event.wait()
+    results.put((node_id, [path for path in paths if manager.claim(path) is not None]))
+    manager.stop()
+
+
+class ClaimManagerTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_directory = tempfile.TemporaryDirectory()
+        self.watch_directory = self.temp_directory.name
+        self.managers = []
+
+    def tearDown(self):
+        for manager in self.managers:
+            manager.stop()
+        self.temp_directory.cleanup()
+
+    def create_manager(self, node_id, lease_seconds=60):
+        manager = ClaimManager({"node_id": node_id, "lease_seconds": lease_seconds, "heartbeat_interval": 3600},
+                               self.watch_directory)
+        manager.start()
+        self.managers.append(manager)
+        return manager
+
+    def write_call(self, relative_path):
+        path = os.path.join(self.watch_directory, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as call_file:
+            call_file.write(b"\xff\xf3")
+        return path
+
+    def test_only_one_node_claims_a_call(self):
+        first = self.create_manager("first")
+        second = self.create_manager("second")
+        path = self.write_call("system/1234-1700000000_851012500.mp3")
+
+        claimed_path = first.claim(path)
+
+        self.assertEqual(os.path.join(first.node_directory, "system", "1234-1700000000_851012500.mp3"), claimed_path)
+        self.assertTrue(os.path.exists(claimed_path))
+        self.assertIsNone(second.claim(path))
+        self.assertTrue(first.is_claim_path(claimed_path))
+        self.assertFalse(first.is_claim_path(path))
+
+    def test_unfinished_claims_resume_after_restart(self):
+        manager = self.create_manager("node")
+        claimed_path = manager.claim(self.write_call("1234-1700000000_851012500.mp3"))
+        manager.stop()
+
+        restarted = self.create_manager("node")
+
+        self.assertEqual([claimed_path], restarted.pending_claims())
+
+    def test_released_claims_are_not_resumed(self):
+        manager = self.create_manager("node")
+        claimed_path = manager.claim(self.write_call("1234-1700000000_851012500.mp3"))
+        with open(os.path.splitext(claimed_path)[0] + ".json", "w") as json_file:
+            json_file.write("{}")
+
+        manager.release(claimed_path)
+
+        self.assertEqual([], manager.pending_claims())
+        self.assertTrue(os.path.exists(os.path.join(manager.completed_directory, "1234-1700000000_851012500.mp3")))
+        self.assertTrue(os.path.exists(os.path.join(manager.completed_directory, "1234-1700000000_851012500.json")))
+
+    def test_released_files_are_dropped_without_completed_hours(self):
+        manager = ClaimManager({"node_id": "node", "completed_hours": 0}, self.watch_directory)
+        manager.start()
+        self.managers.append(manager)
+        claimed_path = manager.claim(self.write_call("1234-1700000000_851012500.mp3"))
+
+        manager.release(claimed_path)
+
+        self.assertFalse(os.path.exists(claimed_path))
+        self.assertEqual([], os.listdir(manager.completed_directory))
+
+    def test_old_completed_files_are_pruned(self):
+        manager = self.create_manager("node")
+        old_path = manager.claim(self.write_call("system/1234-1700000000_851012500.mp3"))
+        manager.release(old_path)
+        old_completed_path = os.path.join(manager.completed_directory, "system", "1234-1700000000_851012500.mp3")
+        os.utime(old_completed_path, (time.time() - 25 * 3600, time.time() - 25 * 3600))
+        new_path = manager.claim(self.write_call("1234-1700000100_851012500.mp3"))
+        manager.release(new_path)
+
+        self.assertEqual(1, manager.prune_completed())
+
+        self.assertFalse(os.path.exists(os.path.join(manager.completed_directory, "system")))
+        self.assertTrue(os.path.exists(os.path.join(manager.completed_directory, "1234-1700000100_851012500.mp3")))
+
+    def test_failed_claim_rename_is_not_raised(self):
+        manager = self.create_manager("node")
+        path = self.write_call("1234-1700000000_851012500.mp3")
+
+        with mock.patch("lib.claim_handler.os.rename", side_effect=OSError(errno.EXDEV, "Invalid cross-device link")):
+            self.assertIsNone(manager.claim(path))
+        self.assertTrue(os.path.exists(path))
+
+    def test_processes_racing_for_calls_claim_each_once(self):
+        paths = [self.write_call(f"system/1234-17000{index:05d}_851012500.mp3") for index in range(50)]
+        context = multiprocessing.get_context()
+        start_event = context.Event()
+        results = context.Queue()
+        processes = [context.Process(target=claim_calls,
+                                     args=(f"node{index}", self.watch_directory, paths, start_event, results))
+                     for index in range(4)]
+        for process in processes:
+            process.start()
+        start_event.set()
+        claimed = dict(results.get(timeout=30) for _ in processes)
+        for process in processes:
+            process.join(30)
+
+        claimed_paths = [path for node_paths in claimed.values() for path in node_paths]
+        self.assertEqual(sorted(paths), sorted(claimed_paths))
+        for node_id, node_paths in claimed.items():
+            node_directory = os.path.join(self.watch_directory, ".rtl_claims", node_id)
+            for path in node_paths:
+                self.assertTrue(os.path.exists(os.path.join(node_directory, os.path.relpath(path,
+                                                                                             self.watch_directory))))
+
+    def test_expired_node_claims_are_taken_over(self):
+        crashed = self.create_manager("crashed")
+        crashed.claim(self.write_call("1234-1700000000_851012500.mp3"))
+        crashed.stop()
+        survivor = self.create_manager("survivor", lease_seconds=0)
+
+        # The first look at a lease only records it, expiry needs it unchanged on a later look.
+        self.assertEqual([], survivor.reclaim_expired())
+        reclaimed = survivor.reclaim_expired()
+
+        self.assertEqual([os.path.join(survivor.node_directory, "1234-1700000000_851012500.mp3")], reclaimed)
+        self.assertEqual(reclaimed, survivor.pending_claims())
+        self.assertEqual([], crashed.pending_claims())
+
+    def test_live_node_claims_are_left_alone(self):
+        live = self.create_manager("live")
+        live.claim(self.write_call("1234-1700000000_851012500.mp3"))
+        observer = self.create_manager("observer", lease_seconds=0)
+
+        observer.reclaim_expired()
+        live.heartbeat()
+
+        self.assertEqual([], observer.reclaim_expired())
+        self.assertEqual(1, len(live.pending_claims()))
+
+
+if __name__ == '__main__':
+    unittest.main()
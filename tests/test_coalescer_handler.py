@@ -0,0 +1,174 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest import mock
+
+from lib.coalescer_handler import EventCoalescer, MIN_DEBOUNCE_SECONDS, MIN_STABLE_SECONDS
+from lib.watcher_handler import FileEventHandler
+
+
+class EventCoalescerTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_directory = tempfile.TemporaryDirectory()
+        self.dispatched = []
+        self.dispatched_event = threading.Event()
+        self.coalescers = []
+
+    def tearDown(self):
+        for coalescer in self.coalescers:
+            coalescer.stop(drain_seconds=0)
+        self.temp_directory.cleanup()
+
+    def on_stable(self, path):
+        self.dispatched.append(path)
+        self.dispatched_event.set()
+
+    def create_coalescer(self, **kwargs):
+        kwargs.setdefault("debounce_seconds", 0.01)
+        kwargs.setdefault("stable_seconds", 0.1)
+        coalescer = EventCoalescer(self.on_stable, **kwargs)
+        coalescer.start()
+        self.coalescers.append(coalescer)
+        return coalescer
+
+    def write_call(self, name, data=b"\xff\xf3"):
+        path = os.path.join(self.temp_directory.name, name)
+        with open(path, "wb") as call_file:
+            call_file.write(data)
+        return path
+
+    def wait_until(self, condition, timeout=3.0):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def test_burst_of_events_is_dispatched_once(self):
+        coalescer = self.create_coalescer()
+        path = self.write_call("1234-1700000000_851012500.mp3")
+
+        for _ in range(20):
+            coalescer.add(path)
+
+        self.assertTrue(self.dispatched_event.wait(3))
+        time.sleep(0.3)
+        self.assertEqual([path], self.dispatched)
+        self.assertEqual({}, coalescer.pending)
+
+    def test_growing_file_is_dispatched_once_it_settles(self):
+        coalescer = self.create_coalescer(stable_seconds=0.3)
+        path = self.write_call("1234-1700000000_851012500.mp3")
+        coalescer.add(path)
+
+        for _ in range(5):
+            time.sleep(0.1)
+            with open(path, "ab") as call_file:
+                call_file.write(b"\x00" * 64)
+            self.assertEqual([], self.dispatched)
+
+        self.assertTrue(self.dispatched_event.wait(3))
+        self.assertEqual([path], self.dispatched)
+
+    def test_old_mtime_is_not_taken_as_stable(self):
+        coalescer = self.create_coalescer(stable_seconds=0.5)
+        path = self.write_call("1234-1700000000_851012500.mp3")
+        os.utime(path, (time.time() - 3600, time.time() - 3600))
+        coalescer.add(path)
+
+        time.sleep(0.3)
+        self.assertEqual([], self.dispatched)
+
+        self.assertTrue(self.dispatched_event.wait(3))
+        self.assertEqual([path], self.dispatched)
+
+    def test_empty_file_is_not_dispatched_and_expires(self):
+        coalescer = self.create_coalescer(abandon_seconds=0.3)
+        path = self.write_call("1234-1700000000_851012500.mp3", b"")
+        coalescer.add(path)
+
+        self.assertTrue(self.wait_until(lambda: not coalescer.pending))
+        self.assertEqual([], self.dispatched)
+
+    def test_empty_file_that_fills_is_dispatched(self):
+        coalescer = self.create_coalescer(abandon_seconds=0.5)
+        path = self.write_call("1234-1700000000_851012500.mp3", b"")
+        coalescer.add(path)
+        time.sleep(0.3)
+
+        with open(path, "wb") as call_file:
+            call_file.write(b"\xff\xf3")
+
+        self.assertTrue(self.dispatched_event.wait(3))
+        self.assertEqual([path], self.dispatched)
+
+    def test_missing_file_is_dropped(self):
+        coalescer = self.create_coalescer()
+        coalescer.add(os.path.join(self.temp_directory.name, "gone.mp3"))
+
+        self.assertTrue(self.wait_until(lambda: not coalescer.pending))
+        self.assertEqual([], self.dispatched)
+
+    def test_intervals_are_clamped_to_their_minimums(self):
+        coalescer = EventCoalescer(self.on_stable, debounce_seconds=0, stable_seconds=0)
+
+        self.assertEqual(MIN_DEBOUNCE_SECONDS, coalescer.debounce_seconds)
+        self.assertEqual(MIN_STABLE_SECONDS, coalescer.stable_seconds)
+
+
+class FileEventHandlerInFlightTest(unittest.TestCase):
+    def setUp(self):
+        self.executor = ThreadPoolExecutor(max_workers=2)
+        system_config = SimpleNamespace(name="test", event_debounce_ms=10, event_stable_seconds=0.1)
+        self.handler = FileEventHandler(self.executor, system_config)
+        self.calls = []
+
+    def tearDown(self):
+        self.executor.shutdown(wait=True)
+
+    def fake_process_call(self, result):
+        def process_call(system_config, mp3_file_path, on_finalized=None):
+            self.calls.append((mp3_file_path, on_finalized))
+            return result
+        return process_call
+
+    def test_call_stays_in_flight_until_finalized(self):
+        path = "/calls/1234-1700000000_851012500.mp3"
+        with mock.patch("lib.watcher_handler.process_call", self.fake_process_call(True)):
+            self.handler.submit_call(path)
+            self.handler.in_flight[path].future.result()
+            self.handler.submit_call(path)
+
+        self.assertEqual(1, len(self.calls))
+        self.assertIn(path, self.handler.in_flight)
+
+        self.calls[0][1](path)
+
+        self.assertNotIn(path, self.handler.in_flight)
+
+    def test_skipped_call_leaves_in_flight_when_it_returns(self):
+        path = "/calls/1234-1700000000_851012500.mp3"
+        with mock.patch("lib.watcher_handler.process_call", self.fake_process_call(False)):
+            self.handler.submit_call(path)
+            self.assertTrue(self.wait_until(lambda: path not in self.handler.in_flight))
+            self.handler.submit_call(path)
+            self.assertTrue(self.wait_until(lambda: path not in self.handler.in_flight))
+
+        self.assertEqual(2, len(self.calls))
+
+    def wait_until(self, condition, timeout=3.0):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+import threading
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from lib.duplicate_detect_handler import DuplicateCallEntry, DuplicateCallIndex, compute_fingerprint, \
+    find_duplicate_call
+
+DETECT_CONFIG = {"window_seconds": 30, "start_tolerance": 2, "duration_tolerance": 1.0, "max_distance": 0.2}
+
+
+def make_fingerprint(seed, gain=1.0):
+    # Speech-like bursts: random frame loudness, so the envelope carries the call's shape.
+    loudness = np.random.default_rng(seed).uniform(0, 8000, 200)
+    samples = (np.repeat(loudness, 400) * np.sin(np.arange(80000)) * gain).astype(np.int16)
+    return compute_fingerprint(samples)
+
+
+class DuplicateCallIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = DuplicateCallIndex()
+
+    def register(self, system_name, mp3_file_path, start_time=1700000000, duration=10.0, seed=1, gain=1.0):
+        entry = DuplicateCallEntry(system_name, mp3_file_path, start_time, duration, make_fingerprint(seed, gain))
+        return self.index.check_and_register(entry, 851012500, DETECT_CONFIG)
+
+    def test_copy_from_another_recorder_matches(self):
+        self.assertIsNone(self.register("north", "/north/1234-1700000000_851012500.mp3"))
+
+        duplicate = self.register("south", "/south/1234-1700000001_851012500.mp3", start_time=1700000001,
+                                  gain=0.5)
+
+        self.assertIsNotNone(duplicate)
+        self.assertEqual("north", duplicate.system_name)
+
+    def test_different_audio_does_not_match(self):
+        self.register("north", "/north/1234-1700000000_851012500.mp3")
+
+        self.assertIsNone(self.register("south", "/south/1234-1700000000_851012500.mp3", seed=2))
+
+    def test_calls_outside_the_tolerances_do_not_match(self):
+        self.register("north", "/north/1234-1700000000_851012500.mp3")
+
+        self.assertIsNone(self.register("south", "/south/a.mp3", start_time=1700000005))
+        self.assertIsNone(self.register("east", "/east/a.mp3", duration=12.0))
+
+    def test_reprocessed_call_does_not_match_itself(self):
+        path = "/north/1234-1700000000_851012500.mp3"
+        self.assertIsNone(self.register("north", path))
+
+        self.assertIsNone(self.register("north", path))
+        self.assertEqual(1, len(self.index.calls[851012500]))
+
+    def test_entries_expire_after_the_window(self):
+        with mock.patch("lib.duplicate_detect_handler.time.monotonic", return_value=1000.0):
+            self.register("north", "/north/1234-1700000000_851012500.mp3")
+
+        with mock.patch("lib.duplicate_detect_handler.time.monotonic", return_value=1031.0):
+            self.assertIsNone(self.register("south", "/south/1234-1700000000_851012500.mp3"))
+        self.assertEqual(["/south/1234-1700000000_851012500.mp3"],
+                         [entry.mp3_file_path for entry in self.index.calls[851012500]])
+
+
+    def test_failed_call_leaves_the_index(self):
+        self.register("north", "/north/1234-1700000000_851012500.mp3")
+
+        self.index.settle("/north/1234-1700000000_851012500.mp3", False)
+
+        self.assertIsNone(self.register("south", "/south/1234-1700000000_851012500.mp3"))
+
+
+class FindDuplicateCallTest(unittest.TestCase):
+    def setUp(self):
+        self.index = DuplicateCallIndex()
+        patches = [mock.patch("lib.duplicate_detect_handler.duplicate_call_index", self.index),
+                   mock.patch("lib.duplicate_detect_handler.decode_pcm", return_value=None),
+                   mock.patch("lib.duplicate_detect_handler.compute_fingerprint",
+                              side_effect=lambda samples, sample_rate: make_fingerprint(1))]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def find(self, system_name, mp3_file_path):
+        return find_duplicate_call(DETECT_CONFIG, system_name, mp3_file_path, "851012500", 1700000000, 10.0)
+
+    def find_in_thread(self, system_name, mp3_file_path):
+        results = []
+        thread = threading.Thread(target=lambda: results.append(self.find(system_name, mp3_file_path)))
+        thread.start()
+        return thread, results
+
+    def test_copy_is_dropped_once_the_first_completes(self):
+        self.assertIsNone(self.find("north", "/north/a.mp3"))
+        thread, results = self.find_in_thread("south", "/south/a.mp3")
+        thread.join(0.2)
+        self.assertTrue(thread.is_alive())
+
+        self.index.settle("/north/a.mp3", True)
+        thread.join(3)
+
+        self.assertEqual("north", results[0].system_name)
+
+    def test_copy_is_kept_when_the_first_fails(self):
+        self.assertIsNone(self.find("north", "/north/a.mp3"))
+        thread, results = self.find_in_thread("south", "/south/a.mp3")
+
+        self.index.settle("/north/a.mp3", False)
+        thread.join(3)
+
+        self.assertEqual([None], results)
+        self.assertEqual(["/south/a.mp3"], [entry.mp3_file_path for entry in self.index.calls[851012500]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from lib.journal_handler import CallJournal
+from lib.tone_detect_handler import get_tones
+
+
+class CallJournalTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_directory = tempfile.TemporaryDirectory()
+        self.journal_path = os.path.join(self.temp_directory.name, "system.journal")
+        self.call_path = os.path.join(self.temp_directory.name, "1234-1700000000_851012500.mp3")
+        with open(self.call_path, "wb") as call_file:
+            call_file.write(b"\xff\xf3")
+
+    def tearDown(self):
+        self.temp_directory.cleanup()
+
+    def open_journal(self):
+        journal = CallJournal(self.journal_path, fsync_interval_ms=1)
+        self.addCleanup(journal.journal_file.close)
+        return journal
+
+    def interrupt(self, *stages):
+        journal = self.open_journal()
+        entry = journal.begin(self.call_path)
+        for stage_name, result in stages:
+            entry.run(stage_name, lambda value: value, result)
+        journal.flush()
+
+    def test_interrupted_call_resumes_with_its_completed_stages(self):
+        self.interrupt(("tone_detection", {"two_tone": [], "long_tone": [], "hi_low_tone": []}))
+
+        journal = self.open_journal()
+        self.assertEqual([self.call_path], journal.interrupted_calls())
+        entry = journal.begin(self.call_path)
+
+        target = mock.Mock(return_value={"two_tone": [1]})
+        self.assertEqual({"two_tone": [], "long_tone": [], "hi_low_tone": []},
+                         entry.run("tone_detection", target))
+        target.assert_not_called()
+        self.assertFalse(entry.has_completed("transcribe"))
+
+    def test_failed_stage_runs_again_on_resume(self):
+        self.interrupt(("tone_detection", None))
+
+        entry = self.open_journal().begin(self.call_path)
+
+        self.assertFalse(entry.has_completed("tone_detection"))
+        self.assertEqual({"two_tone": []}, entry.run("tone_detection", lambda: {"two_tone": []}))
+
+    def test_finished_call_is_not_resumed(self):
+        journal = self.open_journal()
+        entry = journal.begin(self.call_path)
+        entry.complete("archive")
+        entry.finish()
+        journal.flush()
+
+        self.assertEqual([], self.open_journal().interrupted_calls())
+
+    def test_call_is_only_begun_once_while_active(self):
+        journal = self.open_journal()
+
+        self.assertIsNotNone(journal.begin(self.call_path))
+        self.assertIsNone(journal.begin(self.call_path))
+
+    def test_torn_final_record_is_ignored(self):
+        self.interrupt(("tone_detection", {"two_tone": []}))
+        with open(self.journal_path, "a", encoding="utf-8") as journal_file:
+            journal_file.write('{"call": "' + self.call_path + '", "stage": "transc')
+
+        entry = self.open_journal().begin(self.call_path)
+
+        self.assertTrue(entry.has_completed("tone_detection"))
+        self.assertFalse(entry.has_completed("transcribe"))
+
+    def test_interrupted_call_without_audio_is_dropped(self):
+        self.interrupt(("tone_detection", {"two_tone": []}))
+        os.remove(self.call_path)
+
+        journal = self.open_journal()
+        self.assertEqual([], journal.interrupted_calls())
+        journal.flush()
+        self.assertEqual([], self.open_journal().interrupted_calls())
+
+
+class GetTonesTest(unittest.TestCase):
+    def test_detection_failure_is_not_a_result(self):
+        with mock.patch.dict(sys.modules, {"icad_tone_detection": None}):
+            self.assertIsNone(get_tones({}, "missing.mp3"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import os
+import struct
+import tempfile
+import unittest
+
+from mutagen.mp3 import MP3
+
+from lib.audio_file_handler import get_mp3_duration
+from lib.mp3_info_handler import MONO, parse_frame_header, read_mp3_duration
+
+# 32 kbps 16 kHz mono MPEG 2 layer III, as trunk-recorder writes calls: 576 samples in 144 byte frames.
+FRAME_HEADER = struct.pack(">I", 0xfff3_4800 | (MONO << 6))
+FRAME_LENGTH = 144
+XING_OFFSET = 4 + 9
+VBRI_OFFSET = 36
+
+
+def id3_tag(payload_size):
+    size = bytes((payload_size >> shift) & 0x7f for shift in (21, 14, 7, 0))
+    return b"ID3\x04\x00\x00" + size + bytes(payload_size)
+
+
+def frame(payload=b"", offset=4):
+    body = bytearray(FRAME_LENGTH)
+    body[:4] = FRAME_HEADER
+    body[offset:offset + len(payload)] = payload
+    return bytes(body)
+
+
+def lame_tag(version=b"LAME3.100", delay=576, padding=1000):
+    tag = bytearray(36)
+    tag[:len(version)] = version
+    tag[21] = delay >> 4
+    tag[22] = ((delay & 0x0f) << 4) | (padding >> 8)
+    tag[23] = padding & 0xff
+    return bytes(tag)
+
+
+def xing_frame(frame_count, tag=b"Xing", lame=None):
+    return frame(tag + struct.pack(">II", 0x1, frame_count) + (lame or b""), XING_OFFSET)
+
+
+def vbri_frame(frame_count, version=1):
+    return frame(b"VBRI" + struct.pack(">HHHIIHHHH", version, 0, 75, 0, frame_count, 0, 1, 2, 1), VBRI_OFFSET)
+
+
+class ReadMp3DurationTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temp_directory.cleanup()
+
+    def write(self, *parts):
+        mp3_file_path = os.path.join(self.temp_directory.name, "call.mp3")
+        with open(mp3_file_path, "wb") as mp3_file:
+            for part in parts:
+                mp3_file.write(part)
+        return mp3_file_path
+
+    def assert_matches_mutagen(self, mp3_file_path, expected):
+        duration = read_mp3_duration(mp3_file_path)
+        self.assertAlmostEqual(expected, duration, places=6)
+        self.assertAlmostEqual(MP3(mp3_file_path).info.length, duration, places=6)
+
+    def test_frame_header(self):
+        header = parse_frame_header(FRAME_HEADER)
+
+        self.assertEqual((2, 3, 32000, 16000, 576, FRAME_LENGTH),
+                         (header.version, header.layer, header.bitrate, header.sample_rate, header.samples_per_frame,
+                          header.frame_length))
+        self.assertIsNone(parse_frame_header(b"\xff\xf3"))
+        self.assertIsNone(parse_frame_header(b"RIFF"))
+        # Free format bitrate.
+        self.assertIsNone(parse_frame_header(struct.pack(">I", 0xfff3_0800)))
+
+    def test_cbr_is_timed_from_the_file_size(self):
+        self.assert_matches_mutagen(self.write(frame() * 500), 500 * 576 / 16000)
+
+    def test_id3_tags_are_skipped(self):
+        self.assert_matches_mutagen(self.write(id3_tag(300), id3_tag(20), frame() * 100), 100 * 576 / 16000)
+
+    def test_xing_frame_count(self):
+        self.assert_matches_mutagen(self.write(xing_frame(400, b"Info"), frame() * 400), 400 * 576 / 16000)
+
+    def test_lame_tag_removes_encoder_delay_and_padding(self):
+        mp3_file_path = self.write(xing_frame(400, lame=lame_tag()), frame() * 400)
+
+        self.assert_matches_mutagen(mp3_file_path, (400 * 576 - 576 - 1000) / 16000)
+
+    def test_vbri_frame_count(self):
+        self.assert_matches_mutagen(self.write(vbri_frame(250), frame() * 250), 250 * 576 / 16000)
+
+    def test_unknown_vbri_version_is_timed_as_cbr(self):
+        self.assertAlmostEqual(251 * 576 / 16000, read_mp3_duration(self.write(vbri_frame(250, version=2),
+                                                                               frame() * 250)))
+
+    def test_files_it_will_not_guess_at(self):
+        self.assertIsNone(read_mp3_duration(self.write(b"not an mp3 file" * 20)))
+        # A second frame that disagrees with the first is not CBR.
+        self.assertIsNone(read_mp3_duration(self.write(frame(), b"\x00" * 200)))
+        with self.assertRaises(ValueError):
+            read_mp3_duration(self.write(xing_frame(400, lame=lame_tag(b"LAME3.90.")), frame() * 400))
+        # A file cut off inside the LAME tag.
+        with self.assertRaises(ValueError):
+            read_mp3_duration(self.write(xing_frame(400, lame=lame_tag())[:XING_OFFSET + 12 + 20]))
+
+
+    def test_mutagen_times_what_the_headers_do_not_cover(self):
+        mp3_file_path = self.write(xing_frame(400, lame=lame_tag(b"LAME3.90.")), frame() * 400)
+
+        self.assertEqual(MP3(mp3_file_path).info.length, get_mp3_duration(mp3_file_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
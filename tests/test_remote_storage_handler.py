@@ -0,0 +1,44 @@
+import errno
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from lib.remote_storage_handler import LocalStorage
+
+
+class PlaceFileTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_directory = tempfile.TemporaryDirectory()
+        self.storage = LocalStorage({})
+        self.source_path = os.path.join(self.temp_directory.name, "call.mp3")
+        with open(self.source_path, "wb") as source_file:
+            source_file.write(b"audio")
+
+    def tearDown(self):
+        self.temp_directory.cleanup()
+
+    def place(self, name, link_error=None):
+        destination_path = os.path.join(self.temp_directory.name, name)
+        with mock.patch("lib.remote_storage_handler.os.link", side_effect=link_error or os.link), \
+                mock.patch.object(LocalStorage, "_reflink", return_value=False):
+            method = self.storage.place_file(self.source_path, destination_path)
+        with open(destination_path, "rb") as destination_file:
+            self.assertEqual(b"audio", destination_file.read())
+        return method
+
+    def test_transient_link_error_only_copies_that_file(self):
+        self.assertEqual("copy", self.place("first.mp3", OSError(errno.EMLINK, "Too many links")))
+
+        self.assertEqual(set(), self.storage._unlinkable_devices)
+        self.assertEqual("hardlink", self.place("second.mp3"))
+
+    def test_filesystem_without_links_is_remembered(self):
+        self.assertEqual("copy", self.place("first.mp3", OSError(errno.EPERM, "Operation not permitted")))
+
+        self.assertEqual(1, len(self.storage._unlinkable_devices))
+        self.assertEqual("copy", self.place("second.mp3"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import os
+import tempfile
+import time
+import unittest
+
+from lib.remote_storage_handler import LocalStorage, parent_directories
+from lib.retention_handler import RetentionIndex, clean_archive
+
+
+class ParentDirectoriesTest(unittest.TestCase):
+    def test_walks_up_to_the_prefix(self):
+        self.assertEqual(["/archive/system/2024/01/01", "/archive/system/2024/01", "/archive/system/2024"],
+                         parent_directories("/archive/system/2024/01/01/call.mp3", "/archive/system/"))
+
+    def test_key_outside_the_prefix_only_returns_its_directory(self):
+        self.assertEqual(["/other/2024"], parent_directories("/other/2024/call.mp3", "/archive/system"))
+        self.assertEqual(["/archive/2024"], parent_directories("/archive/2024/call.mp3", None))
+
+
+class CleanArchiveTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_directory = tempfile.TemporaryDirectory()
+        self.archive_path = os.path.join(self.temp_directory.name, "archive", "system")
+        self.storage = LocalStorage({})
+        self.storage.retention_index = RetentionIndex(os.path.join(self.temp_directory.name, "retention.db"))
+        self.storage.clean_interval_seconds = 0
+        self.storage.blob_root = os.path.join(self.temp_directory.name, "archive", "blobs") + "/"
+        # Skip the full listing so only the index decides what expires.
+        self.storage.retention_index.mark_reconciled("local", "", self.archive_path)
+
+    def tearDown(self):
+        self.storage.retention_index.connection.close()
+        self.temp_directory.cleanup()
+
+    def archive(self, relative_path, age_days, blob_key=None):
+        object_key = os.path.join(self.archive_path, relative_path)
+        os.makedirs(os.path.dirname(object_key), exist_ok=True)
+        with open(object_key, "w") as archive_file:
+            archive_file.write("{}")
+        self.storage.retention_index.record_upload("local", "", object_key, time.time() - age_days * 86400)
+        if blob_key is not None:
+            if not self.storage.retention_index.acquire_blob("local", "", object_key, blob_key):
+                os.makedirs(os.path.dirname(blob_key), exist_ok=True)
+                with open(blob_key, "wb") as blob_file:
+                    blob_file.write(b"audio")
+                self.storage.retention_index.record_blob("local", "", blob_key)
+        return object_key
+
+    def test_expired_objects_and_their_empty_directories_are_removed(self):
+        expired_key = self.archive("2024/01/01/old.json", age_days=10)
+        kept_key = self.archive("2024/02/01/new.json", age_days=1)
+
+        self.assertEqual(1, clean_archive(self.storage, self.archive_path, 7))
+
+        self.assertFalse(os.path.exists(expired_key))
+        self.assertFalse(os.path.exists(os.path.join(self.archive_path, "2024", "01")))
+        self.assertTrue(os.path.exists(kept_key))
+        self.assertTrue(os.path.isdir(self.archive_path))
+        self.assertEqual([], self.storage.retention_index.expired_keys("local", "", self.archive_path, 7))
+
+    def test_system_sharing_a_name_prefix_is_left_alone(self):
+        other_archive_path = self.archive_path + "2"
+        other_key = os.path.join(other_archive_path, "2024", "01", "01", "old.json")
+        os.makedirs(os.path.dirname(other_key))
+        with open(other_key, "w") as archive_file:
+            archive_file.write("{}")
+        self.storage.retention_index.record_upload("local", "", other_key, time.time() - 10 * 86400)
+        expired_key = self.archive("2024/01/01/old.json", age_days=10)
+
+        self.assertEqual(1, clean_archive(self.storage, self.archive_path, 7))
+
+        self.assertFalse(os.path.exists(expired_key))
+        self.assertTrue(os.path.exists(other_key))
+        self.assertEqual([other_key],
+                         self.storage.retention_index.expired_keys("local", "", other_archive_path, 7))
+
+    def test_shared_blob_is_kept_until_its_last_reference_expires(self):
+        blob_key = os.path.join(self.storage.blob_root, "ab", "abcdef.mp3")
+        self.archive("2024/01/01/old.json", age_days=10, blob_key=blob_key)
+        self.archive("2024/01/05/newer.json", age_days=3, blob_key=blob_key)
+
+        clean_archive(self.storage, self.archive_path, 7)
+        self.assertTrue(os.path.exists(blob_key))
+
+        self.assertEqual(2, clean_archive(self.storage, self.archive_path, 2))
+        self.assertFalse(os.path.exists(blob_key))
+        self.assertTrue(os.path.isdir(self.storage.blob_root))
+
+    def test_cleanup_is_throttled_per_prefix(self):
+        self.storage.clean_interval_seconds = 600
+        clean_archive(self.storage, self.archive_path, 7)
+        expired_key = self.archive("2024/01/01/old.json", age_days=10)
+
+        self.assertEqual(0, clean_archive(self.storage, self.archive_path, 7))
+        self.assertTrue(os.path.exists(expired_key))
+
+
+if __name__ == '__main__':
+    unittest.main()
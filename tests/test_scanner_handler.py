@@ -0,0 +1,62 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from lib.scanner_handler import DirectoryScanner
+
+
+class DirectoryScannerTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_directory = tempfile.TemporaryDirectory()
+        self.watch_directory = self.temp_directory.name
+        self.dispatched = []
+        self.scanner = DirectoryScanner(self.watch_directory, self.dispatched.append)
+        # The file server's clock lags this host by an hour.
+        self.directory_mtime = time.time() - 3600
+        self.clock = 1000.0
+        os.utime(self.watch_directory, (self.directory_mtime, self.directory_mtime))
+        # Calls already there at startup are not dispatched, so start from an empty directory.
+        self.scan()
+
+    def tearDown(self):
+        self.temp_directory.cleanup()
+
+    def write_call(self, name):
+        path = os.path.join(self.watch_directory, name)
+        with open(path, "wb") as call_file:
+            call_file.write(b"\xff\xf3")
+        # A second change within the same coarse timestamp leaves the directory mtime as it was.
+        os.utime(self.watch_directory, (self.directory_mtime, self.directory_mtime))
+        return path
+
+    def scan(self, seconds_later=0.5):
+        self.clock += seconds_later
+        with mock.patch("lib.scanner_handler.time.monotonic", return_value=self.clock):
+            self.scanner.scan()
+
+    def test_change_hidden_by_a_lagging_server_mtime_is_found(self):
+        first_path = self.write_call("1234-1700000000_851012500.mp3")
+        self.scan()
+        self.scan()
+        self.assertEqual([first_path], self.dispatched)
+
+        second_path = self.write_call("1234-1700000010_851012500.mp3")
+        self.scan()
+        self.scan()
+
+        self.assertEqual([first_path, second_path], self.dispatched)
+
+    def test_settled_directory_is_not_listed_again(self):
+        self.write_call("1234-1700000000_851012500.mp3")
+        for _ in range(6):
+            self.scan()
+
+        with mock.patch("lib.scanner_handler.os.scandir") as scandir:
+            self.scan()
+        scandir.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import threading
+import time
+import unittest
+
+from lib.supervisor_handler import Supervisor, WorkerProcess
+
+
+class DrainingProcess:
+    """
+    Stands in for a worker process that keeps draining after SIGTERM until it is killed.
+    """
+
+    def __init__(self):
+        self.name = "worker-north"
+        self.pid = 1234
+        self.exited = threading.Event()
+        self.terminated = False
+        self.killed = False
+
+    def is_alive(self):
+        return not self.exited.is_set()
+
+    def terminate(self):
+        self.terminated = True
+
+    def kill(self):
+        self.killed = True
+        self.exited.set()
+
+    def join(self, timeout=None):
+        self.exited.wait(timeout)
+
+
+class StopWorkerTest(unittest.TestCase):
+    def setUp(self):
+        self.supervisor = object.__new__(Supervisor)
+        self.supervisor.lock = threading.Lock()
+        self.supervisor.stopping_workers = []
+        self.supervisor.stop_timeout = 0.2
+
+    def test_stopping_a_worker_does_not_wait_for_its_drain(self):
+        worker = WorkerProcess({"north"})
+        worker.process = DrainingProcess()
+
+        start = time.monotonic()
+        with self.supervisor.lock:
+            self.supervisor._stop_worker(worker)
+        self.assertLess(time.monotonic() - start, 0.1)
+        self.assertTrue(worker.process.terminated)
+
+        self.supervisor.stopping_workers[0].join(5)
+        self.assertTrue(worker.process.killed)
+
+    def test_worker_that_exits_in_time_is_not_killed(self):
+        worker = WorkerProcess({"north"})
+        worker.process = DrainingProcess()
+
+        self.supervisor._stop_worker(worker)
+        worker.process.exited.set()
+        self.supervisor.stopping_workers[0].join(5)
+
+        self.assertFalse(worker.process.killed)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+from lib import transcribe_handler
+from lib.transcribe_handler import TranscriptContextCache, apply_transcript_context, create_transcript_context, \
+    retire_transcribe_dispatchers, submit_to_transcribe
+
+TRANSCRIBE_CONFIG = {"api_url": "http://transcribe.example/transcribe", "max_concurrency": 2}
+
+
+def transcribe_threads():
+    return [thread for thread in threading.enumerate() if thread.name.startswith("transcribe_")]
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class TranscribeDispatcherRegistryTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch("lib.transcribe_handler.upload_to_transcribe",
+                             side_effect=lambda config, path, *args: {"api_key": config.get("api_key"), "path": path})
+        self.upload = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(setattr, transcribe_handler, "_active_transcribe_keys", None)
+        self.addCleanup(setattr, transcribe_handler, "_active_url_concurrency", None)
+        self.addCleanup(transcribe_handler._transcript_contexts.clear)
+        self.addCleanup(transcribe_handler._transcribe_dispatchers.clear)
+        self.addCleanup(retire_transcribe_dispatchers, [])
+
+    def test_configurations_sharing_a_url_share_its_dispatcher(self):
+        first = submit_to_transcribe(dict(TRANSCRIBE_CONFIG, api_key="first"), "a.mp3", {})
+        second = submit_to_transcribe(dict(TRANSCRIBE_CONFIG, api_key="second"), "b.mp3", {})
+
+        self.assertEqual({"api_key": "first", "path": "a.mp3"}, first.result(timeout=5))
+        self.assertEqual({"api_key": "second", "path": "b.mp3"}, second.result(timeout=5))
+        self.assertEqual([TRANSCRIBE_CONFIG["api_url"]], list(transcribe_handler._transcribe_dispatchers))
+        self.assertEqual(2, len(transcribe_handler._transcript_contexts))
+
+    def test_concurrency_is_capped_per_url(self):
+        running = []
+        peak = []
+        release = threading.Event()
+        lock = threading.Lock()
+
+        def upload(config, path, *args):
+            with lock:
+                running.append(path)
+                peak.append(len(running))
+            release.wait(5)
+            with lock:
+                running.remove(path)
+            return {"path": path}
+
+        self.upload.side_effect = upload
+        retire_transcribe_dispatchers([dict(TRANSCRIBE_CONFIG, api_key="first"),
+                                       dict(TRANSCRIBE_CONFIG, api_key="second", max_concurrency=8)])
+        futures = [submit_to_transcribe(dict(TRANSCRIBE_CONFIG, api_key=("first", "second", "old")[index % 3]),
+                                        f"{index}.mp3", {}) for index in range(9)]
+        self.assertTrue(wait_for(lambda: len(running) == 2))
+        time.sleep(0.1)
+        release.set()
+
+        self.assertEqual([f"{index}.mp3" for index in range(9)], [future.result(timeout=5)["path"]
+                                                                   for future in futures])
+        self.assertEqual(2, max(peak))
+
+    def test_unused_url_is_retired_after_its_calls(self):
+        threads_before = len(transcribe_threads())
+        future = submit_to_transcribe(dict(TRANSCRIBE_CONFIG, api_key="old"), "a.mp3", {})
+
+        retire_transcribe_dispatchers([dict(TRANSCRIBE_CONFIG, api_url="http://other.example/transcribe")])
+
+        self.assertEqual("old", future.result(timeout=5)["api_key"])
+        self.assertTrue(wait_for(lambda: len(transcribe_threads()) == threads_before))
+        self.assertEqual({}, transcribe_handler._transcript_contexts)
+
+    def test_call_on_a_replaced_configuration_is_still_sent(self):
+        threads_before = len(transcribe_threads())
+        retire_transcribe_dispatchers([dict(TRANSCRIBE_CONFIG, api_url="http://other.example/transcribe")])
+
+        future = submit_to_transcribe(dict(TRANSCRIBE_CONFIG, api_key="old"), "a.mp3", {})
+
+        self.assertEqual("old", future.result(timeout=5)["api_key"])
+        self.assertTrue(wait_for(lambda: len(transcribe_threads()) == threads_before))
+        self.assertEqual({}, transcribe_handler._transcript_contexts)
+
+
+class TranscriptContextCacheTest(unittest.TestCase):
+    def test_later_call_is_not_replaced_by_an_earlier_one(self):
+        cache = TranscriptContextCache()
+        cache.put(("north", 1001), "engine 1 responding", 1700000010)
+        cache.put(("north", 1001), "dispatch to engine 1", 1700000000)
+
+        self.assertEqual("engine 1 responding", cache.get(("north", 1001)))
+
+    def test_entries_expire_and_least_recently_used_are_evicted(self):
+        cache = TranscriptContextCache(max_entries=2, ttl_seconds=300)
+        with mock.patch("lib.transcribe_handler.time.monotonic", return_value=1000.0):
+            cache.put(("north", 1), "one", 1)
+            cache.put(("north", 2), "two", 2)
+            cache.get(("north", 1))
+            cache.put(("north", 3), "three", 3)
+            self.assertIsNone(cache.get(("north", 2)))
+            self.assertEqual("one", cache.get(("north", 1)))
+        with mock.patch("lib.transcribe_handler.time.monotonic", return_value=1301.0):
+            self.assertIsNone(cache.get(("north", 1)))
+
+    def test_each_configuration_keeps_its_own_context_limits(self):
+        small = create_transcript_context(dict(TRANSCRIBE_CONFIG, context_max_entries=1))
+        large = create_transcript_context(dict(TRANSCRIBE_CONFIG, context_max_entries=50))
+
+        self.assertEqual(1, small.max_entries)
+        self.assertEqual(50, large.max_entries)
+
+    def test_context_is_appended_to_the_initial_prompt(self):
+        cache = TranscriptContextCache()
+        cache.put(("north", 1001), "units responding to the structure fire", 1700000000)
+        whisper_config = {"use_last_as_initial_prompt": True, "initial_prompt": "Fire dispatch."}
+
+        prompted = apply_transcript_context(cache, {"context_max_chars": 20}, {"short_name": "north",
+                                                                               "talkgroup": 1001}, whisper_config)
+
+        self.assertEqual("Fire dispatch. the structure fire", prompted["initial_prompt"])
+        self.assertIs(whisper_config, apply_transcript_context(None, {}, {"short_name": "north", "talkgroup": 1001},
+                                                               whisper_config))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+
+from lib.watcher_handler import WatcherManager
+
+
+class WatcherManagerTest(unittest.TestCase):
+    def test_replacement_waits_for_the_previous_watcher_without_blocking(self):
+        manager = WatcherManager()
+        drained = threading.Event()
+        previous_thread = threading.Thread(target=drained.wait)
+        previous_thread.start()
+        manager.draining_threads["north"] = previous_thread
+
+        start = time.monotonic()
+        with manager.lock:
+            manager._start_watcher("north", SimpleNamespace(name="north", watch_directory="/calls/north"))
+        self.assertLess(time.monotonic() - start, 1)
+
+        watcher = manager.watchers["north"]
+        self.assertTrue(manager.watcher_threads["north"].is_alive())
+        self.assertIsNone(watcher.executor)
+
+        # Stopped before the previous watcher finished, so the replacement never starts anything.
+        stop_thread = threading.Thread(target=manager.stop)
+        stop_thread.start()
+        self.assertTrue(manager.lock.acquire(timeout=1))
+        manager.lock.release()
+        drained.set()
+        stop_thread.join(3)
+
+        self.assertFalse(stop_thread.is_alive())
+        self.assertIsNone(watcher.executor)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import threading
+import unittest
+from unittest import mock
+
+from lib.metrics_handler import Metrics
+from lib.worker_pool_handler import AdaptiveWorkerPool, FixedWorkerPool, WorkerBudget
+
+AUTOSCALE_CONFIG = {"idle_seconds": 30, "target_wait_seconds": 0, "max_load_per_cpu": 0}
+
+
+class WorkerBudgetTest(unittest.TestCase):
+    def test_fixed_pools_reserve_their_threads(self):
+        budget = WorkerBudget(8)
+        fixed_pool = FixedWorkerPool("north", 5, budget)
+        adaptive_pool = AdaptiveWorkerPool("south", 2, 6, AUTOSCALE_CONFIG, budget)
+
+        self.assertEqual(7, budget.active)
+        self.assertTrue(budget.acquire())
+        self.assertFalse(budget.acquire())
+
+        budget.release()
+        fixed_pool.shutdown()
+        adaptive_pool.shutdown()
+        self.assertEqual(0, budget.active)
+
+    def test_fixed_pool_is_clamped_to_the_budget_left(self):
+        budget = WorkerBudget(4)
+        budget.reserve(3)
+
+        pool = FixedWorkerPool("north", 5, budget)
+
+        self.assertEqual(1, pool.reserved)
+        self.assertEqual(4, budget.active)
+        self.assertEqual(4, pool.submit(lambda: 4).result(timeout=5))
+        pool.shutdown()
+        self.assertEqual(3, budget.active)
+
+    def test_every_pool_gets_a_thread_when_the_budget_is_spent(self):
+        budget = WorkerBudget(2)
+        budget.reserve(2)
+
+        pool = AdaptiveWorkerPool("north", 3, 6, AUTOSCALE_CONFIG, budget)
+
+        self.assertEqual(1, len(pool.workers))
+        self.assertEqual(1, pool.min_workers)
+        self.assertEqual(3, budget.active)
+        pool.shutdown()
+        self.assertEqual(2, budget.active)
+
+    def test_autoscaled_pool_only_grows_within_the_budget(self):
+        budget = WorkerBudget(3)
+        pool = AdaptiveWorkerPool("north", 1, 6, AUTOSCALE_CONFIG, budget)
+        release = threading.Event()
+
+        futures = [pool.submit(release.wait, 5) for _ in range(6)]
+
+        self.assertEqual(3, len(pool.workers))
+        self.assertEqual(3, budget.active)
+        release.set()
+        for future in futures:
+            self.assertTrue(future.result(timeout=5))
+        pool.shutdown()
+        self.assertEqual(0, budget.active)
+
+
+
+class AdaptiveScalingTest(unittest.TestCase):
+    def setUp(self):
+        self.metrics = Metrics()
+        patcher = mock.patch("lib.worker_pool_handler.metrics", self.metrics)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_recent_average_follows_a_burst_of_slow_calls(self):
+        for _ in range(500):
+            self.metrics.record_call("north", 0.1, True)
+        for _ in range(10):
+            self.metrics.record_call("north", 10.0, True)
+
+        self.assertLess(self.metrics.call_average("north"), 0.5)
+        self.assertGreater(self.metrics.recent_call_average("north"), 8)
+
+    def test_pool_grows_when_a_worker_finishes_with_a_backlog(self):
+        self.metrics.record_call("north", 0.01, True)
+        pool = AdaptiveWorkerPool("north", 1, 4, {"idle_seconds": 30, "target_wait_seconds": 1,
+                                                  "max_load_per_cpu": 0}, WorkerBudget())
+        first_started = threading.Event()
+        finish_first = threading.Event()
+        release = threading.Event()
+
+        def slow_call():
+            first_started.set()
+            finish_first.wait(5)
+            for _ in range(20):
+                self.metrics.record_call("north", 10.0, True)
+
+        futures = [pool.submit(slow_call)]
+        self.assertTrue(first_started.wait(5))
+        futures.extend(pool.submit(release.wait, 5) for _ in range(3))
+        self.assertEqual(1, len(pool.workers))
+
+        finish_first.set()
+        futures[0].result(timeout=5)
+        release.set()
+        for future in futures[1:]:
+            self.assertTrue(future.result(timeout=5))
+
+        self.assertGreaterEqual(pool.worker_counter, 2)
+        pool.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()